@@ -1,15 +1,16 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import Select
-from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException
 import time
 import pandas as pd
 from typing import Dict, List, Any, Optional, Union
 import json
 import re
+from services.driver_watchdog import driver_watchdog
+from services.driver_factory import driver_factory
+from services.circuit_breaker import CircuitOpenError, DECISION_ENDPOINT, get_breaker, retry_budget
 
 
 class FinancialStatementScraper:
@@ -18,29 +19,26 @@ class FinancialStatementScraper:
         self.setup_driver()
 
     def setup_driver(self):
-        """Setup Chrome driver for financial statement scraping"""
-        chrome_options = Options()
-
-        # Optimizations for financial data scraping
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
-
-        chrome_options.add_experimental_option("useAutomationExtension", False)
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-
+        """Setup Chrome driver for financial statement scraping from the shared factory"""
         try:
-            self.driver = webdriver.Chrome(options=chrome_options)
-            self.driver.implicitly_wait(5)
-            self.driver.set_page_load_timeout(30)
+            self.driver = driver_factory.create_driver(
+                "FinancialStatementScraper",
+                window_size="1920,1080",
+                page_load_timeout=30,
+                implicit_wait=5
+            )
             print("Financial statement scraper initialized")
         except Exception as e:
             print(f"Error initializing driver: {e}")
             raise
 
+    def recycle_driver_if_needed(self):
+        """Restart the browser when the watchdog flags it for memory or navigation count"""
+        if self.driver and driver_watchdog.should_recycle(self.driver):
+            print("Recycling financial scraper driver...")
+            self.close()
+            self.setup_driver()
+
     def make_json_safe(self, obj: Any) -> Any:
         """Ensure all objects are JSON serializable"""
         if obj is None:
@@ -75,17 +73,30 @@ class FinancialStatementScraper:
         start_time = time.time()
 
         try:
-            # Navigate to the URL
-            print(f"Loading URL: {url}")
-            self.driver.get(url)
+            self.recycle_driver_if_needed()
 
-            # Wait for page to fully load
-            time.sleep(5)
+            breaker = get_breaker(DECISION_ENDPOINT)
+            breaker.ensure_closed()
 
-            # Wait for any dynamic content to load
-            WebDriverWait(self.driver, 15).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
+            try:
+                # Navigate to the URL
+                print(f"Loading URL: {url}")
+                driver_factory.navigate(self.driver, url)
+
+                # Wait for page to fully load
+                time.sleep(5)
+
+                # Wait for any dynamic content to load
+                WebDriverWait(self.driver, 15).until(
+                    EC.presence_of_element_located((By.TAG_NAME, "body"))
+                )
+            except BaseException:
+                # Any outcome must resolve the request, or a half-open probe is held until it times out
+                breaker.record_failure()
+                raise
+
+            breaker.record_success()
+            retry_budget.deposit()
 
             # Try to select income statement sheet
             sheet_selected = self.select_income_statement_sheet()
@@ -117,12 +128,14 @@ class FinancialStatementScraper:
 
             result['extraction_time'] = time.time() - start_time
 
+        except CircuitOpenError:
+            raise
         except Exception as e:
             result['error'] = str(e)
             print(f"Error scraping income statement: {e}")
 
-        # Ensure entire result is JSON safe
-        return self.make_json_safe(result)
+        # table_data / formatted_data were made JSON safe above; the other fields are plain str/float
+        return result
 
     def select_income_statement_sheet(self) -> bool:
         """Select the income statement sheet from dropdown with multiple fallback methods"""
@@ -143,7 +156,7 @@ class FinancialStatementScraper:
                         new_url = f"{current_url}{separator}sheetId={sheet_id}"
 
                     print(f"Trying URL with sheetId={sheet_id}: {new_url}")
-                    self.driver.get(new_url)
+                    driver_factory.navigate(self.driver, new_url)
                     time.sleep(4)
 
                     # Check if we can find a table
@@ -687,7 +700,9 @@ class FinancialStatementScraper:
         """Close the browser driver"""
         if self.driver:
             try:
-                self.driver.quit()
+                driver_factory.quit(self.driver)
                 print("Financial scraper driver closed")
             except Exception as e:
-                print(f"Error closing driver: {e}")
\ No newline at end of file
+                print(f"Error closing driver: {e}")
+            finally:
+                self.driver = None
@@ -6,13 +6,22 @@ from auth.auth import get_current_active_user  # Fixed import
 
 import uvicorn
 import logging
+import asyncio
 
 # Import your modules
-from database import engine
+from database import engine, writer_engine, read_engine, async_engine
 from models import Base
 
 from config.settings import get_settings
-from routes import health, financial, scraping, notices, financial_data
+from routes import health, financial, scraping, notices, financial_data, companies
+from services.scheduler_service import scheduler
+from services.driver_watchdog import driver_watchdog
+from services.driver_factory import driver_factory
+from routes.notices import run_notice_backfills
+from services.stats_service import stats_refresher
+from services.partitions import partition_maintainer
+from services.response_cache import response_cache
+from services.metrics_cache import load_metrics_cache, metrics_cache_sync
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -51,12 +60,93 @@ async def root():
         "features": ["scraping", "financial_statements", "postgresql_storage", "detailed_normalization", "authentication"]
     }
 
+@app.on_event("startup")
+async def start_driver_watchdog():
+    driver_watchdog.start()
+    if settings.driver_profile_warmup:
+        # Build the warm profile template in the background; drivers fall back to fresh profiles until then
+        asyncio.get_event_loop().run_in_executor(None, driver_factory.warm_profile_template)
+
+
+@app.on_event("shutdown")
+async def stop_driver_watchdog():
+    await driver_watchdog.stop()
+
+
+@app.on_event("startup")
+async def backfill_notice_categories():
+    # Fill derived columns on notices stored before they existed; a no-op once done
+    asyncio.get_event_loop().run_in_executor(None, run_notice_backfills)
+
+
+@app.on_event("startup")
+async def start_stats_refresher():
+    stats_refresher.start()
+
+
+@app.on_event("shutdown")
+async def stop_stats_refresher():
+    await stats_refresher.stop()
+
+
+@app.on_event("startup")
+async def start_partition_maintainer():
+    partition_maintainer.start()
+
+
+@app.on_event("shutdown")
+async def stop_partition_maintainer():
+    await partition_maintainer.stop()
+
+
+@app.on_event("startup")
+async def start_response_cache():
+    # Subscribes to other workers' invalidations when the shared backend is configured
+    response_cache.start()
+
+
+@app.on_event("shutdown")
+async def stop_response_cache():
+    response_cache.stop()
+
+
+@app.on_event("startup")
+async def warm_metrics_cache():
+    asyncio.get_event_loop().run_in_executor(None, load_metrics_cache)
+    # Frames only see this process's writes directly; pick up other workers' by data version
+    metrics_cache_sync.start()
+
+
+@app.on_event("shutdown")
+async def stop_metrics_cache_sync():
+    await metrics_cache_sync.stop()
+
+
+@app.on_event("startup")
+async def start_scheduler():
+    if settings.scheduler_enabled:
+        scheduler.start()
+
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+
+
+@app.on_event("shutdown")
+async def close_engines():
+    await async_engine.dispose()
+    for pool in {engine, writer_engine, read_engine}:
+        pool.dispose()
+
+
 # Include routers (you can protect these later by adding Depends(get_current_active_user))
 app.include_router(health.router, tags=["Health"])
 app.include_router(financial.router, prefix="/financial-statement", tags=["Financial Statements"])
 app.include_router(financial_data.router, prefix="/financial-data", tags=["Financial data"])
 app.include_router(scraping.router, tags=["Scraping"])
 app.include_router(notices.router, tags=["Notice Management"])
+app.include_router(companies.router, prefix="/companies", tags=["Companies"])
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=3000)
\ No newline at end of file
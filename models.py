@@ -4,6 +4,8 @@ from sqlalchemy.orm import relationship
 from datetime import datetime
 from sqlalchemy.sql import func
 
+from utils.serialization import RowSerializer
+
 Base = declarative_base()
 
 
@@ -21,18 +23,46 @@ class User(Base):
 
 
 
+class Company(Base):
+    """Registry of Codal companies keyed by symbol"""
+    __tablename__ = "companies"
+
+    id = Column(Integer, primary_key=True, index=True)
+    symbol = Column(String(100), unique=True, index=True, nullable=False)
+    codal_company_id = Column(String(50), unique=True, index=True, nullable=True)
+    company_name = Column(String(500))
+    company_type = Column(String(50))
+    isic = Column(String(20), nullable=True)
+    industry = Column(String(200), nullable=True)
+    fiscal_year_end = Column(String(10), nullable=True)  # Jalali "MM/DD", e.g. "12/29"
+    listing_status = Column(String(50), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
 class StockNotice(Base):
     __tablename__ = "stock_notices"
 
     id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey('companies.id'), index=True, nullable=True)
     symbol = Column(String(100), index=True)  # Increased from 50 to 100
     company_name = Column(String(500))  # Increased from 200 to 500
     title = Column(Text)  # Already Text, good
     letter_code = Column(String(100))  # Increased from 20 to 100
     send_time = Column(String(100))  # Increased from 50 to 100
     publish_time = Column(String(100))  # Increased from 50 to 100
+    published_at = Column(DateTime, nullable=True, index=True)  # publish_time converted to Gregorian
+    publish_year = Column(Integer, nullable=False, default=0, server_default="0")  # Year of published_at; partition key
     tracking_number = Column(String(100))  # Increased from 50 to 100
 
+    # Classified from the title at insert time (see utils.text_utils.classify_notice)
+    notice_category = Column(String(50), index=True, nullable=True)
+    is_financial = Column(Boolean, default=False, index=True)
+
+    # SHA-256 of the last extracted statement table (utils.financial_utils.statement_content_hash)
+    statement_hash = Column(String(64), nullable=True)
+
     # Links
     html_link = Column(Text, nullable=True)
     pdf_link = Column(Text, nullable=True)
@@ -60,6 +90,7 @@ class FinancialStatementData(Base):
 
     # Basic information
     notice_id = Column(Integer, ForeignKey('stock_notices.id'), index=True)
+    company_id = Column(Integer, ForeignKey('companies.id'), index=True, nullable=True)
     company_symbol = Column(String(100), index=True)
     company_name = Column(String(500))
     raw_title = Column(Text)
@@ -71,6 +102,12 @@ class FinancialStatementData(Base):
     period_type = Column(String(50))  # "3 ماهه", "6 ماهه", "9 ماهه", "سال مالی"
     audit_status = Column(String(50))  # "حسابرسی شده", "حسابرسی نشده"
     period_date = Column(String(100))  # Date from title
+    period_year = Column(Integer, nullable=False, default=0, server_default="0")  # Jalali year of period_date; partition key
+
+    # Amendment resolution, maintained at write time (see services.statement_versions)
+    period_key = Column(String(150), nullable=True)  # period_type|statement date from the title
+    is_current = Column(Boolean, default=True)  # False once an amendment or newer version replaces the notice
+    superseded_by = Column(Integer, nullable=True)  # id of the row that replaced this one
 
     # Financial items as separate columns (amounts) - SHORTENED NAMES
     operating_revenue = Column(Numeric(20, 2), nullable=True)  # درآمدهاي عملياتي
@@ -101,35 +138,6 @@ class FinancialStatementData(Base):
     diluted_eps = Column(Numeric(20, 2), nullable=True)  # سود (زيان) خالص هر سهم – ريال
     capital = Column(Numeric(20, 2), nullable=True)  # سرمايه
 
-    # Financial items as formatted text columns - SHORTENED NAMES
-    operating_revenue_fmt = Column(String(100))
-    cost_of_goods_sold_fmt = Column(String(100))
-    gross_profit_fmt = Column(String(100))
-    selling_admin_expenses_fmt = Column(String(100))
-    impairment_expense_fmt = Column(String(100))
-    other_income_fmt = Column(String(100))
-    other_expenses_fmt = Column(String(100))
-    operating_profit_fmt = Column(String(100))
-    financial_expenses_fmt = Column(String(100))
-
-    investment_income_fmt = Column(String(100))
-    miscellaneous_income_fmt = Column(String(100))
-
-    non_operating_income_fmt = Column(String(100))
-    profit_before_tax_fmt = Column(String(100))
-    current_year_tax_fmt = Column(String(100))
-    prior_years_tax_fmt = Column(String(100))
-    net_profit_continuing_fmt = Column(String(100))
-    net_profit_discontinued_fmt = Column(String(100))
-    net_profit_fmt = Column(String(100))
-    operational_eps_fmt = Column(String(100))
-    non_operational_eps_fmt = Column(String(100))
-    eps_continuing_fmt = Column(String(100))
-    eps_discontinued_fmt = Column(String(100))
-    basic_eps_fmt = Column(String(100))
-    diluted_eps_fmt = Column(String(100))
-    capital_fmt = Column(String(100))
-
     # Metadata
     extraction_date = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -139,8 +147,62 @@ class FinancialStatementData(Base):
         Index('idx_notice_period', 'notice_id', 'period_name'),
         Index('idx_company_period', 'company_symbol', 'period_name'),
         Index('idx_period_order', 'notice_id', 'period_order'),
+        Index('idx_company_period_key', 'company_symbol', 'period_key'),
     )
 
     def to_dict(self):
-        """Convert model instance to dictionary"""
-        return {column.name: getattr(self, column.name) for column in self.__table__.columns}
\ No newline at end of file
+        """Convert model instance to dictionary (amounts as floats)"""
+        return FINANCIAL_ROW_SERIALIZER.to_dict(self)
+
+
+FINANCIAL_ROW_SERIALIZER = RowSerializer(FinancialStatementData.__table__.columns)
+
+
+class FinancialStatementItem(Base):
+    """Narrow table: one row per statement line per period, including lines the wide table has no column for"""
+    __tablename__ = "financial_statement_items"
+
+    id = Column(Integer, primary_key=True)
+    notice_id = Column(Integer, ForeignKey('stock_notices.id'), nullable=False)
+    company_symbol = Column(String(100))
+    period_order = Column(Integer, nullable=False)  # matches FinancialStatementData.period_order
+    item_order = Column(Integer)  # line position in the statement
+    item_key = Column(String(300), nullable=False)  # mapped wide column, else the normalised line name
+    item_name = Column(String(300))  # normalised Persian line name
+    amount = Column(Numeric(20, 2))
+
+    __table_args__ = (
+        Index('idx_items_notice_period', 'notice_id', 'period_order'),
+        Index('idx_items_key_symbol', 'item_key', 'company_symbol', 'notice_id', 'period_order',
+              postgresql_include=['amount']),
+    )
+
+
+class SymbolStats(Base):
+    """Per-symbol counters kept current by the insert paths (see services.stats_service)"""
+    __tablename__ = "symbol_stats"
+
+    symbol = Column(String(100), primary_key=True)
+    company_id = Column(Integer, ForeignKey('companies.id'), nullable=True)
+    total_notices = Column(Integer, default=0)
+    financial_notices = Column(Integer, default=0)
+    eligible_notices = Column(Integer, default=0)  # extractable and have an html link
+    processed_notices = Column(Integer, default=0)  # eligible notices with stored statement data
+    statement_records = Column(Integer, default=0)
+    last_notice_id = Column(Integer, nullable=True)
+    last_publish_time = Column(String(100), nullable=True)
+
+    # Bumped only when a write path changes the symbol's data (not by the periodic refresh); HTTP validators
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
+    data_changed_at = Column(DateTime(timezone=True), nullable=True)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class StatsSnapshot(Base):
+    """Precomputed JSON payloads for dashboard statistics endpoints"""
+    __tablename__ = "stats_snapshots"
+
+    name = Column(String(50), primary_key=True)
+    payload = Column(JSON, nullable=False)
+    refreshed_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,36 @@
+# partition_tables.py
+# One-time conversion of stock_notices / financial_statement_data into yearly range partitions.
+# Stop the API first: the copy holds an exclusive lock on each table.
+import sys
+
+from database import SessionLocal
+from services.partitions import PARTITION_KEYS, backfill_partition_keys, convert_to_partitioned
+
+
+def partition_tables(tables):
+    db = SessionLocal()
+
+    try:
+        # Partition keys must be filled first, or every row lands in the default partition
+        print(f"🗂️ Partition keys: {backfill_partition_keys(db)}")
+
+        for table in tables:
+            result = convert_to_partitioned(db, table)
+            if result["converted"]:
+                print(f"✅ {table}: {result['rows']} rows in {len(result['partitions'])} yearly partitions")
+                for foreign_key in result["dropped_foreign_keys"]:
+                    print(f"⚠️  Dropped foreign key {foreign_key}")
+                for index in result["skipped_unique_indexes"]:
+                    print(f"⚠️  Skipped unique index {index} (must include the partition key)")
+            else:
+                print(f"✅ {table} is already partitioned")
+
+    except Exception as e:
+        print(f"❌ Error partitioning tables: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    partition_tables(sys.argv[1:] or list(PARTITION_KEYS))
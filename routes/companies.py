@@ -0,0 +1,74 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.orm import Session
+from typing import Optional
+from database import get_read_db, get_db_session
+from models import Company
+from services.company_registry import sync_companies
+from utils.http_cache import conditional_response, make_etag
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def sync_companies_task():
+    """Background task wrapper for the registry crawler"""
+    try:
+        with get_db_session() as db:
+            sync_companies(db)
+    except Exception as e:
+        logger.error(f"❌ Company registry sync failed: {e}")
+
+
+@router.post("/sync")
+async def sync_company_registry(background_tasks: BackgroundTasks):
+    """Crawl Codal's company list and upsert it into the registry"""
+    background_tasks.add_task(sync_companies_task)
+    return {"message": "Company registry sync started in background"}
+
+
+@router.get("")
+def list_companies(
+        listing_status: Optional[str] = Query(None, description="Filter by listing status"),
+        isic: Optional[str] = Query(None, description="Filter by ISIC / industry group"),
+        limit: int = Query(100, ge=1, le=1000),
+        offset: int = Query(0, ge=0),
+        db: Session = Depends(get_read_db)
+):
+    """List registered companies"""
+    query = db.query(Company)
+    if listing_status:
+        query = query.filter(Company.listing_status == listing_status)
+    if isic:
+        query = query.filter(Company.isic == isic)
+
+    companies = query.order_by(Company.symbol).offset(offset).limit(limit).all()
+    return {"companies": [company_to_dict(c) for c in companies]}
+
+
+@router.get("/{symbol}")
+def get_company(request: Request, response: Response, symbol: str, db: Session = Depends(get_read_db)):
+    """Get a company's registry entry by exact symbol"""
+    company = db.query(Company).filter(Company.symbol == symbol).first()
+    if not company:
+        raise HTTPException(status_code=404, detail=f"Company not found: {symbol}")
+
+    last_modified = company.updated_at or company.created_at
+    not_modified = conditional_response(request, response, make_etag("company", company.id, last_modified), last_modified)
+    if not_modified is not None:
+        return not_modified
+    return company_to_dict(company)
+
+
+def company_to_dict(company: Company) -> dict:
+    return {
+        "id": company.id,
+        "symbol": company.symbol,
+        "codal_company_id": company.codal_company_id,
+        "company_name": company.company_name,
+        "isic": company.isic,
+        "industry": company.industry,
+        "fiscal_year_end": company.fiscal_year_end,
+        "listing_status": company.listing_status
+    }
@@ -1,22 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, Query,  BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query,  BackgroundTasks, Request, Response
 from sqlalchemy import desc, asc, or_
 from typing import List, Optional, Dict, Any
-from sqlalchemy import and_, or_, desc, func
+from sqlalchemy import and_, or_, desc, func, tuple_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from sqlalchemy.orm import Session
 from typing import Optional
-from database import get_db
+from functools import partial
+import numpy as np
+from database import get_db, get_read_db, get_async_db
 from models import StockNotice, FinancialStatementData
 from schemas.financial import FinancialStatementSearchRequest, BatchExtractRequest
 from services.financial_service import FinancialStatementService
-from utils.financial_utils import extract_period_info, FINANCIAL_PATTERNS
-from utils.text_utils import extract_period_type, extract_date_from_title,extract_metric_value, filter_amendments, get_all_direct_metrics
+from utils.financial_utils import extract_period_info
+from utils.text_utils import extract_period_type, extract_date_from_title,extract_metric_value, get_all_direct_metrics, metric_dependencies
 from financial_statement_scraper import FinancialStatementScraper
+from services.company_registry import company_condition_async
+from services.stats_service import read_snapshot_async, NOTICES_SNAPSHOT, FINANCIAL_SUMMARY_SNAPSHOT
+from models import SymbolStats
+from services.metrics_cache import metrics_cache
+from services.response_cache import ALL_SYMBOLS, cache_key, response_cache
+from services.screener import screen
+from services.statement_items import item_catalog_statement, pivot_statement, pivot_row_to_dict, PERIOD_COLUMNS
+from utils.number_format import add_display_values
+from utils.http_cache import conditional_response, make_etag
+from utils.serialization import ORJSONResponse, fast_json
+from services.timeseries import PeriodSeries, is_transform, format_transform
+from utils.metric_formulas import MetricFormula, METRIC_REGISTRY, lookup_formula, parse_formula_definitions
+from utils.pagination import encode_cursor, decode_cursor, estimated_count_async
 from concurrent.futures import ThreadPoolExecutor
-from utils.financial_utils import (
-    get_financial_summary_stats,
-    search_stored_financial_statements
-)
+from utils.financial_utils import search_stored_financial_statements_async
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,7 +37,7 @@ logger = logging.getLogger(__name__)
 
 
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 # Initialize services
 content_executor = ThreadPoolExecutor(max_workers=3)
@@ -53,22 +66,28 @@ async def get_stored_financial_statements(
         period_type: Optional[str] = Query(None, description="Period type"),
         audit_status: Optional[str] = Query(None, description="Audit status"),
         limit: int = Query(50, description="Maximum number of results"),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Get stored financial statement data from PostgreSQL"""
-    stored_statements = search_stored_financial_statements(
+    # symbol may be a company name, so these entries are dropped by a write to any symbol
+    key = cache_key("stored", symbol=symbol, period_type=period_type, audit_status=audit_status, limit=limit)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return fast_json(cached)
+
+    stored_statements = await search_stored_financial_statements_async(
         symbol, period_type, audit_status, limit, db
     )
 
-    return {
+    return fast_json(response_cache.set(key, {
         "total": len(stored_statements),
         "stored_statements": stored_statements
-    }
+    }, [ALL_SYMBOLS]))
 
 @router.get("/stats")
-async def get_financial_stats(db: Session = Depends(get_db)):
+async def get_financial_stats(db: AsyncSession = Depends(get_async_db)):
     """Get financial data statistics"""
-    return get_financial_summary_stats(db)
+    return await read_snapshot_async(db, FINANCIAL_SUMMARY_SNAPSHOT)
 
 # @router.get("/search")
 # async def search_financial_notices(
@@ -152,25 +171,36 @@ async def get_financial_stats(db: Session = Depends(get_db)):
 @router.get("/search")
 async def search_financial_notices(
         symbol: str = Query(..., description="Company symbol"),
-        page: int = Query(1, ge=1),
+        page: int = Query(1, ge=1, description="Offset paging, only used when sorting by a field other than published_time"),
         per_page: int = Query(50, ge=1, le=100),
         sort_field: Optional[str] = Query("published_time"),
         sort_direction: Optional[str] = Query("desc"),
-        db: Session = Depends(get_db)
+        cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+        count: str = Query("estimate", pattern="^(estimate|exact|none)$", description="How to compute total"),
+        year_from: Optional[int] = Query(None, description="First publish year (Gregorian); limits the yearly partitions read"),
+        year_to: Optional[int] = Query(None, description="Last publish year (Gregorian)"),
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Search financial notices by symbol"""
     try:
         # Build base query
-        query = db.query(StockNotice).filter(
-            StockNotice.symbol.ilike(f"%{symbol}%")
+        query = select(StockNotice).where(
+            await company_condition_async(db, symbol, StockNotice.company_id, StockNotice.symbol)
         )
 
         # Filter for financial notices
-        financial_conditions = [
-            StockNotice.title.ilike(f"%{pattern}%")
-            for pattern in FINANCIAL_PATTERNS
-        ]
-        query = query.filter(or_(*financial_conditions))
+        query = query.where(StockNotice.is_financial.is_(True))
+        if year_from is not None:
+            query = query.where(StockNotice.publish_year >= year_from)
+        if year_to is not None:
+            query = query.where(StockNotice.publish_year <= year_to)
+
+        # Total before ordering/paging: planner estimate by default, exact on request
+        total = None
+        if count == "exact":
+            total = await db.scalar(select(func.count()).select_from(query.subquery()))
+        elif count == "estimate":
+            total = await estimated_count_async(db, query)
 
         # Map frontend field names to backend column names
         field_mapping = {
@@ -180,47 +210,60 @@ async def search_financial_notices(
             'title': 'title',
             'notice_type': 'title',  # This is derived from title
             'date_in_title': 'title',  # This is derived from title
-            'published_time': 'publish_time'  # Map to actual column name
+            'published_time': 'published_at'  # Gregorian timestamp derived from publish_time
         }
 
-        # Apply sorting
-        if sort_field and sort_field in field_mapping:
-            # Get the actual database column name
-            db_field = field_mapping[sort_field]
+        descending = sort_direction != "asc"
+        keyset = not sort_field or sort_field not in field_mapping or sort_field == 'published_time'
+        next_cursor = None
+
+        if keyset:
+            # Keyset pagination on (published_at, id); rows without a parsed time sort last
+            after = decode_cursor(cursor, 2)
+            if after:
+                try:
+                    after_published = datetime.fromisoformat(after[0]) if after[0] else None
+                except (TypeError, ValueError):
+                    raise HTTPException(status_code=400, detail="Invalid cursor")
+                if after_published is None:
+                    position = StockNotice.id < after[1] if descending else StockNotice.id > after[1]
+                    query = query.where(StockNotice.published_at.is_(None), position)
+                else:
+                    key = tuple_(StockNotice.published_at, StockNotice.id)
+                    position = key < tuple_(after_published, after[1]) if descending \
+                        else key > tuple_(after_published, after[1])
+                    # Implied by the key, but lets the planner skip yearly partitions already paged past
+                    year = StockNotice.publish_year <= after_published.year if descending \
+                        else or_(StockNotice.publish_year >= after_published.year, StockNotice.publish_year == 0)
+                    query = query.where(or_(position, StockNotice.published_at.is_(None)), year)
+
+            if descending:
+                query = query.order_by(StockNotice.published_at.desc().nullslast(), desc(StockNotice.id))
+            else:
+                query = query.order_by(StockNotice.published_at.asc().nullslast(), asc(StockNotice.id))
 
+            notices = (await db.scalars(query.limit(per_page + 1))).all()
+            if len(notices) > per_page:
+                notices = notices[:per_page]
+                last = notices[-1]
+                next_cursor = encode_cursor(last.published_at.isoformat() if last.published_at else None, last.id)
+        else:
             # Special handling for derived fields
             if sort_field in ['notice_type', 'date_in_title']:
                 # For derived fields, sort by title
                 sort_column = StockNotice.title
             else:
-                sort_column = getattr(StockNotice, db_field)
-
-            if sort_direction == "desc":
-                query = query.order_by(desc(sort_column))
-            else:
-                query = query.order_by(asc(sort_column))
-        else:
-            # Default sorting
-            query = query.order_by(desc(StockNotice.publish_time))
+                sort_column = getattr(StockNotice, field_mapping[sort_field])
 
-        # Get total count
-        total = query.count()
+            query = query.order_by(desc(sort_column) if descending else asc(sort_column), desc(StockNotice.id))
 
-        # Apply pagination
-        offset = (page - 1) * per_page
-        notices = query.offset(offset).limit(per_page).all()
+            # Apply pagination
+            offset = (page - 1) * per_page
+            notices = (await db.scalars(query.offset(offset).limit(per_page))).all()
 
         # Format results
         formatted_notices = []
         for notice in notices:
-            # Handle published_time properly
-            published_time_str = ""
-            if notice.publish_time:
-                if hasattr(notice.publish_time, 'isoformat'):
-                    published_time_str = notice.publish_time.isoformat()
-                else:
-                    published_time_str = str(notice.publish_time)
-
             formatted_notices.append({
                 "notice_id": notice.id,
                 "symbol": notice.symbol or "",
@@ -228,56 +271,51 @@ async def search_financial_notices(
                 "title": notice.title or "",
                 "notice_type": extract_period_type(notice.title),
                 "date_in_title": extract_date_from_title(notice.title),
-                "published_time": published_time_str
+                "published_time": str(notice.publish_time or ""),
+                "published_at": notice.published_at.isoformat() if notice.published_at else None
             })
 
         return {
             "notices": formatted_notices,
             "total": total,
-            "page": page,
+            "total_is_estimate": count == "estimate",
+            "next_cursor": next_cursor,
+            "page": None if keyset else page,
             "per_page": per_page,
-            "total_pages": (total + per_page - 1) // per_page,
+            "total_pages": (total + per_page - 1) // per_page if total is not None else None,
             "sort_field": sort_field,
             "sort_direction": sort_direction
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Search error: {str(e)}")
         import traceback
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+
 @router.post("/search")
 async def search_financial_statements(
         request: FinancialStatementSearchRequest,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Search for financial statements (both types)"""
     try:
-        from sqlalchemy import or_
-
-        query = db.query(StockNotice)
-
         # Filter for both types of financial statements
-        title_condition = or_(
-            StockNotice.title.ilike('%اطلاعات و صورت های مالی%'),
-            StockNotice.title.ilike('%اطلاعات و صورتهای مالی%'),
-            StockNotice.title.ilike('%صورت های سال مالی%'),
-            StockNotice.title.ilike('%صورتهای سال مالی%')
-        )
-        query = query.filter(title_condition)
+        query = select(StockNotice).where(StockNotice.is_financial.is_(True))
 
         # Add symbol filter
         if request.symbol and request.symbol.strip():
             symbol = request.symbol.strip()
-            query = query.filter(
-                (StockNotice.symbol.ilike(f'%{symbol}%')) |
-                (StockNotice.company_name.ilike(f'%{symbol}%'))
-            )
+            query = query.where(await company_condition_async(
+                db, symbol, StockNotice.company_id, StockNotice.symbol, StockNotice.company_name
+            ))
 
         # Order and limit
         query = query.order_by(StockNotice.publish_time.desc())
         limit = request.limit if request.limit and request.limit > 0 else 10
-        notices = query.limit(limit).all()
+        notices = (await db.scalars(query.limit(limit))).all()
 
         # Format response with period info
         financial_statements = []
@@ -319,6 +357,10 @@ async def batch_extract_financial_statements(
 @router.get("/available-metrics")
 async def get_available_metrics():
     """Get list of available metrics for comparison"""
+    key = cache_key("available-metrics")
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
 
     # Get ALL financial columns dynamically
     direct_metrics = get_all_direct_metrics()
@@ -339,51 +381,17 @@ async def get_available_metrics():
         # ...
     ]
 
-    # Calculated metrics with descriptions
-    calculated_metrics = [
-        {
-            "key": "revenue_plus_cogs",
-            "name": "درآمد + بهای تمام شده",
-            "formula": "operating_revenue + cost_of_goods_sold",
-            "description": "مجموع درآمد عملیاتی و بهای تمام شده کالای فروخته شده"
-        },
-        {
-            "key": "total_expenses",
-            "name": "کل هزینه‌های عملیاتی",
-            "formula": "cost_of_goods_sold + selling_admin_expenses",
-            "description": "مجموع بهای تمام شده و هزینه‌های فروش و اداری"
-        },
-        {
-            "key": "total_other_income",
-            "name": "کل سایر درآمدها",
-            "formula": "other_income + non_operating_income",
-            "description": "مجموع سایر درآمدها و درآمدهای غیرعملیاتی"
-        },
-        {
-            "key": "net_operating_result",
-            "name": "نتیجه عملیاتی خالص",
-            "formula": "operating_profit - financial_expenses",
-            "description": "سود عملیاتی منهای هزینه‌های مالی"
-        },
-        {
-            "key": "gross_profit_margin",
-            "name": "حاشیه سود ناخالص (درصد)",
-            "formula": "(gross_profit / operating_revenue) * 100",
-            "description": "درصد حاشیه سود ناخالص نسبت به درآمد"
-        },
-        {
-            "key": "net_profit_margin",
-            "name": "حاشیه سود خالص (درصد)",
-            "formula": "(net_profit / operating_revenue) * 100",
-            "description": "درصد حاشیه سود خالص نسبت به درآمد"
-        }
-    ]
+    # Calculated metrics with descriptions, straight from the registry the endpoints evaluate
+    calculated_metrics = [formula.to_dict() for formula in METRIC_REGISTRY.values()]
 
-    return {
+    # Built from code, not data: no symbol tags, only the TTL
+    return response_cache.set(key, {
         "all_direct_metrics": direct_metrics,  # All available columns
         "featured_direct_metrics": featured_direct_metrics,  # Curated list
-        "calculated_metrics": calculated_metrics
-    }
+        "calculated_metrics": calculated_metrics,
+        "custom_formulas": "Pass formula=name=expression (columns, numbers, + - * /, parentheses) to /compare, /screen or /financial-data",
+        "time_series_suffixes": ["_yoy", "_qoq", "_ttm", "_cagrN"]
+    })
 
 
 @router.post("/bulk-extract-all")
@@ -421,52 +429,24 @@ async def bulk_extract_all_financial_statements(
         logger.error(f"Error starting bulk extraction: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to start bulk extraction: {str(e)}")
 @router.get("/bulk-extract-status")
-async def get_bulk_extract_status(db: Session = Depends(get_db)):
+async def get_bulk_extract_status(db: AsyncSession = Depends(get_async_db)):
     """Get status of bulk extraction process and database statistics"""
 
-    from sqlalchemy import func, distinct, or_
-
-    # Financial statement keywords
-    financial_conditions = or_(
-        StockNotice.title.ilike('%اطلاعات و صورت های مالی%'),
-        StockNotice.title.ilike('%اطلاعات و صورتهای مالی%'),
-        StockNotice.title.ilike('%صورت های سال مالی%'),
-        StockNotice.title.ilike('%صورتهای سال مالی%'),
-        StockNotice.title.ilike('%صورت سود و زیان%'),
-        StockNotice.title.ilike('%ترازنامه%'),
-        StockNotice.title.ilike('%صورت جریان وجوه نقد%')
-    )
+    # Read from the maintained statistics tables instead of joining both tables per request
+    snapshot = await read_snapshot_async(db, NOTICES_SNAPSHOT)
+    total_eligible = snapshot["eligible_notices"]
+    unique_processed = snapshot["processed_notices"]
 
-    # Count total eligible notices
-    total_eligible = db.query(StockNotice).filter(
-        financial_conditions,
-        StockNotice.html_link.isnot(None)
-    ).count()
-
-    # Count how many already have financial data
-    processed_count = db.query(FinancialStatementData).count()
-
-    # Count unique notices with financial data
-    unique_processed = db.query(
-        func.count(distinct(FinancialStatementData.notice_id))
-    ).scalar()
-
-    # Get symbol breakdown
-    symbol_stats = db.query(
-        StockNotice.symbol,
-        func.count(StockNotice.id).label('total_notices'),
-        func.count(FinancialStatementData.notice_id).label('processed_notices')
-    ).outerjoin(
-        FinancialStatementData, StockNotice.id == FinancialStatementData.notice_id
-    ).filter(
-        financial_conditions,
-        StockNotice.html_link.isnot(None)
-    ).group_by(StockNotice.symbol).all()
+    symbol_stats = (await db.scalars(
+        select(SymbolStats).where(
+            SymbolStats.eligible_notices > 0
+        ).order_by(desc(SymbolStats.eligible_notices)).limit(20)
+    )).all()
 
     return {
         "database_status": {
             "total_eligible_notices": total_eligible,
-            "total_processed_records": processed_count,
+            "total_processed_records": snapshot["statement_records"],
             "unique_notices_processed": unique_processed,
             "remaining_notices": max(0, total_eligible - unique_processed),
             "completion_percentage": round((unique_processed / total_eligible * 100), 2) if total_eligible > 0 else 0
@@ -474,13 +454,14 @@ async def get_bulk_extract_status(db: Session = Depends(get_db)):
         "symbol_breakdown": [
             {
                 "symbol": stat.symbol,
-                "total_notices": stat.total_notices,
+                "total_notices": stat.eligible_notices,
                 "processed_notices": stat.processed_notices or 0,
-                "completion_rate": round(((stat.processed_notices or 0) / stat.total_notices * 100), 1)
+                "completion_rate": round(((stat.processed_notices or 0) / stat.eligible_notices * 100), 1)
             }
-            for stat in symbol_stats[:20]  # Top 20 symbols
+            for stat in symbol_stats  # Top 20 symbols
         ],
-        "last_updated": func.now()
+        "last_run": financial_service.last_bulk_run,
+        "last_updated": snapshot["refreshed_at"]
     }
 
 
@@ -492,56 +473,69 @@ async def compare_financial_statements(
         start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
         end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
         limit: int = Query(10, description="Number of periods to return"),
-        db: Session = Depends(get_db)
+        formula: List[str] = Query([], description="Ad-hoc metrics as name=expression, e.g. 'cogs_ratio=cost_of_goods_sold / operating_revenue'"),
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Compare financial statements across multiple symbols with flexible metrics"""
     try:
         symbol_list = [s.strip() for s in symbols.split(',')]
         metric_list = [m.strip() for m in metrics.split(',')]
+        user_formulas = _parse_formulas(formula)
+        transform_list = [m for m in metric_list if is_transform(m)]
+        if transform_list and not metrics_cache.loaded:
+            raise HTTPException(status_code=503, detail="Growth and TTM metrics need the metrics cache, which is still loading",
+                                headers={"Retry-After": "30"})
+
+        rows_by_symbol = {}
+        derived_values = {}
+        if metrics_cache.loaded:
+            # Answer from the in-memory columnar cache
+            start_iso = end_iso = None
+            try:
+                start_iso = datetime.strptime(start_date, "%Y-%m-%d").date().isoformat() if start_date else None
+                end_iso = datetime.strptime(end_date, "%Y-%m-%d").date().isoformat() if end_date else None
+            except ValueError:
+                pass
+            selected_by_symbol = {}
+            for symbol in symbol_list:
+                frame = metrics_cache.lookup(symbol)
+                if frame is not None:
+                    selected = frame.select_latest_periods(period_type, limit, start_iso, end_iso)
+                    selected_by_symbol[symbol] = (frame, selected)
+                    rows_by_symbol[symbol] = [frame.record(row) for row in selected]
+
+            # Calculated metrics evaluate on whole columns of the selected rows
+            for symbol, (frame, selected) in selected_by_symbol.items():
+                derived_values[symbol] = {}
+                for metric in metric_list:
+                    metric_formula = lookup_formula(metric, user_formulas)
+                    if metric_formula is not None:
+                        values = metric_formula.evaluate(lambda column: frame.column(selected, column))
+                        derived_values[symbol][metric] = (values, metric_formula.format)
+
+            if transform_list:
+                # YoY/QoQ/TTM/CAGR read earlier periods of every statement type, not just the selected rows
+                series = PeriodSeries([frame for frame, _ in selected_by_symbol.values()])
+                for symbol, (frame, selected) in selected_by_symbol.items():
+                    for metric in transform_list:
+                        values = series.values_for(frame, selected, metric)
+                        derived_values[symbol][metric] = (values, partial(format_transform, metric))
+        else:
+            rows = (await db.execute(
+                comparison_statement(symbol_list, period_type, metric_list, start_date, end_date, limit, user_formulas)
+            )).all()
+            for row in rows:
+                rows_by_symbol.setdefault(row.company_symbol, []).append(row)
 
         comparison_data = {}
 
         for symbol in symbol_list:
-            # Build query filters
-            query_filters = [
-                FinancialStatementData.company_symbol == symbol,
-                FinancialStatementData.period_type.ilike(f"%{period_type}%"),
-                FinancialStatementData.period_order == 0,
-                FinancialStatementData.audit_status.ilike("%حسابرسی شده%")
-            ]
-
-            # Add date filters if provided
-            if start_date:
-                try:
-                    start_dt = datetime.strptime(start_date, "%Y-%m-%d").date()
-                    query_filters.append(FinancialStatementData.period_date >= start_dt)
-                except ValueError:
-                    pass
-
-            if end_date:
-                try:
-                    end_dt = datetime.strptime(end_date, "%Y-%m-%d").date()
-                    query_filters.append(FinancialStatementData.period_date <= end_dt)
-                except ValueError:
-                    pass
-
-            # Get financial data
-            financial_records = db.query(FinancialStatementData).filter(
-                and_(*query_filters)
-            ).order_by(
-                desc(FinancialStatementData.period_date)
-            ).limit(limit * 2).all()  # Get more records to account for filtering
-
-            if financial_records:
-                # 🔧 NEW: Apply amendment filter
-                filtered_records = filter_amendments(financial_records)
-
-                # Apply final limit after filtering
-                filtered_records = filtered_records[:limit]
+            symbol_rows = rows_by_symbol.get(symbol)
 
+            if symbol_rows:
                 # Process metrics for this symbol
                 symbol_data = {
-                    'company_name': filtered_records[0].company_name if filtered_records else None,
+                    'company_name': symbol_rows[0].company_name,
                     'symbol': symbol,
                     'periods': [],
                     'metrics': {}
@@ -556,16 +550,8 @@ async def compare_financial_statements(
                     }
 
                 # Process each financial record
-                for record in filtered_records:
-                    # Handle period_date safely
-                    period_date_str = None
-                    if record.period_date:
-                        if isinstance(record.period_date, str):
-                            period_date_str = record.period_date
-                        elif hasattr(record.period_date, 'isoformat'):
-                            period_date_str = record.period_date.isoformat()
-                        else:
-                            period_date_str = str(record.period_date)
+                for position, record in enumerate(symbol_rows):
+                    period_date_str = str(record.period_date) if record.period_date else None
 
                     period_info = {
                         'period_date': period_date_str,
@@ -578,7 +564,12 @@ async def compare_financial_statements(
 
                     # Extract metric values
                     for metric in metric_list:
-                        value, formatted_value = extract_metric_value(record, metric)
+                        if metric in derived_values.get(symbol, {}):
+                            values, formatter = derived_values[symbol][metric]
+                            value = None if np.isnan(values[position]) else float(values[position])
+                            formatted_value = formatter(value)
+                        else:
+                            value, formatted_value = extract_metric_value(record, metric, user_formulas)
 
                         symbol_data['metrics'][metric]['values'].append(value)
                         symbol_data['metrics'][metric]['formatted_values'].append(formatted_value)
@@ -606,19 +597,165 @@ async def compare_financial_statements(
             }
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in financial comparison: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Comparison failed: {str(e)}")
 
 
+def comparison_statement(
+        symbol_list: List[str],
+        period_type: str,
+        metric_list: List[str],
+        start_date: Optional[str],
+        end_date: Optional[str],
+        limit: int,
+        formulas: Optional[Dict[str, MetricFormula]] = None
+):
+    """One statement returning the latest `limit` periods per symbol, amendments preferred, requested metrics only"""
+    table_columns = FinancialStatementData.__table__.columns
+    metric_columns = set()
+    for metric in metric_list:
+        metric_columns |= metric_dependencies(metric, formulas)
+    projected = [table_columns[name] for name in sorted(metric_columns) if name in table_columns]
+
+    # Build query filters
+    query_filters = [
+        FinancialStatementData.company_symbol.in_(symbol_list),
+        FinancialStatementData.period_type.ilike(f"%{period_type}%"),
+        FinancialStatementData.period_order == 0,
+        FinancialStatementData.audit_status.ilike("%حسابرسی شده%")
+    ]
+
+    # Add date filters if provided
+    if start_date:
+        try:
+            start_dt = datetime.strptime(start_date, "%Y-%m-%d").date()
+            query_filters.append(FinancialStatementData.period_date >= start_dt.isoformat())
+            # Year bound on the partition key (0 = year not parsed) so older yearly partitions are skipped
+            query_filters.append(or_(FinancialStatementData.period_year >= start_dt.year,
+                                     FinancialStatementData.period_year == 0))
+        except ValueError:
+            pass
+
+    if end_date:
+        try:
+            end_dt = datetime.strptime(end_date, "%Y-%m-%d").date()
+            query_filters.append(FinancialStatementData.period_date <= end_dt.isoformat())
+            query_filters.append(FinancialStatementData.period_year <= end_dt.year)
+        except ValueError:
+            pass
+
+    # Amendments were resolved at write time: one current row per (symbol, statement, period column)
+    query_filters.append(FinancialStatementData.is_current.is_(True))
+
+    # Latest `limit` periods per symbol
+    latest = select(
+        FinancialStatementData.company_symbol,
+        FinancialStatementData.company_name,
+        FinancialStatementData.period_date,
+        FinancialStatementData.period_name,
+        FinancialStatementData.period_type,
+        FinancialStatementData.audit_status,
+        *projected,
+        func.row_number().over(
+            partition_by=FinancialStatementData.company_symbol,
+            order_by=FinancialStatementData.period_date.desc().nullslast()
+        ).label("recency")
+    ).where(and_(*query_filters)).subquery()
+
+    return select(latest).where(latest.c.recency <= limit).order_by(latest.c.company_symbol, latest.c.recency)
+
+
+@router.get("/screen")
+def screen_financial_statements(
+        where: List[str] = Query([], description="Predicates such as 'net_income>0' or 'total_revenue_growth>=20'"),
+        period_type: str = Query("سال مالی", description="Period type (e.g., 'سال مالی', 'سه ماهه')"),
+        audited: bool = Query(True, description="Only audited statements"),
+        metrics: Optional[str] = Query(None, description="Comma-separated extra metrics to return"),
+        sort_by: Optional[str] = Query(None, description="Metric to rank by (defaults to the first predicate)"),
+        sort_order: str = Query("desc", pattern="^(asc|desc)$"),
+        page: int = Query(1, ge=1),
+        per_page: int = Query(50, ge=1, le=500),
+        formula: List[str] = Query([], description="Ad-hoc metrics as name=expression, usable in where/metrics/sort_by")
+):
+    """Screen every company's latest period by metric predicates, served from the metrics cache"""
+    metric_list = [m.strip() for m in metrics.split(',') if m.strip()] if metrics else []
+    return screen(
+        where,
+        period_type,
+        audited_only=audited,
+        metrics=metric_list,
+        sort_by=sort_by,
+        descending=sort_order == "desc",
+        offset=(page - 1) * per_page,
+        limit=per_page,
+        formulas=_parse_formulas(formula)
+    )
+
+
+def _parse_formulas(definitions: List[str]) -> Dict[str, MetricFormula]:
+    try:
+        return parse_formula_definitions(definitions)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/items")
+def list_statement_items(
+        symbol: Optional[str] = Query(None, description="Only items reported by this symbol"),
+        db: Session = Depends(get_read_db)
+):
+    """Line items available in the long-format store, including those without a wide column"""
+    rows = db.execute(item_catalog_statement(symbol)).all()
+    return {
+        "items": [{"item_key": row.item_key, "item_name": row.item_name, "rows": row.rows} for row in rows]
+    }
+
+
+@router.get("/items/pivot")
+def pivot_statement_items(
+        symbol: str = Query(..., description="Company symbol"),
+        items: Optional[str] = Query(None, description="Comma-separated item keys (default: every item)"),
+        period_type: Optional[str] = Query(None, description="Period type (e.g., 'سال مالی', '3 ماهه')"),
+        current_only: bool = Query(True, description="Skip statement versions replaced by an amendment"),
+        limit: int = Query(40, ge=1, le=500, description="Number of period rows"),
+        value_format: str = Query("raw", alias="format", pattern="^(raw|display)$",
+                                  description="display adds Persian-formatted <item>_fmt strings"),
+        db: Session = Depends(get_read_db)
+):
+    """Wide-format period rows assembled from the long-format item store"""
+    item_list = [i.strip() for i in items.split(',') if i.strip()] if items else None
+    rows = db.execute(pivot_statement(symbol, item_list, period_type, current_only, limit)).all()
+    data = [pivot_row_to_dict(row) for row in rows]
+    if value_format == "display":
+        data = [add_display_values(item, [key for key in item if key not in PERIOD_COLUMNS]) for item in data]
+    return fast_json({"symbol": symbol, "data": data})
+
+
 @router.get("/{notice_id}")
 async def get_financial_statement(
+        request: Request,
+        response: Response,
         notice_id: int,
         output_format: str = Query("json", description="Output format: json, code, or dataframe"),
         force_refresh: bool = Query(False, description="Force refresh data"),
         db: Session = Depends(get_db)
 ):
     """Get financial statement data with PostgreSQL storage and detailed normalization"""
-    return await financial_service.get_by_notice_id(
+    if output_format == "json" and not force_refresh:
+        # Stored statements are versioned by their content hash; notices never extracted have none
+        version = db.query(StockNotice.statement_hash, StockNotice.updated_at, StockNotice.created_at).filter(
+            StockNotice.id == notice_id
+        ).first()
+        if version is not None and version.statement_hash:
+            last_modified = version.updated_at or version.created_at
+            etag = make_etag("financial-statement", notice_id, version.statement_hash, last_modified)
+            not_modified = conditional_response(request, response, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+
+    return fast_json(await financial_service.get_by_notice_id(
         notice_id, output_format, db, force_refresh
-    )
\ No newline at end of file
+    ), response)
\ No newline at end of file
@@ -1,24 +1,106 @@
-from fastapi import APIRouter, Depends, HTTPException, Query,  BackgroundTasks
-from typing import Optional
-from database import get_db
-from models import StockNotice, FinancialStatementData
+from fastapi import APIRouter, Depends, HTTPException, Query,  BackgroundTasks, Request, Response
+from typing import List, Optional
+import numpy as np
+from database import get_read_db
+from models import StockNotice, FinancialStatementData, SymbolStats, FINANCIAL_ROW_SERIALIZER
 from sqlalchemy.orm import Session
+from services.metrics_cache import COLUMN_INDEX, RECORD_FIELDS, metrics_cache
+from services.response_cache import cache_key, response_cache
+from services.timeseries import PeriodSeries, is_transform
+from utils.metric_formulas import lookup_formula, parse_formula_definitions
+from utils.number_format import add_display_values
+from utils.http_cache import conditional_response, make_etag
+from utils.serialization import ORJSONResponse, columnar, fast_json
 
 
 
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 
 from sqlalchemy import func, and_
 
 @router.get("/{symbol}")
 def get_financial_data(
+    request: Request,
+    response: Response,
     symbol: str,
     period_type: Optional[str] = Query(None, description="Filter by period type"),
-    db: Session = Depends(get_db)
+    metrics: Optional[str] = Query(None, description="Comma-separated numeric columns, calculated metrics or growth metrics (net_profit_yoy, _qoq, _ttm, _cagr3); served from the in-memory metrics cache"),
+    formula: List[str] = Query([], description="Ad-hoc metrics as name=expression, usable in metrics"),
+    value_format: str = Query("raw", alias="format", pattern="^(raw|display)$",
+                              description="display adds Persian-formatted <column>_fmt strings"),
+    layout: str = Query("rows", pattern="^(rows|columns)$",
+                        description="columns returns {column: [values]} instead of a list of row objects"),
+    db: Session = Depends(get_read_db)
 ):
     """Fetch financial data for a symbol filtered by period_type with conditions"""
+    # A primary-key lookup of the symbol's data version decides a 304 and keys the cached body
+    version = db.query(SymbolStats.data_version, SymbolStats.data_changed_at).filter(
+        SymbolStats.symbol == symbol
+    ).first()
+
+    # The version is part of the key: a body read from a lagging replica right after a write
+    # is cached under the old version and never served once the new one is visible
+    key = cache_key("financial-data", symbol=symbol, period_type=period_type, metrics=metrics,
+                    formula=formula, format=value_format,
+                    data_version=version.data_version if version is not None else None)
+
+    if version is not None:
+        etag = make_etag(key, layout, version.data_version, version.data_changed_at)
+        not_modified = conditional_response(request, response, etag, version.data_changed_at)
+        if not_modified is not None:
+            return not_modified
+
+    payload = response_cache.get(key)
+    if payload is None:
+        metric_list = [m.strip() for m in metrics.split(',') if m.strip()] if metrics else []
+        try:
+            user_formulas = parse_formula_definitions(formula)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # The SQL fallback only returns stored columns: anything computed waits for the cache
+        # rather than caching (and ETagging) a body without the metrics that were asked for
+        if not metrics_cache.loaded and (user_formulas or any(m not in COLUMN_INDEX for m in metric_list)):
+            raise HTTPException(status_code=503, detail="Calculated, growth and TTM metrics need the metrics cache, which is still loading",
+                                headers={"Retry-After": "30"})
+        payload = response_cache.set(
+            key, _financial_data_payload(symbol, period_type, metric_list, user_formulas, value_format, db), [symbol]
+        )
+
+    if layout == "columns":
+        payload = {"data": columnar(payload["data"])}
+    # Rendered by orjson straight from the cached dicts, without jsonable_encoder's walk
+    return fast_json(payload, response)
+
+
+def _financial_data_payload(symbol: str, period_type: Optional[str], metric_list: List[str],
+                            user_formulas: dict, value_format: str, db: Session) -> dict:
+    if metric_list and metrics_cache.loaded:
+        frame = metrics_cache.lookup(symbol)
+        if frame is None:
+            return {"data": []}
+        rows = frame.select_by_period(period_type)
+        data = [frame.record(row).to_dict(metric_list) for row in rows]
+
+        for metric in metric_list:
+            metric_formula = lookup_formula(metric, user_formulas)
+            if metric_formula is not None:
+                values = metric_formula.evaluate(lambda column: frame.column(rows, column))
+                for item, value in zip(data, values):
+                    item[metric] = None if np.isnan(value) else float(value)
+
+        transform_list = [m for m in metric_list if is_transform(m)]
+        if transform_list:
+            series = PeriodSeries([frame])
+            for metric in transform_list:
+                for item, value in zip(data, series.values_for(frame, rows, metric)):
+                    item[metric] = None if np.isnan(value) else float(value)
+
+        if value_format == "display":
+            data = [add_display_values(item, metric_list) for item in data]
+        return {"data": data}
+
     # Base query
     query = db.query(FinancialStatementData).filter(FinancialStatementData.company_symbol == symbol)
 
@@ -34,13 +116,15 @@ def get_financial_data(
         )
         .filter(FinancialStatementData.company_symbol == symbol)
         .filter(FinancialStatementData.period_type == period_type)
+        .filter(FinancialStatementData.is_current.is_(True))
         .group_by(FinancialStatementData.period_date)
         .subquery()
     )
 
     # Join the original table with the subquery to fetch the prioritized record for each period_date
+    # Plain column rows instead of ORM instances: no identity map or attribute instrumentation per row
     final_query = (
-        db.query(FinancialStatementData)
+        db.query(*FinancialStatementData.__table__.columns)
         .join(subquery, FinancialStatementData.id == subquery.c.id)
         .order_by(FinancialStatementData.period_date)  # Sort by period_date
     )
@@ -48,4 +132,11 @@ def get_financial_data(
     # Execute the query and return the results
     financial_data = final_query.all()
 
-    return {"data": [data.to_dict() for data in financial_data]}
\ No newline at end of file
+    data = FINANCIAL_ROW_SERIALIZER.to_dicts(financial_data)
+    if metric_list:
+        # Same fields as the metrics cache path, so the body does not change shape once it has loaded
+        fields = RECORD_FIELDS + tuple(metric for metric in metric_list if metric in COLUMN_INDEX)
+        data = [{name: item[name] for name in fields} for item in data]
+    if value_format == "display":
+        data = [add_display_values(item, metric_list or None) for item in data]
+    return {"data": data}
\ No newline at end of file
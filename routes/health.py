@@ -1,27 +1,53 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from database import get_db
-from models import StockNotice, FinancialStatementData
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from sqlalchemy import text
+from services.stats_service import read_snapshot_async, NOTICES_SNAPSHOT
+from services.driver_watchdog import driver_watchdog
+from services.driver_factory import driver_factory
+from services.circuit_breaker import circuit_status
+from services.response_cache import response_cache
 
 router = APIRouter()
 
 @router.get("/health")
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     """Health check endpoint"""
     try:
         # Test database connection
-        total_notices = db.query(StockNotice).count()
-        total_financial = db.query(FinancialStatementData).count()
+        await db.execute(text("SELECT 1"))
+        snapshot = await read_snapshot_async(db, NOTICES_SNAPSHOT)
 
         return {
             "status": "healthy",
             "database": "connected",
-            "total_notices": total_notices,
-            "total_financial_data": total_financial
+            "total_notices": snapshot["all_notices"],
+            "total_financial_data": snapshot["statement_records"]
         }
     except Exception as e:
         return {
             "status": "unhealthy",
             "database": "disconnected",
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+
+@router.get("/health/drivers")
+async def driver_health():
+    """Chrome driver process counts, memory, recycle/reap and startup latency statistics"""
+    return {
+        **driver_watchdog.status(),
+        "factory": driver_factory.stats()
+    }
+
+
+@router.get("/health/circuits")
+async def circuit_health():
+    """Codal circuit breaker states and remaining retry budget"""
+    return circuit_status()
+
+
+@router.get("/health/cache")
+async def cache_health():
+    """Response cache size, hit/miss counts and invalidations"""
+    return response_cache.stats()
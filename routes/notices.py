@@ -4,37 +4,59 @@ from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Query
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import Optional
-from database import get_db
-from models import StockNotice
+from database import get_db, get_read_db, get_db_session, get_async_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import StockNotice, FinancialStatementData
 from services.scraping_service import ultra_fast_scrape
-from sqlalchemy import desc, asc, func, and_, or_, distinct
+from services.notice_categories import backfill_notice_categories, backfill_published_at
+from services.partitions import backfill_partition_keys
+from services.statement_versions import backfill_statement_versions
+from services.statement_items import backfill_items_from_wide
+from services.metrics_cache import metrics_cache
+from services.stats_service import read_snapshot_async, record_changes, bump_data_versions, NOTICES_SNAPSHOT
+from services.response_cache import ALL_SYMBOLS, cache_key, response_cache
+from sqlalchemy import desc, asc, func, and_, distinct, literal_column, tuple_
+from utils.pagination import encode_cursor, decode_cursor
+from utils.text_utils import normalize_persian
 
-from temp.models import FinancialStatementData
-from utils.financial_utils import FINANCIAL_PATTERNS
 from utils.text_utils import  extract_period_type, extract_date_from_title
 
 router = APIRouter()
 
 @router.get("/count")
-def get_count(symbol: Optional[str] = None, db: Session = Depends(get_db)):
+def get_count(symbol: Optional[str] = None, db: Session = Depends(get_read_db)):
     """Get total count of records"""
+    key = cache_key("count", symbol=symbol)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+
     query = db.query(StockNotice)
     if symbol:
         query = query.filter(StockNotice.symbol == symbol)
     count = query.count()
-    return {"count": count, "symbol": symbol}
+    return response_cache.set(key, {"count": count, "symbol": symbol}, [symbol or ALL_SYMBOLS])
 
 @router.get("/symbols")
-def get_symbols(db: Session = Depends(get_db)):
+def get_symbols(db: Session = Depends(get_read_db)):
     """Get list of all unique symbols"""
-    symbols = db.query(StockNotice.symbol).distinct().all()
-    return {"symbols": [s[0] for s in symbols if s[0]]}
+    return _symbol_list(db)
 
 @router.get("/notices/symbols")
-def get_symbols(db: Session = Depends(get_db)):
+def get_symbols(db: Session = Depends(get_read_db)):
     """Get list of all unique symbols"""
+    return _symbol_list(db)
+
+
+def _symbol_list(db: Session) -> dict:
+    key = cache_key("symbols")
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+
     symbols = db.query(StockNotice.symbol).distinct().all()
-    return {"symbols": [s[0] for s in symbols if s[0]]}
+    return response_cache.set(key, {"symbols": [s[0] for s in symbols if s[0]]}, [ALL_SYMBOLS])
+
 
 @router.delete("/symbol/{symbol}")
 def delete_symbol(symbol: str, db: Session = Depends(get_db)):
@@ -46,6 +68,9 @@ def delete_symbol(symbol: str, db: Session = Depends(get_db)):
 
     deleted = db.query(StockNotice).filter(StockNotice.symbol == symbol).delete()
     db.commit()
+    record_changes(db, [symbol])
+    metrics_cache.refresh_symbol(db, symbol)
+    response_cache.invalidate_symbols([symbol])
 
     return {
         "message": f"Deleted {deleted} records for symbol: {symbol}",
@@ -53,41 +78,117 @@ def delete_symbol(symbol: str, db: Session = Depends(get_db)):
     }
 
 
-@router.get("/stats")
-async def get_system_stats(db: Session = Depends(get_db)):
-    """Get system statistics"""
-    try:
-        # # Define financial patterns
-        # FINANCIAL_PATTERNS = [
-        #     "اطلاعات و صورت های مالی",
-        #     "صورت های سال مالی"
-        # ]
+@router.get("/notices/search")
+def search_notices(
+        q: str = Query(..., min_length=1, description="Keywords to search notice titles for"),
+        symbol: Optional[str] = Query(None, description="Restrict to one symbol"),
+        category: Optional[str] = Query(None, description="Restrict to a notice_category"),
+        year_from: Optional[int] = Query(None, description="First publish year (Gregorian); limits the yearly partitions read"),
+        year_to: Optional[int] = Query(None, description="Last publish year (Gregorian)"),
+        sort: str = Query("rank", pattern="^(rank|recent)$"),
+        limit: int = Query(50, ge=1, le=200),
+        cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+        db: Session = Depends(get_read_db)
+):
+    """Full-text search over notice titles, ranked, with keyset pagination"""
+    normalized = normalize_persian(q)
+    if not normalized:
+        raise HTTPException(status_code=400, detail="Empty search query")
+
+    ts_query = func.websearch_to_tsquery(literal_column("'simple'::regconfig"), normalized)
+    title_tsv = literal_column("stock_notices.title_tsv")
+    rank = func.ts_rank_cd(title_tsv, ts_query).label("rank")
+
+    query = db.query(StockNotice, rank).filter(title_tsv.op("@@")(ts_query))
+    if symbol:
+        query = query.filter(StockNotice.symbol == symbol.strip())
+    if category:
+        query = query.filter(StockNotice.notice_category == category)
+    if year_from is not None:
+        query = query.filter(StockNotice.publish_year >= year_from)
+    if year_to is not None:
+        query = query.filter(StockNotice.publish_year <= year_to)
+
+    if sort == "rank":
+        after = decode_cursor(cursor, 2)
+        if after:
+            query = query.filter(tuple_(func.ts_rank_cd(title_tsv, ts_query), StockNotice.id) < tuple_(*after))
+        query = query.order_by(desc("rank"), desc(StockNotice.id))
+    else:
+        after = decode_cursor(cursor, 1)
+        if after:
+            query = query.filter(StockNotice.id < after[0])
+        query = query.order_by(desc(StockNotice.id))
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        last_notice, last_rank = rows[-1]
+        next_cursor = encode_cursor(last_rank, last_notice.id) if sort == "rank" else encode_cursor(last_notice.id)
 
-        # Total ALL notices (not just financial)
-        all_notices = db.query(StockNotice).count()
+    return {
+        "query": q,
+        "notices": [
+            {
+                "notice_id": notice.id,
+                "symbol": notice.symbol or "",
+                "company_name": notice.company_name or "",
+                "title": notice.title or "",
+                "notice_category": notice.notice_category,
+                "publish_time": notice.publish_time,
+                "html_link": notice.html_link,
+                "rank": round(notice_rank, 6)
+            }
+            for notice, notice_rank in rows
+        ],
+        "next_cursor": next_cursor
+    }
 
-        # Total financial notices only
-        financial_filter = or_(*[StockNotice.title.ilike(f"%{pattern}%") for pattern in FINANCIAL_PATTERNS])
-        total_notices = db.query(StockNotice).filter(financial_filter).count()
 
-        # Active companies (companies with financial notices)
-        active_companies = db.query(StockNotice.symbol).filter(financial_filter).distinct().count()
+def run_notice_backfills(reclassify: bool = False):
+    with get_db_session() as db:
+        result = {
+            "categories": backfill_notice_categories(db, reclassify=reclassify),
+            "published_at": backfill_published_at(db),
+            "statement_versions": backfill_statement_versions(db),
+            "statement_items": backfill_items_from_wide(db),
+            "partition_keys": backfill_partition_keys(db)
+        }
+        if result["statement_versions"]["updated"]:
+            response_cache.clear()
+            bump_data_versions(db)
+            if metrics_cache.loaded:
+                metrics_cache.load_all(db)
+        return result
+
 
-        # Stored statements (use financial notices count as estimate)
-        stored_statements = total_notices
+@router.post("/notices/backfill-categories")
+def backfill_categories(
+        background_tasks: BackgroundTasks,
+        reclassify: bool = Query(False, description="Re-run classification on already classified notices")
+):
+    """Classify stored notices and derive published_at for them in the background"""
+    background_tasks.add_task(run_notice_backfills, reclassify)
+    return {"message": "Notice category backfill started in background", "reclassify": reclassify}
 
-        # Latest update - just get the string value
-        latest_notice = db.query(StockNotice).order_by(desc(StockNotice.id)).first()
-        last_update = None
-        if latest_notice and latest_notice.publish_time:
-            last_update = str(latest_notice.publish_time)
+
+@router.get("/stats")
+async def get_system_stats(db: AsyncSession = Depends(get_async_db)):
+    """Get system statistics"""
+    try:
+        # Maintained by the insert paths and the periodic stats refresh
+        snapshot = await read_snapshot_async(db, NOTICES_SNAPSHOT)
 
         return {
-            "all_notices": all_notices,  # NEW: Total count of all notices
-            "total_notices": total_notices,  # Financial notices only
-            "active_companies": active_companies,
-            "stored_statements": stored_statements,
-            "last_update": last_update,
+            "all_notices": snapshot["all_notices"],  # NEW: Total count of all notices
+            "total_notices": snapshot["financial_notices"],  # Financial notices only
+            "active_companies": snapshot["active_companies"],
+            "stored_statements": snapshot["financial_notices"],
+            "last_update": snapshot["last_update"],
+            "refreshed_at": snapshot["refreshed_at"],
             "status": "active"
         }
 
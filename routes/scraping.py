@@ -4,17 +4,20 @@ from fastapi import APIRouter, Depends, BackgroundTasks
 from pydantic import BaseModel
 from selenium.common import TimeoutException
 from selenium.webdriver.common.by import By
-from sqlalchemy import distinct, func
+from sqlalchemy import distinct, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional
 from sqlalchemy.orm import Session
-from typing import Optional
-from database import get_db
-from models import StockNotice
+from database import get_db, get_async_db
+from models import StockNotice, SymbolStats
+from services.stats_service import read_snapshot_async, NOTICES_SNAPSHOT
 from services.scraping_service import ultra_fast_scrape
+from services.scheduler_service import scheduler
+from services.driver_factory import driver_factory
+from services.circuit_breaker import breaker_for_url, retry_budget, backoff_delay
 import time
-from selenium import webdriver
 from selenium.webdriver.support.ui import WebDriverWait
 
 
@@ -391,6 +394,10 @@ async def ultra_fast_scrape_multiple(
             # Since ultra_fast_scrape is NOT async
             result = ultra_fast_scrape(symbol, start_page, end_page, force_refresh)
 
+            if result and result.get("deferred"):
+                print(f"⏸️ Deferred {symbol}: listing circuit open")
+                return {"symbol": symbol, "status": "deferred", "retry_after": result.get("retry_after", 0)}
+
             symbol_time = time.time() - symbol_start
             print(f"✅ Completed {symbol} in {symbol_time:.1f} seconds")
 
@@ -400,42 +407,60 @@ async def ultra_fast_scrape_multiple(
             print(f"❌ Failed to scrape symbol {symbol}: {e}")
             return {"symbol": symbol, "status": "failed", "error": str(e)}
 
-    # Use ThreadPoolExecutor for concurrent execution (since ultra_fast_scrape is sync)
+    import concurrent.futures
+
+    def run_batch(executor, batch):
+        """Scrape a batch of symbols concurrently on the shared pool"""
+        batch_results = []
+        futures = {executor.submit(scrape_single_symbol_wrapper, symbol): symbol for symbol in batch}
+
+        # Collect results
+        for future in concurrent.futures.as_completed(futures):
+            symbol = futures[future]
+            try:
+                batch_results.append(future.result(timeout=300))  # 5 minute timeout per symbol
+            except concurrent.futures.TimeoutError:
+                print(f"⏰ Timeout for symbol: {symbol}")
+                batch_results.append({"symbol": symbol, "status": "failed", "error": "Timeout"})
+            except Exception as exc:
+                print(f"💥 Exception for symbol {symbol}: {exc}")
+                batch_results.append({"symbol": symbol, "status": "failed", "error": str(exc)})
+        return batch_results
+
+    # One pool for every batch and the requeue pass (ultra_fast_scrape is sync)
     results = []
     total_symbols = len(symbols)
 
-    # Process symbols in batches
-    for i in range(0, total_symbols, max_workers):
-        batch = symbols[i:i + max_workers]
-        batch_num = (i // max_workers) + 1
-        total_batches = (total_symbols + max_workers - 1) // max_workers
-
-        print(f"📦 Processing batch {batch_num}/{total_batches}: {batch}")
-
-        # Use ThreadPoolExecutor to run sync functions concurrently
-        import concurrent.futures
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit tasks
-            futures = {executor.submit(scrape_single_symbol_wrapper, symbol): symbol for symbol in batch}
-
-            # Collect results
-            for future in concurrent.futures.as_completed(futures):
-                symbol = futures[future]
-                try:
-                    result = future.result(timeout=300)  # 5 minute timeout per symbol
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Process symbols in batches
+        for i in range(0, total_symbols, max_workers):
+            batch = symbols[i:i + max_workers]
+            batch_num = (i // max_workers) + 1
+            total_batches = (total_symbols + max_workers - 1) // max_workers
+
+            print(f"📦 Processing batch {batch_num}/{total_batches}: {batch}")
+            results.extend(run_batch(executor, batch))
+
+            # Add delay between batches
+            if i + max_workers < total_symbols:
+                print(f"⏳ Waiting 5 seconds before next batch...")
+                time.sleep(5)
+
+        # Requeue symbols deferred by an open circuit once it has had a chance to recover
+        deferred = [r for r in results if r.get("status") == "deferred"]
+        if deferred:
+            results = [r for r in results if r.get("status") != "deferred"]
+            wait = max(r.get("retry_after", 0) for r in deferred)
+            print(f"⏸️ {len(deferred)} symbols deferred, retrying in {wait:.0f} seconds...")
+            await asyncio.sleep(wait)
+
+            retry_symbols = [r["symbol"] for r in deferred]
+            for i in range(0, len(retry_symbols), max_workers):
+                for result in run_batch(executor, retry_symbols[i:i + max_workers]):
+                    # Deferred twice: report it instead of dropping it from the totals
+                    if result.get("status") == "deferred":
+                        result = {"symbol": result["symbol"], "status": "failed", "error": "Circuit open"}
                     results.append(result)
-                except concurrent.futures.TimeoutError:
-                    print(f"⏰ Timeout for symbol: {symbol}")
-                    results.append({"symbol": symbol, "status": "failed", "error": "Timeout"})
-                except Exception as exc:
-                    print(f"💥 Exception for symbol {symbol}: {exc}")
-                    results.append({"symbol": symbol, "status": "failed", "error": str(exc)})
-
-        # Add delay between batches
-        if i + max_workers < total_symbols:
-            print(f"⏳ Waiting 5 seconds before next batch...")
-            time.sleep(5)
 
     # Calculate final statistics
     end_time = time.time()
@@ -463,19 +488,19 @@ async def ultra_fast_scrape_multiple(
 
 # GET endpoint to check scraping status (optional)
 @router.get("/scrape-symbols/status")
-async def get_multi_scraping_status(db: Session = Depends(get_db)):
+async def get_multi_scraping_status(db: AsyncSession = Depends(get_async_db)):
     """Get current database statistics"""
     try:
-        total_notices = db.query(StockNotice).count()
-        unique_symbols = db.query(distinct(StockNotice.symbol)).count()
+        snapshot = await read_snapshot_async(db, NOTICES_SNAPSHOT)
+        total_notices = snapshot["all_notices"]
+        unique_symbols = await db.scalar(select(func.count(SymbolStats.symbol)))
 
         # Get top 10 symbols by notice count
-        top_symbols = db.query(
-            StockNotice.symbol,
-            func.count(StockNotice.id).label('count')
-        ).group_by(StockNotice.symbol).order_by(
-            func.count(StockNotice.id).desc()
-        ).limit(10).all()
+        top_symbols = (await db.execute(
+            select(SymbolStats.symbol, SymbolStats.total_notices.label('count'))
+            .order_by(SymbolStats.total_notices.desc())
+            .limit(10)
+        )).all()
 
         return {
             "total_notices": total_notices,
@@ -487,52 +512,21 @@ async def get_multi_scraping_status(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to get status: {str(e)}")
 
 
+@router.get("/scheduler/status")
+async def get_scheduler_status():
+    """Get periodic refresh scheduler state and upcoming symbol refreshes"""
+    return scheduler.status()
+
+
 def setup_chrome_driver():
     """Setup Chrome driver with enhanced stability and timeout handling"""
-    options = webdriver.ChromeOptions()
-
-    # Existing options...
-    options.add_argument('--headless')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-
-    # Enhanced timeout and stability options
-    options.add_argument('--disable-gpu')
-    options.add_argument('--disable-web-security')
-    options.add_argument('--disable-features=VizDisplayCompositor')
-    options.add_argument('--disable-background-timer-throttling')
-    options.add_argument('--disable-backgrounding-occluded-windows')
-    options.add_argument('--disable-renderer-backgrounding')
-    options.add_argument('--disable-field-trial-config')
-    options.add_argument('--disable-back-forward-cache')
-    options.add_argument('--disable-background-networking')
-    options.add_argument('--disable-default-apps')
-    options.add_argument('--disable-extensions')
-    options.add_argument('--disable-sync')
-    options.add_argument('--disable-translate')
-    options.add_argument('--hide-scrollbars')
-    options.add_argument('--metrics-recording-only')
-    options.add_argument('--mute-audio')
-    options.add_argument('--no-first-run')
-    options.add_argument('--safebrowsing-disable-auto-update')
-    options.add_argument('--disable-ipc-flooding-protection')
-
-    # Memory and performance optimization
-    options.add_argument('--memory-pressure-off')
-    options.add_argument('--max_old_space_size=4096')
-
-    # Page load strategy
-    options.page_load_strategy = 'eager'  # Don't wait for all resources
-
     try:
-        driver = webdriver.Chrome(options=options)
-
-        # Set timeouts - IMPORTANT!
-        driver.set_page_load_timeout(30)  # Increase from default
-        driver.implicitly_wait(10)  # Increase implicit wait
-
-        # Additional timeouts
-        driver.set_script_timeout(30)
+        driver = driver_factory.create_driver(
+            "setup_chrome_driver",
+            page_load_timeout=30,
+            implicit_wait=10,
+            script_timeout=30
+        )
 
         print("Chrome driver initialized with enhanced stability optimizations")
         return driver
@@ -543,37 +537,42 @@ def setup_chrome_driver():
 
 
 def scrape_page_with_retry(driver, url, retries=3, delay=5):
-    """Scrape page with retry logic for timeout issues"""
+    """Scrape page with circuit breaker, jittered exponential backoff and the shared retry budget"""
+    breaker = breaker_for_url(url)
+
     for attempt in range(retries):
+        if not breaker.allow_request():
+            print(f"🚫 Circuit '{breaker.name}' is open, deferring: {url}")
+            return False
+
         try:
             print(f"Loading page (attempt {attempt + 1}/{retries}): {url}")
-            driver.get(url)
+            driver_factory.navigate(driver, url)
 
             # Wait for page to load
             WebDriverWait(driver, 20).until(
                 EC.presence_of_element_located((By.TAG_NAME, "body"))
             )
 
+            breaker.record_success()
+            retry_budget.deposit()
             print(f"✅ Page loaded successfully on attempt {attempt + 1}")
             return True
 
         except TimeoutException as e:
             print(f"⏰ Timeout on attempt {attempt + 1}: {e}")
-            if attempt < retries - 1:
-                print(f"⏳ Waiting {delay} seconds before retry...")
-                time.sleep(delay)
-            else:
-                print(f"❌ Failed to load page after {retries} attempts")
-                return False
+            breaker.record_failure()
         except Exception as e:
             print(f"❌ Error loading page on attempt {attempt + 1}: {e}")
-            if attempt < retries - 1:
-                print(f"⏳ Waiting {delay} seconds before retry...")
-                time.sleep(delay)
-            else:
-                print(f"❌ Failed to load page after {retries} attempts")
+            breaker.record_failure()
+
+        if attempt < retries - 1:
+            if not retry_budget.try_spend():
+                print("💸 Retry budget exhausted, giving up")
                 return False
+            wait = backoff_delay(attempt, base=delay)
+            print(f"⏳ Waiting {wait:.1f} seconds before retry...")
+            time.sleep(wait)
 
+    print(f"❌ Failed to load page after {retries} attempts")
     return False
-
-
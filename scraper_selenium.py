@@ -1,11 +1,14 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException
 import time
 import urllib.parse
+from services.driver_watchdog import driver_watchdog
+from services.driver_factory import driver_factory
+from services.circuit_breaker import (
+    CircuitOpenError, LISTING_ENDPOINT, get_breaker, retry_budget, backoff_delay
+)
 
 
 class CodalSeleniumScraper:
@@ -14,48 +17,31 @@ class CodalSeleniumScraper:
         self.setup_driver()
 
     def setup_driver(self):
-        """Setup Chrome driver with maximum speed optimizations"""
-        chrome_options = Options()
-
-        # Maximum performance optimizations
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--disable-web-security")
-        chrome_options.add_argument("--disable-features=VizDisplayCompositor")
-        chrome_options.add_argument("--disable-extensions")
-        chrome_options.add_argument("--disable-plugins")
-        chrome_options.add_argument("--disable-images")
-        chrome_options.add_argument("--disable-background-timer-throttling")
-        chrome_options.add_argument("--disable-backgrounding-occluded-windows")
-        chrome_options.add_argument("--disable-renderer-backgrounding")
-        chrome_options.add_argument("--window-size=1024,768")
-        chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
-
-        # Disable unnecessary features
-        chrome_options.add_experimental_option("useAutomationExtension", False)
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-
-        # Set page load strategy to normal for stability
-        chrome_options.page_load_strategy = 'normal'
-
+        """Setup Chrome driver from the shared factory (warm profile, eager page loads)"""
         try:
-            self.driver = webdriver.Chrome(options=chrome_options)
-            self.driver.implicitly_wait(3)  # Slightly longer wait for stability
-
-            # Set reasonable timeouts
-            self.driver.set_page_load_timeout(15)
-            self.driver.set_script_timeout(10)
-
+            self.driver = driver_factory.create_driver(
+                "CodalSeleniumScraper",
+                window_size="1024,768",
+                block_images=True,
+                page_load_timeout=15,
+                implicit_wait=3,
+                script_timeout=10
+            )
             print("Chrome driver initialized with stability optimizations")
         except Exception as e:
             print(f"Error initializing Chrome driver: {e}")
             raise
 
+    def recycle_driver_if_needed(self):
+        """Restart the browser when the watchdog flags it for memory or navigation count"""
+        if self.driver and driver_watchdog.should_recycle(self.driver):
+            print("Recycling Chrome driver...")
+            self.close()
+            self.setup_driver()
+
     def scrape_with_selenium(self, symbol, page_number=1):
         """Stable scraping with stale element handling"""
+        self.recycle_driver_if_needed()
         if not self.driver:
             raise Exception("Driver not initialized")
 
@@ -65,19 +51,31 @@ class CodalSeleniumScraper:
 
             print(f"Scraping page {page_number} for {symbol}...")
 
-            start_time = time.time()
-            self.driver.get(url)
+            breaker = get_breaker(LISTING_ENDPOINT)
+            breaker.ensure_closed()
 
-            # Wait for page to load properly
-            time.sleep(3)
+            start_time = time.time()
+            # Any outcome must resolve the request, or a half-open probe is held until it times out
+            try:
+                driver_factory.navigate(self.driver, url)
+            except BaseException:
+                breaker.record_failure()
+                raise
 
-            # Wait for table to be present
+            # With eager loading, wait for Angular to render result rows rather than a fixed delay
             try:
-                wait = WebDriverWait(self.driver, 10)
-                wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "tr")))
-                print("Table loaded successfully")
+                wait = WebDriverWait(self.driver, 13)
+                wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "tr.table__row, tbody tr")))
             except TimeoutException:
                 print("Timeout waiting for table to load")
+                breaker.record_failure()
+            except BaseException:
+                breaker.record_failure()
+                raise
+            else:
+                print("Table loaded successfully")
+                breaker.record_success()
+                retry_budget.deposit()
 
             # Parse with robust element handling
             notices = self.extract_data_robust(symbol)
@@ -87,6 +85,8 @@ class CodalSeleniumScraper:
 
             return notices
 
+        except CircuitOpenError:
+            raise
         except Exception as e:
             print(f"Error during scraping: {e}")
             return []
@@ -127,8 +127,12 @@ class CodalSeleniumScraper:
                         break
 
                     if attempt < max_retries - 1:
-                        print(f"Retry {attempt + 1}: waiting for rows to stabilize...")
-                        time.sleep(2)
+                        if not retry_budget.try_spend():
+                            print("Retry budget exhausted, not waiting for rows")
+                            break
+                        delay = backoff_delay(attempt)
+                        print(f"Retry {attempt + 1}: waiting {delay:.1f}s for rows to stabilize...")
+                        time.sleep(delay)
 
                 except Exception as e:
                     print(f"Error finding rows on attempt {attempt + 1}: {e}")
@@ -359,7 +363,9 @@ class CodalSeleniumScraper:
         """Close the browser driver"""
         if self.driver:
             try:
-                self.driver.quit()
+                driver_factory.quit(self.driver)
                 print("Driver closed successfully")
             except Exception as e:
-                print(f"Error closing driver: {e}")
\ No newline at end of file
+                print(f"Error closing driver: {e}")
+            finally:
+                self.driver = None
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Dict
+
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Codal endpoints guarded by separate breakers
+LISTING_ENDPOINT = "listing"  # ReportList.aspx
+DECISION_ENDPOINT = "decision"  # Decision.aspx statement pages
+
+
+class CircuitOpenError(Exception):
+    """Raised when a request is refused because the endpoint's circuit is open"""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+        super().__init__(f"Circuit for '{endpoint}' is open, retry in {retry_after:.0f}s")
+
+
+class CircuitBreaker:
+    """Thread-safe closed/open/half-open breaker for one Codal endpoint"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.probe_started_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def _refresh_state(self):
+        now = time.monotonic()
+        if self.state == self.OPEN and now - self.opened_at >= self.recovery_timeout:
+            self.state = self.HALF_OPEN
+            self.half_open_calls = 0
+        elif (self.state == self.HALF_OPEN and self.half_open_calls >= self.half_open_max_calls
+              and now - self.probe_started_at >= self.recovery_timeout):
+            # The probe never reported back (its caller died or hung): hand the slot to the next request
+            logger.warning(f"Circuit '{self.name}' probe timed out, allowing another")
+            self.half_open_calls = 0
+
+    def is_open(self) -> bool:
+        """True while requests would be refused (does not consume a half-open probe)"""
+        with self.lock:
+            self._refresh_state()
+            return self.state == self.OPEN
+
+    def is_refusing(self) -> bool:
+        """True while allow_request() would say no: open, or half-open with every probe already taken"""
+        with self.lock:
+            self._refresh_state()
+            if self.state == self.HALF_OPEN:
+                return self.half_open_calls >= self.half_open_max_calls
+            return self.state == self.OPEN
+
+    def allow_request(self) -> bool:
+        with self.lock:
+            self._refresh_state()
+
+            if self.state == self.OPEN:
+                self.rejected += 1
+                return False
+
+            if self.state == self.HALF_OPEN:
+                if self.half_open_calls >= self.half_open_max_calls:
+                    self.rejected += 1
+                    return False
+                self.half_open_calls += 1
+                self.probe_started_at = time.monotonic()
+
+            return True
+
+    def ensure_closed(self):
+        """Raise CircuitOpenError instead of returning False"""
+        if not self.allow_request():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                logger.info(f"✅ Circuit '{self.name}' closed")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    logger.warning(f"🚫 Circuit '{self.name}' opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        with self.lock:
+            self._refresh_state()
+            if self.state == self.OPEN:
+                started = self.opened_at
+            elif self.state == self.HALF_OPEN and self.half_open_calls >= self.half_open_max_calls:
+                started = self.probe_started_at
+            else:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (time.monotonic() - started))
+
+    def status(self) -> dict:
+        retry_after = self.retry_after()
+        with self.lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "times_opened": self.times_opened,
+                "rejected_requests": self.rejected,
+                "retry_after_seconds": round(retry_after, 1)
+            }
+
+
+class RetryBudget:
+    """Global token bucket: each retry spends a token, successful requests earn part of one back"""
+
+    def __init__(self, max_tokens: float, deposit_ratio: float):
+        self.max_tokens = max_tokens
+        self.deposit_ratio = deposit_ratio
+        self.tokens = max_tokens
+        self.denied = 0
+        self.lock = threading.Lock()
+
+    def try_spend(self) -> bool:
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            self.denied += 1
+            return False
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.deposit_ratio)
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                "available_retries": round(self.tokens, 1),
+                "max_retries": self.max_tokens,
+                "denied_retries": self.denied
+            }
+
+
+def backoff_delay(attempt: int, base: float = None, cap: float = None) -> float:
+    """Exponential backoff with equal jitter for the given zero-based attempt"""
+    settings = get_settings()
+    base = settings.retry_base_delay_seconds if base is None else base
+    cap = settings.retry_max_delay_seconds if cap is None else cap
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+_settings = get_settings()
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+retry_budget = RetryBudget(_settings.retry_budget_tokens, _settings.retry_budget_deposit_ratio)
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(
+                endpoint,
+                _settings.breaker_failure_threshold,
+                _settings.breaker_recovery_seconds
+            )
+        return _breakers[endpoint]
+
+
+def breaker_for_url(url: str) -> CircuitBreaker:
+    return get_breaker(DECISION_ENDPOINT if "Decision.aspx" in (url or "") else LISTING_ENDPOINT)
+
+
+async def wait_for_circuit(endpoint: str):
+    """Park the caller until the endpoint's circuit stops refusing requests, including while a half-open probe is in flight"""
+    breaker = get_breaker(endpoint)
+    while breaker.is_refusing():
+        await asyncio.sleep(max(1.0, breaker.retry_after()))
+
+
+def circuit_status() -> dict:
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    for endpoint in (LISTING_ENDPOINT, DECISION_ENDPOINT):
+        breakers.setdefault(endpoint, get_breaker(endpoint))
+
+    return {
+        "circuits": {name: breaker.status() for name, breaker in breakers.items()},
+        "retry_budget": retry_budget.status()
+    }
@@ -0,0 +1,221 @@
+import logging
+import re
+from typing import Dict, List, Optional
+
+import requests
+from sqlalchemy import or_, update, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import Company, StockNotice, FinancialStatementData
+from utils.text_utils import extract_date_from_title, DIGIT_TRANSLATION
+
+logger = logging.getLogger(__name__)
+
+CODAL_COMPANIES_URL = "https://search.codal.ir/api/search/v1/companies"
+
+# Codal company list state codes
+LISTING_STATUS = {
+    0: "unknown",
+    1: "listed",
+    2: "delisted",
+    3: "suspended",
+    4: "not_listed"
+}
+
+
+def fetch_codal_companies(timeout: int = 30) -> List[dict]:
+    """Download the full Codal company list and normalise it to registry columns"""
+    response = requests.get(
+        CODAL_COMPANIES_URL,
+        timeout=timeout,
+        headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
+    )
+    response.raise_for_status()
+
+    companies = []
+    for item in response.json():
+        symbol = str(item.get("sy") or "").strip()
+        if not symbol:
+            continue
+
+        industry_group = item.get("IG")
+        companies.append({
+            "symbol": symbol[:100],
+            "codal_company_id": str(item["i"])[:50] if item.get("i") is not None else None,
+            "company_name": str(item.get("n") or "").strip()[:500],
+            "company_type": str(item.get("t")) if item.get("t") is not None else None,
+            "isic": str(industry_group)[:20] if industry_group is not None else None,
+            "listing_status": LISTING_STATUS.get(item.get("st"), str(item.get("st")))
+        })
+
+    return companies
+
+
+def sync_companies(db: Session, companies: Optional[List[dict]] = None) -> dict:
+    """Upsert the Codal company list into the registry and link existing rows to it"""
+    companies = companies if companies is not None else fetch_codal_companies()
+
+    # Codal occasionally lists a symbol twice; keep the last entry
+    by_symbol = {company["symbol"]: company for company in companies}
+    existing = {
+        row.symbol: row
+        for row in db.query(Company.symbol, Company.codal_company_id, Company.company_name,
+                            Company.isic, Company.listing_status).all()
+    }
+
+    changed = []
+    for symbol, company in by_symbol.items():
+        current = existing.get(symbol)
+        if current is None or (
+                current.codal_company_id, current.company_name, current.isic, current.listing_status
+        ) != (company["codal_company_id"], company["company_name"], company["isic"], company["listing_status"]):
+            changed.append(company)
+
+    for start in range(0, len(changed), 500):
+        statement = insert(Company).values(changed[start:start + 500])
+        statement = statement.on_conflict_do_update(
+            index_elements=[Company.symbol],
+            set_={
+                "codal_company_id": statement.excluded.codal_company_id,
+                "company_name": statement.excluded.company_name,
+                "company_type": statement.excluded.company_type,
+                "isic": statement.excluded.isic,
+                "listing_status": statement.excluded.listing_status
+            }
+        )
+        db.execute(statement)
+    db.commit()
+
+    linked = link_company_ids(db)
+    fiscal_year_ends = infer_fiscal_year_ends(db)
+
+    result = {
+        "fetched": len(by_symbol),
+        "inserted": sum(1 for c in changed if c["symbol"] not in existing),
+        "updated": sum(1 for c in changed if c["symbol"] in existing),
+        "unchanged": len(by_symbol) - len(changed),
+        **linked,
+        "fiscal_year_ends_inferred": fiscal_year_ends
+    }
+    logger.info(f"🏢 Company registry sync: {result}")
+    return result
+
+
+def link_company_ids(db: Session) -> Dict[str, int]:
+    """Fill company_id on notices and statement rows that only carry a symbol"""
+    notices = db.execute(
+        update(StockNotice)
+        .where(StockNotice.company_id.is_(None), StockNotice.symbol == Company.symbol)
+        .values(company_id=Company.id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    statements = db.execute(
+        update(FinancialStatementData)
+        .where(FinancialStatementData.company_id.is_(None),
+               FinancialStatementData.company_symbol == Company.symbol)
+        .values(company_id=Company.id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    db.commit()
+    return {"linked_notices": notices, "linked_statement_rows": statements}
+
+
+def infer_fiscal_year_ends(db: Session) -> int:
+    """Derive each company's fiscal year end (Jalali MM/DD) from its annual statement titles"""
+    rows = db.query(Company.id, StockNotice.title).join(
+        StockNotice, StockNotice.company_id == Company.id
+    ).filter(
+        Company.fiscal_year_end.is_(None),
+        StockNotice.title.like("%سال مالی منتهی به%")
+    ).order_by(StockNotice.id.desc()).all()
+
+    fiscal_year_ends = {}
+    for company_id, title in rows:
+        if company_id in fiscal_year_ends:
+            continue
+        date = extract_date_from_title(title).translate(DIGIT_TRANSLATION)
+        match = re.search(r'\d{4}[/\-](\d{1,2})[/\-](\d{1,2})', date)
+        if match:
+            fiscal_year_ends[company_id] = f"{int(match.group(1)):02d}/{int(match.group(2)):02d}"
+
+    for company_id, fiscal_year_end in fiscal_year_ends.items():
+        db.query(Company).filter(Company.id == company_id).update(
+            {"fiscal_year_end": fiscal_year_end}, synchronize_session=False
+        )
+    db.commit()
+    return len(fiscal_year_ends)
+
+
+def resolve_company(db: Session, symbol: str) -> Optional[Company]:
+    """Exact registry lookup by symbol"""
+    if not symbol:
+        return None
+    return db.query(Company).filter(Company.symbol == symbol.strip()).first()
+
+
+def ensure_company(db: Session, symbol: str, company_name: str = "") -> Optional[Company]:
+    """Get the registry row for a symbol, registering it if the crawler has not seen it yet"""
+    company = resolve_company(db, symbol)
+    if company or not symbol:
+        return company
+
+    db.execute(
+        insert(Company)
+        .values(symbol=symbol.strip()[:100], company_name=(company_name or "")[:500])
+        .on_conflict_do_nothing(index_elements=[Company.symbol])
+    )
+    db.commit()
+    return resolve_company(db, symbol)
+
+
+def link_symbol(db: Session, company: Company) -> int:
+    """Attach one company's unlinked notices to it (cheap, uses the symbol index)"""
+    linked = db.query(StockNotice).filter(
+        StockNotice.company_id.is_(None),
+        StockNotice.symbol == company.symbol
+    ).update({"company_id": company.id}, synchronize_session=False)
+    db.commit()
+    return linked
+
+
+def company_ids_for_symbols(db: Session, symbols) -> Dict[str, int]:
+    """Map symbols to registry ids, registering any the registry does not know yet"""
+    symbols = {s for s in symbols if s}
+    ids = {
+        row.symbol: row.id
+        for row in db.query(Company.symbol, Company.id).filter(Company.symbol.in_(symbols)).all()
+    }
+    for symbol in symbols - set(ids):
+        company = ensure_company(db, symbol)
+        if company:
+            ids[symbol] = company.id
+    return ids
+
+
+def _text_condition(term: str, symbol_column, name_column=None):
+    conditions = [symbol_column.ilike(f"%{term}%")]
+    if name_column is not None:
+        conditions.append(name_column.ilike(f"%{term}%"))
+    return or_(*conditions)
+
+
+def company_condition(db: Session, term: str, company_id_column, symbol_column, name_column=None):
+    """Filter on the company foreign key when the term is a known symbol, else fall back to a text match"""
+    company = resolve_company(db, term)
+    if company:
+        return company_id_column == company.id
+    return _text_condition(term, symbol_column, name_column)
+
+
+async def company_condition_async(db: AsyncSession, term: str, company_id_column, symbol_column, name_column=None):
+    """company_condition for async sessions"""
+    company_id = None
+    if term and term.strip():
+        company_id = await db.scalar(select(Company.id).where(Company.symbol == term.strip()))
+    if company_id:
+        return company_id_column == company_id
+    return _text_condition(term, symbol_column, name_column)
@@ -0,0 +1,249 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+from config.settings import get_settings
+from services.driver_watchdog import driver_watchdog, owner_argument
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+# Lock and crash files Chrome leaves behind that must not be copied between instances
+PROFILE_IGNORE = shutil.ignore_patterns("Singleton*", "*.lock", "lockfile", "Crashpad", "*.tmp")
+
+
+def percentiles(samples, points=(50, 90, 99)) -> dict:
+    """Nearest-rank percentiles of the given samples, in milliseconds"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {f"p{p}": None for p in points}
+    return {
+        f"p{p}": round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000, 1)
+        for p in points
+    }
+
+
+class DriverFactory:
+    """Builds every Chrome driver the service uses from one option set and a pre-warmed profile"""
+
+    def __init__(self, settings=None):
+        self.settings = settings or get_settings()
+        self.template_dir = os.path.expanduser(self.settings.driver_profile_template)
+        self.runtime_dir = self._runtime_dir()
+        self.template_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.profiles: Dict[int, str] = {}
+        self.pending_first_navigation = set()
+        self.startup_samples = deque(maxlen=500)
+        self.first_navigation_samples = deque(maxlen=500)
+        self.created = 0
+        self.from_template = 0
+
+    @staticmethod
+    def _runtime_dir() -> str:
+        # Profiles are small and rewritten constantly: keep them on tmpfs when available
+        base = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else tempfile.gettempdir()
+        return os.path.join(base, "codal-chrome-profiles")
+
+    def build_options(
+            self,
+            profile_dir: Optional[str],
+            window_size: str = "1920,1080",
+            block_images: bool = False,
+            page_load_strategy: str = "eager"
+    ) -> Options:
+        """Shared Chrome options for listing and statement scraping"""
+        chrome_options = Options()
+
+        chrome_options.add_argument("--headless")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_argument("--disable-background-timer-throttling")
+        chrome_options.add_argument("--disable-backgrounding-occluded-windows")
+        chrome_options.add_argument("--disable-renderer-backgrounding")
+        chrome_options.add_argument("--disable-features=VizDisplayCompositor")
+        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+        chrome_options.add_argument("--disable-sync")
+        chrome_options.add_argument("--disable-default-apps")
+        chrome_options.add_argument("--no-first-run")
+        chrome_options.add_argument("--no-default-browser-check")
+        chrome_options.add_argument("--mute-audio")
+        chrome_options.add_argument(f"--window-size={window_size}")
+        chrome_options.add_argument(f"--user-agent={USER_AGENT}")
+        chrome_options.add_argument(owner_argument())
+
+        if profile_dir:
+            chrome_options.add_argument(f"--user-data-dir={profile_dir}")
+
+        if block_images:
+            chrome_options.add_experimental_option(
+                "prefs", {"profile.managed_default_content_settings.images": 2}
+            )
+
+        chrome_options.add_experimental_option("useAutomationExtension", False)
+        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+
+        # Callers wait for the elements they need explicitly, so don't block on subresources
+        chrome_options.page_load_strategy = page_load_strategy
+
+        return chrome_options
+
+    def template_ready(self) -> bool:
+        return os.path.isdir(os.path.join(self.template_dir, "Default"))
+
+    def warm_profile_template(self, force: bool = False) -> bool:
+        """Populate the read-only profile template with Codal's cookies, HTTP cache and Angular bundle"""
+        with self.template_lock:
+            if self.template_ready() and not force:
+                return True
+
+            staging_dir = tempfile.mkdtemp(prefix="codal-profile-warm-")
+            driver = None
+            try:
+                logger.info("🔥 Warming Chrome profile template")
+                driver = webdriver.Chrome(options=self.build_options(staging_dir, page_load_strategy="normal"))
+                driver_watchdog.register(driver, "profile-warmup")
+                driver.set_page_load_timeout(60)
+
+                for url in self.settings.driver_warmup_urls:
+                    try:
+                        driver.get(url)
+                        time.sleep(3)  # let the Angular bundle and XHRs land in the cache
+                    except Exception as e:
+                        logger.warning(f"Warm-up navigation failed for {url}: {e}")
+
+                driver.quit()
+                driver_watchdog.unregister(driver)
+                driver = None
+
+                os.makedirs(os.path.dirname(self.template_dir) or ".", exist_ok=True)
+                previous_dir = f"{self.template_dir}.old"
+                if os.path.isdir(self.template_dir):
+                    os.replace(self.template_dir, previous_dir)
+                shutil.copytree(staging_dir, self.template_dir, ignore=PROFILE_IGNORE)
+                shutil.rmtree(previous_dir, ignore_errors=True)
+
+                logger.info(f"✅ Chrome profile template ready at {self.template_dir}")
+                return True
+
+            except Exception as e:
+                logger.error(f"❌ Failed to warm Chrome profile template: {e}")
+                return False
+            finally:
+                if driver:
+                    try:
+                        driver.quit()
+                    except Exception:
+                        pass
+                    driver_watchdog.unregister(driver)
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def _copy_template(self) -> Optional[str]:
+        if not self.template_ready():
+            return None
+
+        os.makedirs(self.runtime_dir, exist_ok=True)
+        profile_dir = tempfile.mkdtemp(prefix="profile-", dir=self.runtime_dir)
+        try:
+            shutil.copytree(self.template_dir, profile_dir, ignore=PROFILE_IGNORE, dirs_exist_ok=True)
+            return profile_dir
+        except Exception as e:
+            logger.warning(f"Could not copy profile template, using a fresh profile: {e}")
+            shutil.rmtree(profile_dir, ignore_errors=True)
+            return None
+
+    def create_driver(
+            self,
+            owner: str,
+            window_size: str = "1920,1080",
+            block_images: bool = False,
+            page_load_timeout: int = 30,
+            implicit_wait: int = 5,
+            script_timeout: int = 30
+    ) -> webdriver.Chrome:
+        """Start a Chrome driver on a private copy of the warm profile"""
+        start_time = time.perf_counter()
+        profile_dir = self._copy_template()
+
+        try:
+            driver = webdriver.Chrome(options=self.build_options(profile_dir, window_size, block_images))
+        except Exception:
+            if profile_dir:
+                shutil.rmtree(profile_dir, ignore_errors=True)
+            raise
+
+        # Track it before anything else can fail or block, so the reaper sees it as owned
+        driver_watchdog.register(driver, owner)
+        with self.lock:
+            if profile_dir:
+                self.profiles[id(driver)] = profile_dir
+
+        try:
+            driver.implicitly_wait(implicit_wait)
+            driver.set_page_load_timeout(page_load_timeout)
+            driver.set_script_timeout(script_timeout)
+        except Exception:
+            self.quit(driver)
+            raise
+
+        with self.lock:
+            self.startup_samples.append(time.perf_counter() - start_time)
+            self.pending_first_navigation.add(id(driver))
+            self.created += 1
+            if profile_dir:
+                self.from_template += 1
+
+        return driver
+
+    def navigate(self, driver, url: str):
+        """driver.get() with first-navigation timing and watchdog accounting"""
+        start_time = time.perf_counter()
+        driver.get(url)
+        elapsed = time.perf_counter() - start_time
+
+        driver_watchdog.record_navigation(driver)
+        with self.lock:
+            if id(driver) in self.pending_first_navigation:
+                self.pending_first_navigation.discard(id(driver))
+                self.first_navigation_samples.append(elapsed)
+
+    def quit(self, driver):
+        """Quit the driver and discard its profile copy"""
+        try:
+            driver.quit()
+        finally:
+            driver_watchdog.unregister(driver)
+            with self.lock:
+                self.pending_first_navigation.discard(id(driver))
+                profile_dir = self.profiles.pop(id(driver), None)
+            if profile_dir:
+                shutil.rmtree(profile_dir, ignore_errors=True)
+
+    def stats(self) -> dict:
+        with self.lock:
+            startup = list(self.startup_samples)
+            first_navigation = list(self.first_navigation_samples)
+            created = self.created
+            from_template = self.from_template
+
+        return {
+            "drivers_created": created,
+            "created_from_warm_profile": from_template,
+            "profile_template_ready": self.template_ready(),
+            "startup_ms": percentiles(startup),
+            "first_navigation_ms": percentiles(first_navigation)
+        }
+
+
+driver_factory = DriverFactory()
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import psutil
+
+from config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Passed to every Chrome we launch so orphans can be traced back to the worker that owns them
+DRIVER_MARKER = "--codal-owner"
+
+
+def owner_argument() -> str:
+    """Chrome command-line flag tagging the browser with this worker's PID"""
+    return f"{DRIVER_MARKER}={os.getpid()}"
+
+
+def _marker_owner(cmdline: List[str]) -> Optional[int]:
+    for arg in cmdline or []:
+        if arg.startswith(f"{DRIVER_MARKER}="):
+            try:
+                return int(arg.split("=", 1)[1])
+            except ValueError:
+                return None
+    return None
+
+
+class TrackedDriver:
+    """Process bookkeeping for one chromedriver + Chrome tree"""
+
+    def __init__(self, pid: int, owner: str):
+        self.pid = pid
+        self.owner = owner
+        self.started_at = time.time()
+        self.navigations = 0
+        self.rss_mb = 0.0
+        self.recycle_requested = False
+
+    def to_dict(self) -> dict:
+        return {
+            "pid": self.pid,
+            "owner": self.owner,
+            "age_seconds": int(time.time() - self.started_at),
+            "navigations": self.navigations,
+            "rss_mb": round(self.rss_mb, 1),
+            "recycle_requested": self.recycle_requested
+        }
+
+
+class DriverWatchdog:
+    """Tracks every WebDriver the service starts, flags bloated ones and reaps orphans"""
+
+    def __init__(self, settings=None):
+        self.settings = settings or get_settings()
+        self.max_rss_mb = self.settings.watchdog_max_rss_mb
+        self.max_navigations = self.settings.watchdog_max_navigations
+        self.launch_grace_seconds = self.settings.watchdog_launch_grace_seconds
+        self.drivers: Dict[int, TrackedDriver] = {}
+        self.lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.started_count = 0
+        self.recycled_count = 0
+        self.reaped_count = 0
+
+    @staticmethod
+    def _driver_pid(driver) -> Optional[int]:
+        try:
+            return driver.service.process.pid
+        except AttributeError:
+            return None
+
+    def register(self, driver, owner: str):
+        pid = self._driver_pid(driver)
+        if pid is None:
+            return
+        with self.lock:
+            self.drivers[id(driver)] = TrackedDriver(pid, owner)
+            self.started_count += 1
+
+    def unregister(self, driver):
+        with self.lock:
+            tracked = self.drivers.pop(id(driver), None)
+            if tracked and tracked.recycle_requested:
+                self.recycled_count += 1
+
+    def record_navigation(self, driver):
+        with self.lock:
+            tracked = self.drivers.get(id(driver))
+            if tracked:
+                tracked.navigations += 1
+                if tracked.navigations >= self.max_navigations:
+                    tracked.recycle_requested = True
+
+    def should_recycle(self, driver) -> bool:
+        with self.lock:
+            tracked = self.drivers.get(id(driver))
+            return bool(tracked and tracked.recycle_requested)
+
+    @staticmethod
+    def _tree_rss_mb(pid: int) -> Optional[float]:
+        try:
+            root = psutil.Process(pid)
+            processes = [root] + root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return None
+
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return total / (1024 * 1024)
+
+    def sample(self):
+        """Refresh RSS for every tracked driver and flag those over the memory limit"""
+        with self.lock:
+            tracked_drivers = list(self.drivers.values())
+
+        for tracked in tracked_drivers:
+            rss_mb = self._tree_rss_mb(tracked.pid)
+            with self.lock:
+                if rss_mb is None:
+                    # chromedriver died underneath the scraper - force a fresh one
+                    tracked.recycle_requested = True
+                    continue
+                tracked.rss_mb = rss_mb
+                if rss_mb > self.max_rss_mb:
+                    tracked.recycle_requested = True
+
+    def _tracked_pids(self) -> set:
+        with self.lock:
+            roots = [tracked.pid for tracked in self.drivers.values()]
+
+        pids = set(roots)
+        for pid in roots:
+            try:
+                pids.update(child.pid for child in psutil.Process(pid).children(recursive=True))
+            except psutil.NoSuchProcess:
+                continue
+        return pids
+
+    def reap_orphans(self) -> int:
+        """Kill chromedriver/Chrome processes owned by this worker (or a dead one) that nobody tracks
+
+        Processes younger than the launch grace period are left alone: a driver
+        is only registered once webdriver.Chrome() has returned, and until then
+        its chromedriver and Chrome look exactly like orphans.
+        """
+        my_pid = os.getpid()
+        tracked_pids = self._tracked_pids()
+        launch_cutoff = time.time() - self.launch_grace_seconds
+        orphans = []
+
+        for process in psutil.process_iter(["pid", "ppid", "name", "cmdline", "create_time"]):
+            info = process.info
+            if info["pid"] in tracked_pids:
+                continue
+            if info["create_time"] is None or info["create_time"] > launch_cutoff:
+                continue
+
+            name = (info["name"] or "").lower()
+            owner = _marker_owner(info["cmdline"])
+
+            if owner is not None:
+                if owner == my_pid or not psutil.pid_exists(owner):
+                    orphans.append(process)
+            elif "chromedriver" in name and info["ppid"] in (my_pid, 1):
+                try:
+                    children = process.children(recursive=True)
+                except psutil.NoSuchProcess:
+                    continue
+                if info["ppid"] == my_pid or any(
+                    _marker_owner(child.cmdline()) is not None for child in children
+                ):
+                    orphans.append(process)
+
+        for process in orphans:
+            try:
+                process.kill()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+
+        if orphans:
+            logger.warning(f"🧹 Reaped {len(orphans)} orphaned chrome/chromedriver processes")
+        with self.lock:
+            self.reaped_count += len(orphans)
+        return len(orphans)
+
+    async def _loop(self):
+        interval = self.settings.watchdog_interval_seconds
+        loop = asyncio.get_event_loop()
+
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(None, self.sample)
+                await loop.run_in_executor(None, self.reap_orphans)
+            except Exception as e:
+                logger.error(f"❌ Driver watchdog tick failed: {e}")
+
+    def start(self):
+        if self._task is None:
+            self.reap_orphans()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        with self.lock:
+            tracked = [t.to_dict() for t in self.drivers.values()]
+            counts = {
+                "started": self.started_count,
+                "recycled": self.recycled_count,
+                "reaped_orphans": self.reaped_count
+            }
+
+        return {
+            "active_drivers": len(tracked),
+            "total_rss_mb": round(sum(t["rss_mb"] for t in tracked), 1),
+            "limits": {
+                "max_rss_mb": self.max_rss_mb,
+                "max_navigations": self.max_navigations
+            },
+            **counts,
+            "drivers": tracked
+        }
+
+
+driver_watchdog = DriverWatchdog()
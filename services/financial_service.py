@@ -4,10 +4,9 @@ from sqlalchemy.orm import Session
 from fastapi import HTTPException
 import logging
 from concurrent.futures import ThreadPoolExecutor
-from sqlalchemy import desc, asc, or_
-from database import get_db
+from sqlalchemy import desc, asc
+from database import WriterSessionLocal
 
-from utils.financial_utils import  FINANCIAL_PATTERNS
 # import datetime
 import time
 from datetime import datetime, timezone
@@ -19,11 +18,16 @@ from models import StockNotice, FinancialStatementData
 from utils.financial_utils import (
     get_stored_financial_data,
     save_financial_data,
-    check_data_exists
+    check_data_exists,
+    SAVE_UNCHANGED,
+    SAVE_UPDATED
 )
 from utils.text_utils import (
-    is_financial_statement
+    is_financial_statement,
+    classify_notice
 )
+from services.circuit_breaker import CircuitOpenError, DECISION_ENDPOINT, backoff_delay, get_breaker, wait_for_circuit
+from services.company_registry import company_condition
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +38,8 @@ class FinancialStatementService:
     def __init__(self, scraper_class, content_executor: ThreadPoolExecutor):
         self.scraper_class = scraper_class
         self.content_executor = content_executor
+        # Counters of the most recent bulk_extract_all_task run, shown by /bulk-extract-status
+        self.last_bulk_run: Optional[dict] = None
 
     async def process_financial_statement(
             self,
@@ -93,18 +99,27 @@ class FinancialStatementService:
                 )
 
             # Save to PostgreSQL if JSON format and database available
+            content_status = None
             if output_format == "json" and db and result.get('formatted_data'):
-                save_success = await save_financial_data(
+                content_status = await save_financial_data(
                     notice,
                     result.get('formatted_data'),
                     db
                 )
-                if save_success:
+                if content_status == SAVE_UPDATED:
                     logger.info(f"Successfully stored data for notice {notice.id} in PostgreSQL")
 
             # Format output based on requested format
-            return self._format_output(notice, result, output_format)
+            response = self._format_output(notice, result, output_format)
+            response["content_status"] = content_status
+            return response
 
+        except CircuitOpenError as e:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Codal is unavailable: {str(e)}",
+                headers={"Retry-After": str(int(e.retry_after) + 1)}
+            )
         except Exception as e:
             logger.error(f"Error processing financial statement {notice.id}: {str(e)}")
             raise HTTPException(
@@ -202,17 +217,10 @@ class FinancialStatementService:
     ) -> dict:
         """Extract financial statements from multiple notices with PostgreSQL storage"""
 
-        from sqlalchemy import or_
-
         # Get notices that are financial statements
         notices = db.query(StockNotice).filter(
             StockNotice.id.in_(notice_ids),
-            or_(
-                StockNotice.title.ilike('%اطلاعات و صورت های مالی%'),
-                StockNotice.title.ilike('%اطلاعات و صورتهای مالی%'),
-                StockNotice.title.ilike('%صورت های سال مالی%'),
-                StockNotice.title.ilike('%صورتهای سال مالی%')
-            ),
+            StockNotice.is_financial.is_(True),
             StockNotice.html_link.isnot(None)
         ).all()
 
@@ -334,14 +342,12 @@ class FinancialStatementService:
 
                 # Apply symbol filter if provided
                 if symbol_filter:
-                    query = query.filter(StockNotice.symbol.ilike(f"%{symbol_filter}%"))
+                    query = query.filter(company_condition(
+                        db, symbol_filter, StockNotice.company_id, StockNotice.symbol
+                    ))
 
-                # Filter for financial notices using the same patterns
-                financial_conditions = [
-                    StockNotice.title.ilike(f"%{pattern}%")
-                    for pattern in FINANCIAL_PATTERNS
-                ]
-                query = query.filter(or_(*financial_conditions))
+                # Filter for financial notices using the precomputed classification
+                query = query.filter(StockNotice.is_financial.is_(True))
 
                 # If not force refresh, exclude notices that already have financial data
                 if not force_refresh:
@@ -363,6 +369,8 @@ class FinancialStatementService:
                 processed = 0
                 success_count = 0
                 error_count = 0
+                updated_count = 0
+                unchanged_count = 0
 
                 for offset in range(0, total_notices, batch_size):
                     batch = query.offset(offset).limit(batch_size).all()
@@ -375,12 +383,29 @@ class FinancialStatementService:
 
                     # Update counters
                     processed += len(batch)
-                    success_count += sum(1 for r in batch_results if r.get('success'))
-                    error_count += sum(1 for r in batch_results if not r.get('success'))
-
+                    success_count += sum(1 for r in batch_results if r.get('status') == 'success')
+                    error_count += sum(1 for r in batch_results if r.get('status') != 'success')
+                    updated_count += sum(1 for r in batch_results if r.get('content_status') == SAVE_UPDATED)
+                    unchanged_count += sum(1 for r in batch_results if r.get('content_status') == SAVE_UNCHANGED)
+
+                    self.last_bulk_run = {
+                        "force_refresh": force_refresh,
+                        "symbol_filter": symbol_filter,
+                        "total": total_notices,
+                        "processed": processed,
+                        "success": success_count,
+                        "errors": error_count,
+                        "updated": updated_count,
+                        "unchanged": unchanged_count,
+                        "finished": processed >= total_notices,
+                        "updated_at": datetime.now(timezone.utc).isoformat()
+                    }
                     logger.info(f"📈 Progress: {processed}/{total_notices} notices processed")
 
-                logger.info(f"✅ Bulk extraction completed: {success_count} successful, {error_count} errors")
+                logger.info(
+                    f"✅ Bulk extraction completed: {success_count} successful ({updated_count} updated, "
+                    f"{unchanged_count} unchanged), {error_count} errors"
+                )
 
         except Exception as e:
             logger.error(f"❌ Bulk extraction failed: {e}")
@@ -401,7 +426,9 @@ class FinancialStatementService:
 
 
             # Check if it's a financial statement
-            is_financial = any(pattern in notice.title for pattern in FINANCIAL_PATTERNS)
+            is_financial = notice.is_financial
+            if notice.notice_category is None:
+                is_financial = classify_notice(notice.title or "")[1]
 
             if not is_financial:
                 logger.warning(f"Notice {notice_id} is not a financial statement: {notice.title}")
@@ -458,7 +485,7 @@ class FinancialStatementService:
                 logger.info(f"🎯 Processing notice {notice.id}: {notice.symbol} - {notice.title[:100]}...")
 
                 # Create a new database session for this task
-                task_db = next(get_db())
+                task_db = WriterSessionLocal()
 
                 try:
                     # Use this service's get_by_notice_id method
@@ -476,7 +503,8 @@ class FinancialStatementService:
                             "symbol": notice.symbol,
                             "status": "success",
                             "records_count": len(result.get("formatted_data", [])),
-                            "from_database": result.get("from_database", False)
+                            "from_database": result.get("from_database", False),
+                            "content_status": result.get("content_status")
                         }
                     else:
                         logger.warning(f"⚠️ No financial data extracted for notice {notice.id}")
@@ -490,6 +518,16 @@ class FinancialStatementService:
                 finally:
                     task_db.close()
 
+            except HTTPException as e:
+                if e.status_code == 503:
+                    return {"notice_id": notice.id, "symbol": notice.symbol, "status": "deferred"}
+                logger.error(f"❌ Error processing notice {notice.id}: {e.detail}")
+                return {
+                    "notice_id": notice.id,
+                    "symbol": notice.symbol,
+                    "status": "failed",
+                    "error": str(e.detail)
+                }
             except Exception as e:
                 logger.error(f"❌ Error processing notice {notice.id}: {e}")
                 return {
@@ -504,7 +542,15 @@ class FinancialStatementService:
 
         async def extract_with_semaphore(notice: StockNotice):
             async with semaphore:
-                return await extract_single_notice(notice)
+                # Hold queued notices while Decision.aspx is failing instead of burning drivers on timeouts
+                for attempt in range(5):
+                    await wait_for_circuit(DECISION_ENDPOINT)
+                    result = await extract_single_notice(notice)
+                    if result.get("status") != "deferred":
+                        return result
+                    # Refused between the wait and the request: give the probe time to settle
+                    await asyncio.sleep(max(backoff_delay(attempt), get_breaker(DECISION_ENDPOINT).retry_after()))
+                return {"notice_id": notice.id, "symbol": notice.symbol, "status": "failed", "error": "Circuit open"}
 
         # Process all notices concurrently with semaphore control
         tasks = [extract_with_semaphore(notice) for notice in notices]
@@ -0,0 +1,362 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from config.settings import get_settings
+from database import get_db_session
+from models import FinancialStatementData, SymbolStats
+from utils.metric_formulas import NUMERIC_COLUMNS
+from utils.text_utils import DIGIT_TRANSLATION, STATEMENT_DATE_PATTERN, is_amendment_title
+
+logger = logging.getLogger(__name__)
+
+COLUMN_INDEX = {name: index for index, name in enumerate(NUMERIC_COLUMNS)}
+
+AUDITED = "حسابرسی شده"
+
+# Non-numeric fields of a row served with a metrics= selection
+RECORD_FIELDS = ("id", "notice_id", "company_symbol", "company_name", "period_name", "period_order",
+                 "period_type", "audit_status", "period_date")
+
+
+class Categorical:
+    """Integer codes plus the distinct values they stand for"""
+
+    def __init__(self, values: List[Optional[str]]):
+        self.categories: List[Optional[str]] = []
+        lookup = {}
+        codes = np.empty(len(values), dtype=np.int32)
+        for index, value in enumerate(values):
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(self.categories)
+                self.categories.append(value)
+            codes[index] = code
+        self.codes = codes
+
+    def matching(self, predicate) -> np.ndarray:
+        """Boolean mask of rows whose value satisfies the predicate (evaluated once per distinct value)"""
+        accepted = [code for code, value in enumerate(self.categories) if value is not None and predicate(value)]
+        return np.isin(self.codes, accepted)
+
+    def equal_to(self, target: Optional[str]) -> np.ndarray:
+        """Boolean mask of rows equal to target; None matches missing values, like SQL's IS NULL"""
+        accepted = [code for code, value in enumerate(self.categories) if value == target]
+        return np.isin(self.codes, accepted)
+
+    def mapped(self, convert, dtype) -> np.ndarray:
+        """Per-row array of convert(value), evaluated once per distinct value"""
+        table = np.array([convert(value) for value in self.categories], dtype=dtype)
+        return table[self.codes]
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        return self.categories[self.codes[row]]
+
+
+class SymbolFrame:
+    """Columnar financial statement rows for one symbol"""
+
+    def __init__(self, symbol: str, rows: list):
+        self.symbol = symbol
+        self.company_name = rows[-1].company_name if rows else None
+        self.ids = np.array([r.id for r in rows], dtype=np.int64)
+        self.notice_ids = np.array([r.notice_id or 0 for r in rows], dtype=np.int64)
+        self.period_order = np.array([-1 if r.period_order is None else r.period_order for r in rows], dtype=np.int16)
+        self.period_date = Categorical([r.period_date for r in rows])
+        self.period_name = Categorical([r.period_name for r in rows])
+        self.period_type = Categorical([r.period_type for r in rows])
+        self.audit_status = Categorical([r.audit_status for r in rows])
+        self.is_amendment = np.array([is_amendment_title(r.raw_title) for r in rows], dtype=bool)
+        self.is_current = np.array([r.is_current is not False for r in rows], dtype=bool)
+        self.title_date = Categorical([_title_date(r) for r in rows])
+
+        self.values = np.full((len(rows), len(NUMERIC_COLUMNS)), np.nan, dtype=np.float64)
+        for row_index, row in enumerate(rows):
+            for column_index, name in enumerate(NUMERIC_COLUMNS):
+                value = getattr(row, name)
+                if value is not None:
+                    self.values[row_index, column_index] = float(value)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.ids, self.notice_ids, self.period_order, self.is_amendment, self.is_current, self.values,
+                  self.period_date.codes, self.period_name.codes, self.period_type.codes,
+                  self.audit_status.codes, self.title_date.codes)
+        return sum(array.nbytes for array in arrays)
+
+    def record(self, row: int) -> "CachedRecord":
+        return CachedRecord(self, row)
+
+    def select_latest_periods(self, period_type: str, limit: int,
+                              start_date: Optional[str] = None, end_date: Optional[str] = None,
+                              audited_only: bool = True) -> np.ndarray:
+        """Row indices matching /compare: audited, first period column, amendments preferred, newest first"""
+        mask = self.period_type.matching(lambda value: period_type in value) & (self.period_order == 0)
+        if audited_only:
+            mask &= self.audit_status.matching(lambda value: AUDITED in value)
+        if start_date:
+            mask &= self.period_date.matching(lambda value: value >= start_date)
+        if end_date:
+            mask &= self.period_date.matching(lambda value: value <= end_date)
+
+        rows = self._one_per_period(np.flatnonzero(mask))
+        return self._newest_first(rows)[:limit]
+
+    def current_statements(self, audited_only: bool = False) -> np.ndarray:
+        """First-column rows of every period type, one per statement period, amendments preferred"""
+        mask = self.period_order == 0
+        if audited_only:
+            mask &= self.audit_status.matching(lambda value: AUDITED in value)
+        return self._one_per_period(np.flatnonzero(mask))
+
+    def _one_per_period(self, rows: np.ndarray) -> np.ndarray:
+        # Amendments are resolved at write time (services.statement_versions): keep the current version
+        return rows[self.is_current[rows]]
+
+    def comparative_row(self, row: int) -> int:
+        """Row holding the prior-period comparative column of the same statement, or -1"""
+        matches = np.flatnonzero((self.notice_ids == self.notice_ids[row]) & (self.period_order == 1))
+        return int(matches[0]) if len(matches) else -1
+
+    def select_by_period(self, period_type: Optional[str]) -> np.ndarray:
+        """Row indices matching /financial-data: latest row per period_date, oldest period first"""
+        mask = self.period_type.equal_to(period_type) & self.is_current
+        rows = np.flatnonzero(mask)
+        if not len(rows):
+            return rows
+
+        order = np.lexsort((-self.ids[rows], self.period_date.codes[rows]))
+        rows = rows[order]
+        dates = self.period_date.codes[rows]
+        first_in_group = np.ones(len(rows), dtype=bool)
+        first_in_group[1:] = dates[1:] != dates[:-1]
+        return self._newest_first(rows[first_in_group])[::-1]
+
+    def _newest_first(self, rows: np.ndarray) -> np.ndarray:
+        # Sort by the period_date string, descending, missing dates last
+        dates = [self.period_date[row] or "" for row in rows]
+        order = sorted(range(len(rows)), key=lambda i: dates[i], reverse=True)
+        return rows[order]
+
+    def column(self, rows: np.ndarray, name: str) -> np.ndarray:
+        return self.values[rows, COLUMN_INDEX[name]]
+
+
+class CachedRecord:
+    """Attribute view over one cached row, usable wherever a FinancialStatementData row is read"""
+
+    __slots__ = ("_frame", "_row")
+
+    def __init__(self, frame: SymbolFrame, row: int):
+        self._frame = frame
+        self._row = row
+
+    def __getattr__(self, name):
+        frame, row = self._frame, self._row
+        column = COLUMN_INDEX.get(name)
+        if column is not None:
+            value = frame.values[row, column]
+            return None if np.isnan(value) else float(value)
+        if name in ("period_date", "period_name", "period_type", "audit_status"):
+            return getattr(frame, name)[row]
+        if name == "id":
+            return int(frame.ids[row])
+        if name == "notice_id":
+            return int(frame.notice_ids[row])
+        if name == "period_order":
+            return int(frame.period_order[row])
+        if name == "company_symbol":
+            return frame.symbol
+        if name == "company_name":
+            return frame.company_name
+        raise AttributeError(name)
+
+    def to_dict(self, metrics: Optional[List[str]] = None) -> dict:
+        return {
+            **{name: getattr(self, name) for name in RECORD_FIELDS},
+            **{name: getattr(self, name) for name in (metrics or NUMERIC_COLUMNS) if name in COLUMN_INDEX}
+        }
+
+
+def _title_date(row) -> str:
+    # Statement date half of statement_period_key: first date in the title, digits folded
+    match = STATEMENT_DATE_PATTERN.search((row.raw_title or "").translate(DIGIT_TRANSLATION))
+    return match.group(0) if match else (row.period_date or "")
+
+
+def _frame_statement():
+    table = FinancialStatementData.__table__.c
+    return select(
+        table.id, table.notice_id, table.company_symbol, table.company_name, table.raw_title,
+        table.period_date, table.period_name, table.period_type, table.audit_status, table.period_order,
+        table.is_current,
+        *[table[name] for name in NUMERIC_COLUMNS]
+    )
+
+
+class FinancialMetricsCache:
+    """In-process columnar copy of the numeric financial statement columns, one frame per symbol"""
+
+    def __init__(self):
+        self.frames: Dict[str, SymbolFrame] = {}
+        self.data_versions: Dict[str, int] = {}  # symbol_stats.data_version each frame was built at
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.version = 0  # bumped on every change so derived indexes know to rebuild
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _data_versions(db: Session, symbols: Optional[List[str]] = None) -> Dict[str, int]:
+        query = db.query(SymbolStats.symbol, SymbolStats.data_version)
+        if symbols is not None:
+            query = query.filter(SymbolStats.symbol.in_(symbols))
+        return dict(query.all())
+
+    def load_all(self, db: Session):
+        """Build frames for every symbol from one streamed query"""
+        # Versions first: a write landing during the load leaves its symbol looking stale to sync_versions
+        versions = self._data_versions(db)
+        rows_by_symbol: Dict[str, list] = {}
+        result = db.execute(_frame_statement().order_by(FinancialStatementData.company_symbol))
+        for row in result.yield_per(5000):
+            rows_by_symbol.setdefault(row.company_symbol, []).append(row)
+
+        frames = {symbol: SymbolFrame(symbol, rows) for symbol, rows in rows_by_symbol.items() if symbol}
+        with self.lock:
+            self.frames = frames
+            self.data_versions = versions
+            self.loaded = True
+            self.version += 1
+        logger.info(f"📦 Metrics cache loaded {sum(len(f) for f in frames.values())} rows for {len(frames)} symbols")
+
+    def refresh_symbol(self, db: Session, symbol: str):
+        """Reload one symbol's frame after its statement rows changed"""
+        if not symbol:
+            return
+        version = self._data_versions(db, [symbol]).get(symbol)
+        rows = db.execute(
+            _frame_statement().where(FinancialStatementData.company_symbol == symbol)
+        ).all()
+        with self.lock:
+            if rows:
+                self.frames[symbol] = SymbolFrame(symbol, rows)
+            else:
+                self.frames.pop(symbol, None)
+            if version is None:
+                self.data_versions.pop(symbol, None)
+            else:
+                self.data_versions[symbol] = version
+            self.version += 1
+
+    def sync_versions(self, db: Session) -> int:
+        """Reload the frames whose symbol_stats.data_version moved since they were built
+
+        Catches writes made by other worker processes, which only reach this
+        cache through here (or the shared response cache's invalidation channel).
+        """
+        if not self.loaded:
+            return 0
+        current = self._data_versions(db)
+        with self.lock:
+            stale = [symbol for symbol, version in current.items() if self.data_versions.get(symbol) != version]
+            stale += [symbol for symbol in self.frames if symbol not in current]
+        for symbol in stale:
+            self.refresh_symbol(db, symbol)
+        if stale:
+            logger.info(f"📦 Metrics cache reloaded {len(stale)} changed symbols")
+        return len(stale)
+
+    def lookup(self, symbol: str) -> Optional[SymbolFrame]:
+        """Frame for a symbol without touching the database (None if it has no statement rows)"""
+        frame = self.frames.get(symbol)
+        if frame is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return frame
+
+    def stats(self) -> dict:
+        with self.lock:
+            frames = list(self.frames.values())
+        return {
+            "loaded": self.loaded,
+            "symbols": len(frames),
+            "rows": sum(len(frame) for frame in frames),
+            "memory_bytes": sum(frame.nbytes for frame in frames),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+metrics_cache = FinancialMetricsCache()
+
+
+def load_metrics_cache():
+    """Background warm-up; analytics endpoints query the database until this finishes"""
+    try:
+        with get_db_session() as db:
+            metrics_cache.load_all(db)
+    except Exception as e:
+        logger.error(f"❌ Failed to load metrics cache: {e}")
+
+
+def refresh_symbols(symbols: Iterable[str]):
+    """Reload the frames of symbols another worker changed; a no-op until the cache has loaded"""
+    if not metrics_cache.loaded:
+        return
+    symbols = list(symbols)
+    try:
+        with get_db_session() as db:
+            for symbol in symbols:
+                metrics_cache.refresh_symbol(db, symbol)
+    except Exception as e:
+        logger.error(f"❌ Failed to refresh metrics cache for {symbols}: {e}")
+
+
+def sync_metrics_cache():
+    with get_db_session() as db:
+        metrics_cache.sync_versions(db)
+
+
+class MetricsCacheSync:
+    """Periodically reloads frames whose data changed in another process"""
+
+    def __init__(self, settings=None):
+        self.settings = settings or get_settings()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _loop(self):
+        interval = self.settings.metrics_cache_sync_seconds
+        loop = asyncio.get_event_loop()
+
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(None, sync_metrics_cache)
+            except Exception as e:
+                logger.error(f"❌ Metrics cache sync failed: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+metrics_cache_sync = MetricsCacheSync()
@@ -0,0 +1,80 @@
+import logging
+
+from sqlalchemy.orm import Session
+
+from models import StockNotice
+from utils.text_utils import classify_notice, parse_publish_time
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_notice_categories(db: Session, batch_size: int = 5000, reclassify: bool = False) -> dict:
+    """Classify notices that predate the notice_category column (or all of them when reclassify=True)"""
+    last_id = 0
+    scanned = 0
+    changed = 0
+
+    while True:
+        query = db.query(StockNotice.id, StockNotice.title, StockNotice.notice_category, StockNotice.is_financial)
+        if not reclassify:
+            query = query.filter(StockNotice.notice_category.is_(None))
+        rows = query.filter(StockNotice.id > last_id).order_by(StockNotice.id).limit(batch_size).all()
+
+        if not rows:
+            break
+
+        updates = []
+        for row in rows:
+            category, is_financial = classify_notice(row.title or "")
+            if (row.notice_category, row.is_financial) != (category, is_financial):
+                updates.append({"id": row.id, "notice_category": category, "is_financial": is_financial})
+
+        if updates:
+            db.bulk_update_mappings(StockNotice, updates)
+            db.commit()
+
+        scanned += len(rows)
+        changed += len(updates)
+        last_id = rows[-1].id
+
+    result = {"scanned": scanned, "updated": changed}
+    if scanned:
+        logger.info(f"🏷️ Notice category backfill: {result}")
+    return result
+
+
+def backfill_published_at(db: Session, batch_size: int = 5000) -> dict:
+    """Convert publish_time to published_at for notices stored before the column existed"""
+    last_id = 0
+    scanned = 0
+    changed = 0
+
+    while True:
+        rows = db.query(StockNotice.id, StockNotice.publish_time).filter(
+            StockNotice.published_at.is_(None),
+            StockNotice.publish_time.isnot(None),
+            StockNotice.publish_time != "",
+            StockNotice.id > last_id
+        ).order_by(StockNotice.id).limit(batch_size).all()
+
+        if not rows:
+            break
+
+        updates = []
+        for row in rows:
+            published_at = parse_publish_time(row.publish_time)
+            if published_at:
+                updates.append({"id": row.id, "published_at": published_at})
+
+        if updates:
+            db.bulk_update_mappings(StockNotice, updates)
+            db.commit()
+
+        scanned += len(rows)
+        changed += len(updates)
+        last_id = rows[-1].id
+
+    result = {"scanned": scanned, "updated": changed}
+    if scanned:
+        logger.info(f"🕒 published_at backfill: {result}")
+    return result
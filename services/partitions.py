@@ -0,0 +1,231 @@
+import asyncio
+import logging
+from datetime import date
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from config.settings import get_settings
+from database import get_db_session
+from models import FinancialStatementData, StockNotice
+from utils.text_utils import period_year
+
+logger = logging.getLogger(__name__)
+
+# Table -> integer range-partition key (one partition per year)
+PARTITION_KEYS = {
+    StockNotice.__tablename__: "publish_year",
+    FinancialStatementData.__tablename__: "period_year",
+}
+
+
+def current_partition_year(table: str, today: Optional[date] = None) -> int:
+    """This year in the table's calendar: Gregorian for notices, Jalali (from 1 Farvardin ~ 21 March) for statements"""
+    today = today or date.today()
+    if table == StockNotice.__tablename__:
+        return today.year
+    return today.year - (621 if (today.month, today.day) >= (3, 21) else 622)
+
+
+def partition_name(table: str, year: int) -> str:
+    return f"{table}_y{year}"
+
+
+def is_partitioned(db: Session, table: str) -> bool:
+    return bool(db.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :table AND c.relnamespace = 'public'::regnamespace"
+    ), {"table": table}).scalar())
+
+
+def ensure_partitions(db: Session, table: str, years) -> List[str]:
+    """Create the yearly partitions that do not exist yet; the caller commits"""
+    existing = set(db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:table AS regclass)"
+    ), {"table": table}).scalars())
+
+    created = []
+    for year in sorted(set(years)):
+        name = partition_name(table, year)
+        if name in existing:
+            continue
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM ({year}) TO ({year + 1})"
+        ))
+        created.append(name)
+    return created
+
+
+def maintain_partitions(years_ahead: Optional[int] = None) -> Dict[str, List[str]]:
+    """Keep partitions ready for the current and upcoming years of every partitioned table"""
+    years_ahead = get_settings().partition_years_ahead if years_ahead is None else years_ahead
+    created = {}
+    with get_db_session() as db:
+        for table in PARTITION_KEYS:
+            if not is_partitioned(db, table):
+                continue
+            this_year = current_partition_year(table)
+            created[table] = ensure_partitions(db, table, range(this_year, this_year + years_ahead + 1))
+        db.commit()
+
+    if any(created.values()):
+        logger.info(f"🗂️ Partitions created: {created}")
+    return created
+
+
+def backfill_partition_keys(db: Session, batch_size: int = 5000) -> dict:
+    """Fill publish_year / period_year on rows stored before the columns existed"""
+    notices = db.execute(text(
+        "UPDATE stock_notices SET publish_year = EXTRACT(YEAR FROM published_at)::int "
+        "WHERE publish_year = 0 AND published_at IS NOT NULL"
+    )).rowcount
+    db.commit()
+
+    last_id = 0
+    scanned = 0
+    statements = 0
+    while True:
+        rows = db.query(FinancialStatementData.id, FinancialStatementData.period_date).filter(
+            FinancialStatementData.period_year == 0,
+            FinancialStatementData.period_date.isnot(None),
+            FinancialStatementData.id > last_id
+        ).order_by(FinancialStatementData.id).limit(batch_size).all()
+
+        if not rows:
+            break
+
+        updates = [
+            {"id": row.id, "period_year": year} for row in rows if (year := period_year(row.period_date))
+        ]
+        if updates:
+            db.bulk_update_mappings(FinancialStatementData, updates)
+            db.commit()
+
+        scanned += len(rows)
+        statements += len(updates)
+        last_id = rows[-1].id
+
+    result = {"notices": notices, "statements_scanned": scanned, "statements": statements}
+    if notices or statements:
+        logger.info(f"🗂️ Partition key backfill: {result}")
+    return result
+
+
+def convert_to_partitioned(db: Session, table: str, years_ahead: Optional[int] = None) -> dict:
+    """Rebuild a heap table as a yearly range-partitioned table, in one transaction
+
+    The primary key becomes (id, <partition key>); foreign keys pointing at the
+    table are dropped, because Postgres can only reference a partitioned table
+    through a key that includes the partition column. Rows whose key is 0
+    (no parsable date) land in the default partition. Takes an exclusive lock
+    for the duration of the copy, so run it during a maintenance window.
+    """
+    key = PARTITION_KEYS[table]
+    years_ahead = get_settings().partition_years_ahead if years_ahead is None else years_ahead
+    if is_partitioned(db, table):
+        return {"table": table, "converted": False}
+
+    heap = f"{table}_heap"
+    db.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+
+    index_definitions = db.execute(text(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = 'public' AND tablename = :table "
+        "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table AS regclass))"
+    ), {"table": table}).all()
+    own_foreign_keys = db.execute(text(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'"
+    ), {"table": table}).all()
+    referencing_keys = db.execute(text(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+        "WHERE confrelid = CAST(:table AS regclass) AND contype = 'f'"
+    ), {"table": table}).all()
+    columns = db.execute(text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = 'public' AND table_name = :table AND is_generated = 'NEVER' ORDER BY ordinal_position"
+    ), {"table": table}).scalars().all()
+    first_year = db.execute(text(f"SELECT MIN({key}) FROM {table} WHERE {key} > 0")).scalar()
+
+    for referencing_table, constraint in referencing_keys:
+        db.execute(text(f"ALTER TABLE {referencing_table} DROP CONSTRAINT {constraint}"))
+
+    db.execute(text(f"ALTER TABLE {table} RENAME TO {heap}"))
+    db.execute(text(
+        f"CREATE TABLE {table} (LIKE {heap} INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING STORAGE) "
+        f"PARTITION BY RANGE ({key})"
+    ))
+
+    # Years past the horizon (bad dates) and unknown years (0) go to the default partition
+    this_year = current_partition_year(table)
+    first_year = min(first_year or this_year, this_year)
+    partitions = ensure_partitions(db, table, range(first_year, this_year + years_ahead + 1))
+    db.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+
+    column_list = ", ".join(columns)
+    copied = db.execute(text(f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {heap}")).rowcount
+
+    # Keep the id sequence alive when the heap goes
+    sequence = db.execute(text("SELECT pg_get_serial_sequence(:heap, 'id')"), {"heap": heap}).scalar()
+    if sequence:
+        db.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+    db.execute(text(f"DROP TABLE {heap}"))
+
+    # Index and constraint names are free again; definitions were read before the rename
+    db.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {key})"))
+    skipped = []
+    for name, definition in index_definitions:
+        if definition.startswith("CREATE UNIQUE"):
+            skipped.append(name)
+            continue
+        db.execute(text(definition))
+    for name, definition in own_foreign_keys:
+        db.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}"))
+
+    db.commit()
+    result = {
+        "table": table,
+        "converted": True,
+        "rows": copied,
+        "partitions": partitions,
+        "dropped_foreign_keys": [f"{t}.{c}" for t, c in referencing_keys],
+        "skipped_unique_indexes": skipped,
+    }
+    logger.info(f"🗂️ Partitioned {table}: {result}")
+    return result
+
+
+class PartitionMaintainer:
+    """Periodically creates next year's partitions ahead of the first row that needs them"""
+
+    def __init__(self, settings=None):
+        self.settings = settings or get_settings()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _loop(self):
+        interval = self.settings.partition_maintenance_hours * 3600
+        loop = asyncio.get_event_loop()
+
+        while True:
+            try:
+                await loop.run_in_executor(None, maintain_partitions, self.settings.partition_years_ahead)
+            except Exception as e:
+                logger.error(f"❌ Partition maintenance failed: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+partition_maintainer = PartitionMaintainer()
@@ -0,0 +1,316 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+from config.settings import get_settings
+from utils.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+# Tag for answers that depend on every symbol (symbol lists, global counts); dropped by any write
+ALL_SYMBOLS = "*"
+
+
+def cache_key(route: str, **params) -> tuple:
+    """Route plus its query parameters, normalised so equivalent requests share an entry"""
+    normalised = []
+    for name, value in sorted(params.items()):
+        if isinstance(value, str):
+            value = value.strip()
+        elif isinstance(value, (list, tuple)):
+            value = tuple(item.strip() if isinstance(item, str) else item for item in value)
+        normalised.append((name, value))
+    return (route, tuple(normalised))
+
+
+class ResponseCache:
+    """TTL + LRU cache of endpoint responses, tagged by the symbols they were built from
+
+    Writers call invalidate_symbols() after they commit; entries tagged with one
+    of those symbols or with ALL_SYMBOLS are dropped. Entries without tags only
+    expire by TTL. Thread-safe: sync routes run in the threadpool.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 300, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (expires_at, tags, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: tuple) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key: tuple, value: Any, symbols: Iterable[str] = (), ttl_seconds: Optional[float] = None):
+        if not self.enabled:
+            return value
+        expires_at = time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._entries[key] = (expires_at, frozenset(symbols), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate_symbols(self, symbols: Iterable[str]) -> int:
+        """Drop entries built from any of the symbols, plus the cross-symbol ones"""
+        tags = {symbol for symbol in symbols if symbol} | {ALL_SYMBOLS}
+        with self._lock:
+            stale = [key for key, (_, entry_tags, _) in self._entries.items() if entry_tags & tags]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def start(self):
+        """Nothing to listen to: every writer runs in this process"""
+
+    def stop(self):
+        pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "backend": "local",
+            "enabled": self.enabled,
+            "entries": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+_fake_server = None
+
+
+def create_redis_client(url: str):
+    """redis:// and rediss:// use redis-py; fakeredis:// is an in-process stand-in for tests and single-box runs"""
+    global _fake_server
+    if url.startswith("fakeredis://"):
+        import fakeredis
+
+        # One server per process, so every client (and pub/sub) sees the same data
+        if _fake_server is None:
+            _fake_server = fakeredis.FakeServer()
+        return fakeredis.FakeRedis(server=_fake_server)
+
+    import redis
+
+    return redis.Redis.from_url(url)
+
+
+class RedisResponseCache:
+    """ResponseCache shared by every worker through Redis, with a local LRU in front
+
+    Values are stored as JSON under a hash of the cache key; each symbol tag is
+    a Redis set of the keys built from it, so invalidation deletes exactly those
+    keys for all workers at once. Invalidations are also published on a channel
+    so other workers drop their local copies. Redis errors are counted and the
+    request falls back to the database, never to an error response.
+    """
+
+    def __init__(self, client, local: ResponseCache, prefix: str = "codal"):
+        self.client = client
+        self.local = local
+        self.enabled = local.enabled
+        self.ttl_seconds = local.ttl_seconds
+        self.prefix = prefix
+        self.channel = f"{prefix}:cache:invalidate"
+        self._origin = uuid.uuid4().hex
+        self._listener: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.errors = 0
+
+    def _redis_key(self, key: tuple) -> str:
+        return f"{self.prefix}:cache:entry:{hashlib.sha1(repr(key).encode()).hexdigest()}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}:cache:tag:{tag}"
+
+    def get(self, key: tuple) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        try:
+            raw = self.client.get(self._redis_key(key))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Shared cache read failed: {e}")
+            return None
+        if raw is None:
+            self.shared_misses += 1
+            return None
+
+        self.shared_hits += 1
+        entry = json.loads(raw)
+        self.local.set(key, entry["value"], entry["tags"])
+        return entry["value"]
+
+    def set(self, key: tuple, value: Any, symbols: Iterable[str] = (), ttl_seconds: Optional[float] = None):
+        if not self.enabled:
+            return value
+        tags = sorted(set(symbols))
+        ttl = max(1, int(self.ttl_seconds if ttl_seconds is None else ttl_seconds))
+        self.local.set(key, value, tags, ttl_seconds)
+
+        redis_key = self._redis_key(key)
+        try:
+            pipeline = self.client.pipeline()
+            pipeline.setex(redis_key, ttl, dumps({"tags": tags, "value": value}))
+            for tag in tags:
+                pipeline.sadd(self._tag_key(tag), redis_key)
+                pipeline.expire(self._tag_key(tag), ttl)
+            pipeline.execute()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Shared cache write failed: {e}")
+        return value
+
+    def _drop_shared(self, symbols: list) -> int:
+        tag_keys = [self._tag_key(tag) for tag in symbols + [ALL_SYMBOLS]]
+        entry_keys = set()
+        for tag_key in tag_keys:
+            entry_keys.update(self.client.smembers(tag_key))
+        self.client.delete(*tag_keys, *entry_keys)
+        return len(entry_keys)
+
+    def invalidate_symbols(self, symbols: Iterable[str]) -> int:
+        symbols = sorted({symbol for symbol in symbols if symbol})
+        removed = self.local.invalidate_symbols(symbols)
+        try:
+            removed += self._drop_shared(symbols)
+            self.client.publish(self.channel, json.dumps({"origin": self._origin, "symbols": symbols}))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Shared cache invalidation failed: {e}")
+        return removed
+
+    def clear(self):
+        self.local.clear()
+        try:
+            keys = list(self.client.scan_iter(match=f"{self.prefix}:cache:*"))
+            if keys:
+                self.client.delete(*keys)
+            self.client.publish(self.channel, json.dumps({"origin": self._origin, "clear": True}))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Shared cache clear failed: {e}")
+
+    def _listen(self):
+        while not self._stopping.is_set():
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                while not self._stopping.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self._apply(json.loads(message["data"]))
+                pubsub.close()
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Shared cache subscription lost, retrying: {e}")
+                self._stopping.wait(5)
+
+    def _apply(self, event: dict):
+        """Bring this worker up to date with another worker's write
+
+        The metrics cache frames are reloaded before the local entries go, and
+        the shared entries are dropped again afterwards: anything this worker
+        rebuilt from its stale frames in the meantime must not outlive them.
+        """
+        if event.get("origin") == self._origin:
+            return
+        from services.metrics_cache import load_metrics_cache, metrics_cache, refresh_symbols
+
+        if event.get("clear"):
+            if metrics_cache.loaded:
+                load_metrics_cache()
+            self.local.clear()
+            return
+
+        symbols = sorted({symbol for symbol in event.get("symbols", []) if symbol})
+        refresh_symbols(symbols)
+        self.local.invalidate_symbols(symbols)
+        try:
+            self._drop_shared(symbols)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Shared cache invalidation failed: {e}")
+
+    def start(self):
+        if self.enabled and self._listener is None:
+            self._stopping.clear()
+            self._listener = threading.Thread(target=self._listen, name="response-cache-invalidations", daemon=True)
+            self._listener.start()
+
+    def stop(self):
+        if self._listener:
+            self._stopping.set()
+            self._listener.join(timeout=5)
+            self._listener = None
+
+    def stats(self) -> dict:
+        shared_lookups = self.shared_hits + self.shared_misses
+        return {
+            **self.local.stats(),
+            "backend": "redis",
+            "shared_hits": self.shared_hits,
+            "shared_misses": self.shared_misses,
+            "shared_hit_ratio": round(self.shared_hits / shared_lookups, 4) if shared_lookups else None,
+            "errors": self.errors,
+            "listening": self._listener is not None and self._listener.is_alive(),
+        }
+
+
+def _build_cache():
+    settings = get_settings()
+    local = ResponseCache(
+        max_entries=settings.response_cache_max_entries,
+        ttl_seconds=settings.response_cache_ttl_seconds,
+        enabled=settings.response_cache_enabled
+    )
+    if settings.response_cache_backend != "redis":
+        return local
+    return RedisResponseCache(
+        create_redis_client(settings.response_cache_redis_url), local, settings.response_cache_prefix
+    )
+
+
+response_cache = _build_cache()
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+
+from config.settings import get_settings
+from database import get_db_session
+from models import StockNotice
+from services.scraping_service import ultra_fast_scrape
+from services.company_registry import sync_companies
+from utils.text_utils import parse_publish_time
+
+logger = logging.getLogger(__name__)
+
+COMPANY_SYNC_INTERVAL = 24 * 60 * 60
+
+# Codal reporting windows (Gregorian month, day) ranges: the ~30 days after each
+# Persian quarter end (Esfand, Khordad, Shahrivar, Azar) when most filings land
+REPORTING_SEASONS = [
+    ((3, 20), (4, 25)),
+    ((6, 21), (7, 25)),
+    ((9, 22), (10, 25)),
+    ((12, 21), (12, 31)),
+    ((1, 1), (1, 25)),
+]
+
+
+def is_reporting_season(now: Optional[datetime] = None) -> bool:
+    """Check if the given date falls in a Codal reporting season"""
+    now = now or datetime.now()
+    today = (now.month, now.day)
+    return any(start <= today <= end for start, end in REPORTING_SEASONS)
+
+
+class SymbolSchedule:
+    """Refresh state for a single symbol"""
+
+    def __init__(self, symbol: str, base_interval: float, next_run: float):
+        self.symbol = symbol
+        self.base_interval = base_interval  # seconds, learned from filing history
+        self.next_run = next_run  # monotonic timestamp
+        self.empty_runs = 0
+        self.last_run: Optional[float] = None
+        self.last_new_records = 0
+        self.running = False
+
+    def to_dict(self, now: float) -> dict:
+        return {
+            "symbol": self.symbol,
+            "base_interval_minutes": round(self.base_interval / 60, 1),
+            "next_run_in_seconds": max(0, int(self.next_run - now)),
+            "empty_runs": self.empty_runs,
+            "last_new_records": self.last_new_records,
+            "running": self.running
+        }
+
+
+class RefreshScheduler:
+    """In-process scheduler that refreshes each symbol on an adaptive interval"""
+
+    def __init__(self, settings=None):
+        self.settings = settings or get_settings()
+        self.min_interval = self.settings.scheduler_min_interval_minutes * 60
+        self.max_interval = self.settings.scheduler_max_interval_minutes * 60
+        self.executor = ThreadPoolExecutor(max_workers=self.settings.scheduler_max_concurrent)
+        self.semaphore = asyncio.Semaphore(self.settings.scheduler_max_concurrent)
+        self.schedules: Dict[str, SymbolSchedule] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._last_learn = 0.0
+        self._last_company_sync = 0.0
+        self.runs = 0
+        self.failures = 0
+
+    def learn_intervals(self) -> Dict[str, float]:
+        """Derive a base refresh interval per symbol from its recent publish times"""
+        history_size = self.settings.scheduler_history_size
+        dormant_after = timedelta(days=self.settings.scheduler_dormant_days)
+
+        ranked = (
+            func.row_number()
+            .over(partition_by=StockNotice.symbol, order_by=StockNotice.id.desc())
+            .label("rank")
+        )
+
+        with get_db_session() as db:
+            subquery = db.query(
+                StockNotice.symbol,
+                StockNotice.publish_time,
+                ranked
+            ).filter(
+                StockNotice.symbol.isnot(None),
+                StockNotice.symbol != ""
+            ).subquery()
+
+            rows = db.query(subquery.c.symbol, subquery.c.publish_time).filter(
+                subquery.c.rank <= history_size
+            ).all()
+
+        history: Dict[str, List[datetime]] = {}
+        for symbol, publish_time in rows:
+            published = parse_publish_time(publish_time)
+            history.setdefault(symbol, [])
+            if published:
+                history[symbol].append(published)
+
+        now = datetime.now()
+        intervals = {}
+        for symbol, times in history.items():
+            times.sort()
+
+            if not times or now - times[-1] > dormant_after:
+                intervals[symbol] = self.max_interval
+                continue
+
+            gaps = [(b - a).total_seconds() for a, b in zip(times, times[1:]) if b > a]
+            if not gaps:
+                intervals[symbol] = self.max_interval
+                continue
+
+            # Poll a few times per typical gap between filings
+            gaps.sort()
+            median_gap = gaps[len(gaps) // 2]
+            intervals[symbol] = self._clamp(median_gap / 4)
+
+        return intervals
+
+    def _clamp(self, interval: float) -> float:
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def _effective_interval(self, schedule: SymbolSchedule) -> float:
+        """Apply reporting-season speedup and dormant backoff to the base interval"""
+        interval = schedule.base_interval
+        if is_reporting_season():
+            interval *= self.settings.scheduler_season_factor
+        interval *= 2 ** min(schedule.empty_runs, 8)
+        return self._clamp(interval)
+
+    def refresh_schedules(self):
+        """Re-learn intervals and register new symbols with a jittered first run"""
+        intervals = self.learn_intervals()
+        now = time.monotonic()
+
+        for symbol, interval in intervals.items():
+            schedule = self.schedules.get(symbol)
+            if schedule:
+                schedule.base_interval = interval
+            else:
+                # Spread first runs across the whole interval to avoid a startup burst
+                self.schedules[symbol] = SymbolSchedule(
+                    symbol, interval, now + random.uniform(0, self._clamp(interval))
+                )
+
+        for symbol in set(self.schedules) - set(intervals):
+            del self.schedules[symbol]
+
+        self._last_learn = now
+        logger.info(f"📅 Scheduler tracking {len(self.schedules)} symbols")
+
+    def sync_company_registry(self):
+        """Pull incremental changes from Codal's company list"""
+        try:
+            with get_db_session() as db:
+                sync_companies(db)
+        except Exception as e:
+            logger.error(f"❌ Company registry sync failed: {e}")
+
+    async def _run_symbol(self, schedule: SymbolSchedule):
+        async with self.semaphore:
+            schedule.running = True
+            try:
+                loop = asyncio.get_event_loop()
+                result = await loop.run_in_executor(
+                    self.executor, ultra_fast_scrape, schedule.symbol, 1, 1, False
+                )
+                self.runs += 1
+
+                if result and result.get("deferred"):
+                    # Circuit open: keep the slot in the queue until Codal recovers
+                    schedule.next_run = time.monotonic() + result.get("retry_after", 0) + random.uniform(0, 30)
+                    schedule.running = False
+                    return
+
+                new_records = (result or {}).get("new_records", 0)
+                schedule.last_new_records = new_records
+                if result is None:
+                    self.failures += 1
+                    schedule.empty_runs += 1
+                elif new_records:
+                    schedule.empty_runs = 0
+                else:
+                    schedule.empty_runs += 1
+
+            except Exception as e:
+                self.failures += 1
+                schedule.empty_runs += 1
+                logger.error(f"❌ Scheduled refresh failed for {schedule.symbol}: {e}")
+
+            now = time.monotonic()
+            schedule.last_run = now
+            schedule.next_run = now + self._effective_interval(schedule) * random.uniform(0.9, 1.1)
+            schedule.running = False
+
+    async def _loop(self):
+        tick = self.settings.scheduler_tick_seconds
+
+        while True:
+            try:
+                now = time.monotonic()
+                if now - self._last_learn > self.min_interval:
+                    await asyncio.get_event_loop().run_in_executor(self.executor, self.refresh_schedules)
+
+                if now - self._last_company_sync > COMPANY_SYNC_INTERVAL or not self._last_company_sync:
+                    self._last_company_sync = now
+                    asyncio.get_event_loop().run_in_executor(self.executor, self.sync_company_registry)
+
+                # Dispatch the most overdue symbols, never more than the worker pool at once
+                due = sorted(
+                    (s for s in self.schedules.values() if s.next_run <= now and not s.running),
+                    key=lambda s: s.next_run
+                )
+                for schedule in due[:self.settings.scheduler_max_concurrent]:
+                    schedule.running = True
+                    asyncio.create_task(self._run_symbol(schedule))
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Scheduler tick failed: {e}")
+
+            await asyncio.sleep(tick)
+
+    def start(self):
+        if self._task is None:
+            logger.info("🚀 Starting periodic refresh scheduler")
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.executor.shutdown(wait=False)
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        upcoming = sorted(self.schedules.values(), key=lambda s: s.next_run)
+
+        return {
+            "running": self._task is not None,
+            "reporting_season": is_reporting_season(),
+            "tracked_symbols": len(self.schedules),
+            "in_flight": sum(1 for s in self.schedules.values() if s.running),
+            "total_runs": self.runs,
+            "failed_runs": self.failures,
+            "upcoming": [s.to_dict(now) for s in upcoming[:20]]
+        }
+
+
+scheduler = RefreshScheduler()
@@ -1,35 +1,62 @@
 import logging
 import time
 from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
-from database import SessionLocal
+from database import WriterSessionLocal
 from models import StockNotice
 from scraper_selenium import CodalSeleniumScraper
+from services.circuit_breaker import CircuitOpenError, LISTING_ENDPOINT, get_breaker
+from services.company_registry import ensure_company, link_symbol, company_ids_for_symbols
+from services.stats_service import record_changes
+from services.response_cache import response_cache
+from utils.text_utils import classify_notice, parse_publish_time
 
 logger = logging.getLogger(__name__)
 
 content_executor = ThreadPoolExecutor(max_workers=3)
 
 
+def refresh_window(notices):
+    """Stored rows a refresh replaces: the scraped publish-time window, bounded by publish_year so
+    the delete only touches those yearly partitions, plus rows without a parsable publish time"""
+    unparsed = and_(StockNotice.publish_year == 0, StockNotice.published_at.is_(None))
+    published = [notice.published_at for notice in notices if notice.published_at]
+    if not published:
+        return unparsed
+
+    start, end = min(published), max(published)
+    return or_(
+        and_(StockNotice.publish_year.between(start.year, end.year), StockNotice.published_at.between(start, end)),
+        unparsed
+    )
+
+
 def ultra_fast_scrape(symbol: str, start_page: int, end_page: int, force_refresh: bool = False):
     """Ultra-fast background scraping with publish_time duplicate checking"""
     db = None
     scraper = None
     total_start_time = time.time()
 
+    # Defer before touching the database so a refresh never deletes rows it cannot replace
+    listing_breaker = get_breaker(LISTING_ENDPOINT)
+    if listing_breaker.is_open():
+        logger.warning(f"Listing circuit open, deferring scrape for '{symbol}'")
+        return {"symbol": symbol, "deferred": True, "retry_after": listing_breaker.retry_after()}
+
     try:
-        from database import SessionLocal
-        db = SessionLocal()
+        db = WriterSessionLocal()
+
+        # Resolve the symbol through the company registry and work on its id from here on
+        company = ensure_company(db, symbol)
+        symbol = company.symbol
+        link_symbol(db, company)
+        company_filter = StockNotice.company_id == company.id
 
+        existing_count = db.query(StockNotice).filter(company_filter).count()
         if force_refresh:
-            existing_count = db.query(StockNotice).filter(StockNotice.symbol == symbol).count()
-            if existing_count > 0:
-                logger.info(f"REFRESH: Deleting {existing_count} existing records for '{symbol}'")
-                deleted_count = db.query(StockNotice).filter(StockNotice.symbol == symbol).delete()
-                db.commit()
-                logger.info(f"REFRESH: Deleted {deleted_count} records")
+            logger.info(f"REFRESH: {existing_count} existing records for '{symbol}'; the scraped window is replaced")
         else:
-            existing_count = db.query(StockNotice).filter(StockNotice.symbol == symbol).count()
             logger.info(f"APPEND: Found {existing_count} existing records for '{symbol}'")
 
         # Create scraper and get notices
@@ -38,7 +65,7 @@ def ultra_fast_scrape(symbol: str, start_page: int, end_page: int, force_refresh
 
         if not all_notices:
             logger.info(f"No notices found for symbol: {symbol}")
-            return
+            return {"symbol": symbol, "scraped": 0, "new_records": 0, "duplicates": 0}
 
         logger.info(f"Processing {len(all_notices)} notices for database...")
 
@@ -46,13 +73,18 @@ def ultra_fast_scrape(symbol: str, start_page: int, end_page: int, force_refresh
         existing_publish_times = set()
         if not force_refresh:
             existing_records = db.query(StockNotice.publish_time).filter(
-                StockNotice.symbol == symbol,
+                company_filter,
                 StockNotice.publish_time.isnot(None),
                 StockNotice.publish_time != ''
             ).all()
             existing_publish_times = {record[0] for record in existing_records if record[0]}
             logger.info(f"Loaded {len(existing_publish_times)} existing publish_times for duplicate checking")
 
+        # Listing rows can belong to related symbols; link each row to its own company
+        company_ids = company_ids_for_symbols(
+            db, {(n.get('symbol') or symbol).strip()[:100] for n in all_notices}
+        )
+
         # Process notices
         new_notices = []
         duplicates_count = 0
@@ -76,13 +108,21 @@ def ultra_fast_scrape(symbol: str, start_page: int, end_page: int, force_refresh
                     continue
 
                 # Create notice
+                row_symbol = safe_truncate(notice_data.get('symbol', ''), 100)
+                notice_category, is_financial = classify_notice(title)
+                published_at = parse_publish_time(publish_time)
                 db_notice_data = {
-                    'symbol': safe_truncate(notice_data.get('symbol', ''), 100),
+                    'company_id': company_ids.get(row_symbol.strip() or symbol),
+                    'symbol': row_symbol,
                     'company_name': safe_truncate(notice_data.get('company_name', ''), 500),
                     'title': title,
+                    'notice_category': notice_category,
+                    'is_financial': is_financial,
                     'letter_code': '',
                     'send_time': '',
                     'publish_time': safe_truncate(publish_time, 100),
+                    'published_at': published_at,
+                    'publish_year': published_at.year if published_at else 0,
                     'tracking_number': '',
                     'html_link': notice_data.get('detail_link', ''),
                     'has_html': bool(notice_data.get('detail_link')),
@@ -98,14 +138,26 @@ def ultra_fast_scrape(symbol: str, start_page: int, end_page: int, force_refresh
                 logger.error(f"Error processing notice: {e}")
                 continue
 
+        if force_refresh:
+            # Replace only what was re-scraped, in the same transaction as the insert
+            deleted_count = db.query(StockNotice).filter(
+                company_filter, refresh_window(new_notices)
+            ).delete(synchronize_session=False)
+            logger.info(f"REFRESH: Deleted {deleted_count} records")
+
         # Batch insert
         if new_notices:
             logger.info(f"Batch inserting {len(new_notices)} new records...")
             db.add_all(new_notices)
-            db.commit()
+        db.commit()
+
+        if new_notices or force_refresh:
+            changed_symbols = {notice.symbol for notice in new_notices} | {symbol}
+            record_changes(db, changed_symbols)
+            response_cache.invalidate_symbols(changed_symbols)
 
         total_time = time.time() - total_start_time
-        final_count = db.query(StockNotice).filter(StockNotice.symbol == symbol).count()
+        final_count = db.query(StockNotice).filter(company_filter).count()
 
         logger.info(f"ULTRA-FAST scraping completed for '{symbol}' in {total_time:.2f} seconds:")
         logger.info(f"- Total notices scraped: {len(all_notices)}")
@@ -113,6 +165,18 @@ def ultra_fast_scrape(symbol: str, start_page: int, end_page: int, force_refresh
         logger.info(f"- Duplicates skipped: {duplicates_count}")
         logger.info(f"- Final total records: {final_count}")
 
+        return {
+            "symbol": symbol,
+            "scraped": len(all_notices),
+            "new_records": len(new_notices),
+            "duplicates": duplicates_count
+        }
+
+    except CircuitOpenError as e:
+        logger.warning(f"Deferred scraping for '{symbol}': {e}")
+        if db:
+            db.rollback()
+        return {"symbol": symbol, "deferred": True, "retry_after": e.retry_after}
     except Exception as e:
         logger.error(f"Error in ultra-fast scraping: {e}")
         if db:
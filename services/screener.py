@@ -0,0 +1,173 @@
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+
+from services.metrics_cache import metrics_cache, COLUMN_INDEX, NUMERIC_COLUMNS
+from services.timeseries import growth, is_transform, statement_period, universe_series
+from utils.metric_formulas import MetricFormula, lookup_formula
+
+GROWTH_SUFFIX = "_growth"
+
+PREDICATE_PATTERN = re.compile(r"^\s*([A-Za-z_][A-Za-z0-9_]*)\s*(>=|<=|!=|=|>|<)\s*(-?\d+(?:\.\d+)?)\s*$")
+OPERATORS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "=": np.equal,
+    "!=": np.not_equal,
+}
+
+
+class LatestPeriodIndex:
+    """Latest statement row per company for one period type, with its prior-period comparative"""
+
+    def __init__(self, period_type: str, audited_only: bool):
+        self.period_type = period_type
+        self.audited_only = audited_only
+
+        symbols, frames, rows, comparatives = [], [], [], []
+        for symbol, frame in list(metrics_cache.frames.items()):
+            selected = frame.select_latest_periods(period_type, 1, audited_only=audited_only)
+            if not len(selected):
+                continue
+            row = int(selected[0])
+            symbols.append(symbol)
+            frames.append(frame)
+            rows.append(row)
+            comparatives.append(frame.comparative_row(row))
+
+        self.symbols = symbols
+        self.frames = frames
+        self.rows = rows
+        self._calculated: Dict[str, np.ndarray] = {}
+        periods = [statement_period(frame, row) for frame, row in zip(frames, rows)]
+        self.ends = np.array([end for end, _ in periods], dtype=np.int64)
+        self.months = np.array([months for _, months in periods], dtype=np.int64)
+        self.current = np.full((len(symbols), len(NUMERIC_COLUMNS)), np.nan)
+        self.previous = np.full((len(symbols), len(NUMERIC_COLUMNS)), np.nan)
+        for position, (frame, row, comparative) in enumerate(zip(frames, rows, comparatives)):
+            self.current[position] = frame.values[row]
+            if comparative >= 0:
+                self.previous[position] = frame.values[comparative]
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def metric(self, name: str, formulas: Optional[Dict[str, MetricFormula]] = None) -> np.ndarray:
+        """Vector of a direct, growth (<column>_growth, %), time-series (_yoy, _qoq, _ttm, _cagrN) or calculated metric"""
+        if name in COLUMN_INDEX:
+            return self.current[:, COLUMN_INDEX[name]]
+
+        if name.endswith(GROWTH_SUFFIX) and name[:-len(GROWTH_SUFFIX)] in COLUMN_INDEX:
+            column = COLUMN_INDEX[name[:-len(GROWTH_SUFFIX)]]
+            return growth(self.current[:, column], self.previous[:, column])
+
+        if is_transform(name):
+            if name not in self._calculated:
+                self._calculated[name] = universe_series().lookup(self.symbols, self.ends, self.months, name)
+            return self._calculated[name]
+
+        formula = lookup_formula(name, formulas)
+        if formula is not None:
+            if formula.key is None:
+                # Per-request formula: cheap to evaluate, not worth keeping on the shared index
+                return formula.evaluate(lambda column: self.current[:, COLUMN_INDEX[column]])
+            if name not in self._calculated:
+                self._calculated[name] = formula.evaluate(lambda column: self.current[:, COLUMN_INDEX[column]])
+            return self._calculated[name]
+
+        raise HTTPException(status_code=400, detail=f"Unknown metric: {name}")
+
+
+_indexes: Dict[Tuple[str, bool], Tuple[int, LatestPeriodIndex]] = {}
+_indexes_lock = threading.Lock()
+
+
+def latest_period_index(period_type: str, audited_only: bool = True) -> LatestPeriodIndex:
+    """Cached LatestPeriodIndex, rebuilt when the metrics cache changes"""
+    if not metrics_cache.loaded:
+        raise HTTPException(status_code=503, detail="Metrics cache is still loading", headers={"Retry-After": "30"})
+
+    key = (period_type, audited_only)
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached and cached[0] == metrics_cache.version:
+            return cached[1]
+
+    version = metrics_cache.version
+    index = LatestPeriodIndex(period_type, audited_only)
+    with _indexes_lock:
+        _indexes[key] = (version, index)
+    return index
+
+
+def parse_predicates(predicates: List[str]) -> List[Tuple[str, str, float]]:
+    parsed = []
+    for predicate in predicates:
+        match = PREDICATE_PATTERN.match(predicate)
+        if not match:
+            raise HTTPException(status_code=400, detail=f"Invalid predicate: {predicate}")
+        parsed.append((match.group(1), match.group(2), float(match.group(3))))
+    return parsed
+
+
+def screen(
+        predicates: List[str],
+        period_type: str,
+        audited_only: bool = True,
+        metrics: Optional[List[str]] = None,
+        sort_by: Optional[str] = None,
+        descending: bool = True,
+        offset: int = 0,
+        limit: int = 50,
+        formulas: Optional[Dict[str, MetricFormula]] = None
+) -> dict:
+    """Filter the latest period of every company by metric predicates and rank the matches"""
+    parsed = parse_predicates(predicates)
+    index = latest_period_index(period_type, audited_only)
+
+    mask = np.ones(len(index), dtype=bool)
+    for name, operator, value in parsed:
+        # NaN compares False, so companies missing a metric never pass a predicate on it
+        with np.errstate(invalid="ignore"):
+            mask &= OPERATORS[operator](index.metric(name, formulas), value)
+
+    sort_by = sort_by or (parsed[0][0] if parsed else None)
+    matches = np.flatnonzero(mask)
+    if sort_by:
+        keys = index.metric(sort_by, formulas)[matches]
+        keys = np.where(np.isnan(keys), -np.inf if descending else np.inf, keys)
+        order = np.argsort(-keys if descending else keys, kind="stable")
+        matches = matches[order]
+
+    columns = list(dict.fromkeys([name for name, _, _ in parsed] + (metrics or []) + ([sort_by] if sort_by else [])))
+    page = matches[offset:offset + limit]
+    values = {name: index.metric(name, formulas)[page] for name in columns}
+
+    results = []
+    for position, company in enumerate(page):
+        frame, row = index.frames[company], index.rows[company]
+        results.append({
+            "symbol": index.symbols[company],
+            "company_name": frame.company_name,
+            "period_date": frame.period_date[row],
+            "period_name": frame.period_name[row],
+            "audit_status": frame.audit_status[row],
+            "metrics": {
+                name: None if np.isnan(values[name][position]) else float(values[name][position])
+                for name in columns
+            }
+        })
+
+    return {
+        "universe": len(index),
+        "total": int(len(matches)),
+        "offset": offset,
+        "limit": limit,
+        "sort_by": sort_by,
+        "results": results
+    }
@@ -0,0 +1,172 @@
+import csv
+import io
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, func, select, text
+from sqlalchemy.orm import Session
+
+from models import FinancialStatementData, FinancialStatementItem, StockNotice
+from utils.text_utils import normalize_persian
+
+logger = logging.getLogger(__name__)
+
+AUDIT_STATUS_PERIODS = ["حسابرسی شده", "حسابرسی نشده"]
+ITEM_COPY_COLUMNS = ("notice_id", "company_symbol", "period_order", "item_order", "item_key", "item_name", "amount")
+PERIOD_COLUMNS = (
+    "id", "notice_id", "company_symbol", "company_name", "period_name", "period_order",
+    "period_type", "audit_status", "period_date"
+)
+
+
+@lru_cache(maxsize=1)
+def _item_columns() -> Dict[str, str]:
+    """Normalised Persian line name -> wide-table column, so spelling variants share a key"""
+    from utils.financial_utils import ITEM_COLUMN_MAPPING
+
+    return {normalize_persian(name): column for name, column in ITEM_COLUMN_MAPPING.items()}
+
+
+@lru_cache(maxsize=1)
+def _column_names() -> Dict[str, str]:
+    """Wide-table column -> a normalised Persian name, for rows backfilled from the wide table"""
+    names = {}
+    for name, column in _item_columns().items():
+        names.setdefault(column, name)
+    return names
+
+
+def item_key(name: str) -> str:
+    """Stable key for a statement line: the wide column it maps to, else its normalised name"""
+    normalized = normalize_persian(name)
+    return _item_columns().get(normalized, normalized)
+
+
+def build_item_rows(notice: StockNotice, financial_data: dict) -> List[tuple]:
+    """One tuple per (line, period column) with an amount, in ITEM_COPY_COLUMNS order"""
+    periods = financial_data.get('periods', [])
+    rows = []
+    seen = set()
+
+    for item_order, item in enumerate(financial_data.get('items', [])):
+        name = (item.get('name') or '').strip()
+        if not name:
+            continue
+        key = item_key(name)
+        values = item.get('values', [])
+
+        for period_order, period_name in enumerate(periods):
+            if period_name in AUDIT_STATUS_PERIODS or period_order >= len(values):
+                continue
+            amount = values[period_order].get('amount')
+            # A key repeated in one statement (e.g. subtotal lines with the same label) keeps its first line
+            if amount is None or (key, period_order) in seen:
+                continue
+            seen.add((key, period_order))
+            rows.append((notice.id, notice.symbol, period_order, item_order, key, normalize_persian(name), amount))
+
+    return rows
+
+
+def copy_item_rows(db: Session, rows: List[tuple]):
+    """Bulk load item rows with COPY inside the session's transaction"""
+    if not rows:
+        return
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {FinancialStatementItem.__tablename__} ({', '.join(ITEM_COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
+def store_statement_items(db: Session, notice: StockNotice, financial_data: dict) -> int:
+    """Replace the notice's line items; the caller commits"""
+    db.query(FinancialStatementItem).filter(FinancialStatementItem.notice_id == notice.id).delete()
+    rows = build_item_rows(notice, financial_data)
+    copy_item_rows(db, rows)
+    return len(rows)
+
+
+def backfill_items_from_wide(db: Session) -> dict:
+    """Unpivot mapped columns of notices stored before the item table existed (their other lines are gone)"""
+    columns = list(dict.fromkeys(_item_columns().values()))
+    values = ", ".join(
+        f"({order}, '{column}', :name_{order}, f.{column})" for order, column in enumerate(columns)
+    )
+    statement = text(f"""
+        INSERT INTO {FinancialStatementItem.__tablename__} ({', '.join(ITEM_COPY_COLUMNS)})
+        SELECT f.notice_id, f.company_symbol, f.period_order, v.item_order, v.item_key, v.item_name, v.amount
+        FROM {FinancialStatementData.__tablename__} f
+        CROSS JOIN LATERAL (VALUES {values}) AS v(item_order, item_key, item_name, amount)
+        WHERE v.amount IS NOT NULL
+          AND f.notice_id IS NOT NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM {FinancialStatementItem.__tablename__} i WHERE i.notice_id = f.notice_id
+          )
+    """)
+    names = _column_names()
+    inserted = db.execute(statement, {f"name_{order}": names[column] for order, column in enumerate(columns)}).rowcount
+    db.commit()
+
+    result = {"inserted": inserted}
+    if inserted:
+        logger.info(f"📋 Statement item backfill: {result}")
+    return result
+
+
+def pivot_statement(symbol: str, items: Optional[List[str]] = None, period_type: Optional[str] = None,
+                    current_only: bool = True, limit: int = 40):
+    """Wide rows (period columns plus one key per item) rebuilt from the item table"""
+    period_filters = [FinancialStatementData.company_symbol == symbol]
+    if period_type:
+        period_filters.append(FinancialStatementData.period_type == period_type)
+    if current_only:
+        period_filters.append(FinancialStatementData.is_current.is_(True))
+
+    periods = select(
+        *[FinancialStatementData.__table__.c[name] for name in PERIOD_COLUMNS]
+    ).where(and_(*period_filters)).order_by(
+        FinancialStatementData.period_date.desc().nullslast(), FinancialStatementData.period_order
+    ).limit(limit).subquery()
+
+    item_filters = [
+        FinancialStatementItem.notice_id == periods.c.notice_id,
+        FinancialStatementItem.period_order == periods.c.period_order
+    ]
+    if items:
+        item_filters.append(FinancialStatementItem.item_key.in_(items))
+
+    values = select(
+        func.jsonb_object_agg(FinancialStatementItem.item_key, FinancialStatementItem.amount)
+    ).where(and_(*item_filters)).scalar_subquery()
+
+    return select(periods, values.label("item_values")).order_by(
+        periods.c.period_date.desc().nullslast(), periods.c.period_order
+    )
+
+
+def pivot_row_to_dict(row) -> dict:
+    data = {name: getattr(row, name) for name in PERIOD_COLUMNS}
+    data.update({key: float(value) if value is not None else None for key, value in (row.item_values or {}).items()})
+    return data
+
+
+def item_catalog_statement(symbol: Optional[str] = None):
+    """Distinct item keys with how many statement rows carry them"""
+    statement = select(
+        FinancialStatementItem.item_key,
+        func.min(FinancialStatementItem.item_name).label("item_name"),
+        func.count().label("rows")
+    ).group_by(FinancialStatementItem.item_key).order_by(func.count().desc())
+    if symbol:
+        statement = statement.where(FinancialStatementItem.company_symbol == symbol)
+    return statement
@@ -0,0 +1,96 @@
+import logging
+from typing import Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from models import FinancialStatementData
+from utils.text_utils import is_amendment_title, statement_period_key
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_statement_versions(db: Session, symbol: str, period_keys: Optional[Iterable[str]] = None) -> int:
+    """Mark the winning version of each statement current and link the others to it
+
+    A statement (symbol + period_key) may be filed several times: the latest
+    amendment wins, else the latest notice. Every row of the winning notice is
+    current; rows of older versions point at the winning row for the same
+    period column. Returns the number of rows whose flags changed. The caller commits.
+    """
+    query = db.query(
+        FinancialStatementData.id,
+        FinancialStatementData.notice_id,
+        FinancialStatementData.period_key,
+        FinancialStatementData.period_order,
+        FinancialStatementData.raw_title,
+        FinancialStatementData.is_current,
+        FinancialStatementData.superseded_by
+    ).filter(FinancialStatementData.company_symbol == symbol)
+    if period_keys is not None:
+        period_keys = {key for key in period_keys if key}
+        if not period_keys:
+            return 0
+        query = query.filter(FinancialStatementData.period_key.in_(period_keys))
+
+    groups = {}
+    for row in query.all():
+        groups.setdefault(row.period_key, []).append(row)
+
+    updates = []
+    for rows in groups.values():
+        winner = max(rows, key=lambda r: (is_amendment_title(r.raw_title), r.notice_id or 0))
+        winner_rows = {r.period_order: r.id for r in rows if r.notice_id == winner.notice_id}
+
+        for row in rows:
+            if row.notice_id == winner.notice_id:
+                current, superseded_by = True, None
+            else:
+                current, superseded_by = False, winner_rows.get(row.period_order, winner.id)
+            if (row.is_current, row.superseded_by) != (current, superseded_by):
+                updates.append({"id": row.id, "is_current": current, "superseded_by": superseded_by})
+
+    if updates:
+        db.bulk_update_mappings(FinancialStatementData, updates)
+    return len(updates)
+
+
+def backfill_statement_versions(db: Session, batch_size: int = 5000) -> dict:
+    """Derive period_key for rows stored before the column existed, then resolve their symbols"""
+    last_id = 0
+    scanned = 0
+    symbols = set()
+
+    while True:
+        rows = db.query(
+            FinancialStatementData.id,
+            FinancialStatementData.company_symbol,
+            FinancialStatementData.period_type,
+            FinancialStatementData.raw_title,
+            FinancialStatementData.period_date
+        ).filter(
+            FinancialStatementData.period_key.is_(None),
+            FinancialStatementData.id > last_id
+        ).order_by(FinancialStatementData.id).limit(batch_size).all()
+
+        if not rows:
+            break
+
+        db.bulk_update_mappings(FinancialStatementData, [
+            {"id": row.id, "period_key": statement_period_key(row.period_type, row.raw_title, row.period_date)}
+            for row in rows
+        ])
+        db.commit()
+
+        symbols.update(row.company_symbol for row in rows if row.company_symbol)
+        scanned += len(rows)
+        last_id = rows[-1].id
+
+    changed = 0
+    for symbol in symbols:
+        changed += resolve_statement_versions(db, symbol)
+        db.commit()
+
+    result = {"scanned": scanned, "symbols": len(symbols), "updated": changed}
+    if scanned:
+        logger.info(f"🧾 Statement version backfill: {result}")
+    return result
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+from typing import Iterable, Optional
+
+from sqlalchemy import func, distinct, and_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from config.settings import get_settings
+from database import get_db_session
+from models import StockNotice, FinancialStatementData, SymbolStats, StatsSnapshot
+from utils.text_utils import FINANCIAL_CATEGORIES
+
+logger = logging.getLogger(__name__)
+
+NOTICES_SNAPSHOT = "notices"
+FINANCIAL_SUMMARY_SNAPSHOT = "financial_summary"
+
+
+def _eligible_condition():
+    return and_(StockNotice.notice_category.in_(FINANCIAL_CATEGORIES), StockNotice.html_link.isnot(None))
+
+
+def refresh_symbol_stats(db: Session, symbols: Optional[Iterable[str]] = None) -> int:
+    """Recompute symbol_stats rows for the given symbols (all symbols when None)"""
+    if symbols is not None:
+        symbols = {s for s in symbols if s}
+        if not symbols:
+            return 0
+
+    def scoped(query, column):
+        return query.filter(column.in_(symbols)) if symbols is not None else query
+
+    notice_rows = scoped(db.query(
+        StockNotice.symbol,
+        func.max(StockNotice.company_id).label("company_id"),
+        func.count(StockNotice.id).label("total"),
+        func.count(StockNotice.id).filter(StockNotice.is_financial.is_(True)).label("financial"),
+        func.count(StockNotice.id).filter(_eligible_condition()).label("eligible"),
+        func.max(StockNotice.id).label("last_id")
+    ), StockNotice.symbol).group_by(StockNotice.symbol).all()
+
+    processed = dict(scoped(db.query(
+        StockNotice.symbol,
+        func.count(distinct(FinancialStatementData.notice_id))
+    ).join(
+        FinancialStatementData, FinancialStatementData.notice_id == StockNotice.id
+    ).filter(_eligible_condition()), StockNotice.symbol).group_by(StockNotice.symbol).all())
+
+    records = dict(scoped(db.query(
+        FinancialStatementData.company_symbol,
+        func.count(FinancialStatementData.id)
+    ), FinancialStatementData.company_symbol).group_by(FinancialStatementData.company_symbol).all())
+
+    last_ids = [row.last_id for row in notice_rows]
+    publish_times = dict(
+        db.query(StockNotice.id, StockNotice.publish_time).filter(StockNotice.id.in_(last_ids)).all()
+    ) if last_ids else {}
+
+    values = [
+        {
+            "symbol": row.symbol,
+            "company_id": row.company_id,
+            "total_notices": row.total,
+            "financial_notices": row.financial,
+            "eligible_notices": row.eligible,
+            "processed_notices": processed.get(row.symbol, 0),
+            "statement_records": records.get(row.symbol, 0),
+            "last_notice_id": row.last_id,
+            "last_publish_time": publish_times.get(row.last_id)
+        }
+        for row in notice_rows if row.symbol
+    ]
+
+    for start in range(0, len(values), 500):
+        statement = insert(SymbolStats).values(values[start:start + 500])
+        statement = statement.on_conflict_do_update(
+            index_elements=[SymbolStats.symbol],
+            set_={
+                **{column: statement.excluded[column] for column in values[0] if column != "symbol"},
+                "updated_at": func.now()
+            }
+        )
+        db.execute(statement)
+
+    # Symbols whose notices are all gone
+    stale = db.query(SymbolStats).filter(SymbolStats.symbol.notin_([v["symbol"] for v in values]))
+    if symbols is not None:
+        stale = stale.filter(SymbolStats.symbol.in_(symbols))
+    stale.delete(synchronize_session=False)
+
+    db.commit()
+    return len(values)
+
+
+def _store_snapshot(db: Session, name: str, payload: dict):
+    statement = insert(StatsSnapshot).values(name=name, payload=payload)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[StatsSnapshot.name],
+        set_={"payload": statement.excluded.payload, "refreshed_at": func.now()}
+    ))
+    db.commit()
+
+
+def refresh_notice_snapshot(db: Session) -> dict:
+    """Roll the per-symbol counters up into the global notice totals"""
+    totals = db.query(
+        func.coalesce(func.sum(SymbolStats.total_notices), 0),
+        func.coalesce(func.sum(SymbolStats.financial_notices), 0),
+        func.count(SymbolStats.symbol).filter(SymbolStats.financial_notices > 0),
+        func.coalesce(func.sum(SymbolStats.eligible_notices), 0),
+        func.coalesce(func.sum(SymbolStats.processed_notices), 0),
+        func.coalesce(func.sum(SymbolStats.statement_records), 0)
+    ).one()
+    latest = db.query(SymbolStats.last_publish_time).order_by(
+        SymbolStats.last_notice_id.desc().nullslast()
+    ).first()
+
+    payload = {
+        "all_notices": int(totals[0]),
+        "financial_notices": int(totals[1]),
+        "active_companies": int(totals[2]),
+        "eligible_notices": int(totals[3]),
+        "processed_notices": int(totals[4]),
+        "statement_records": int(totals[5]),
+        "last_update": latest[0] if latest else None
+    }
+    _store_snapshot(db, NOTICES_SNAPSHOT, payload)
+    return payload
+
+
+def refresh_financial_summary(db: Session) -> dict:
+    """Recompute the /financial-statement/stats payload"""
+    from utils.financial_utils import get_financial_summary_stats
+
+    payload = get_financial_summary_stats(db)
+    _store_snapshot(db, FINANCIAL_SUMMARY_SNAPSHOT, payload)
+    return payload
+
+
+def bump_data_versions(db: Session, symbols: Optional[Iterable[str]] = None) -> int:
+    """Invalidate the ETags of the symbols' data (all symbols when None)"""
+    query = db.query(SymbolStats)
+    if symbols is not None:
+        query = query.filter(SymbolStats.symbol.in_({s for s in symbols if s}))
+    bumped = query.update({
+        SymbolStats.data_version: SymbolStats.data_version + 1,
+        SymbolStats.data_changed_at: func.now()
+    }, synchronize_session=False)
+    db.commit()
+    return bumped
+
+
+def record_changes(db: Session, symbols: Iterable[str]):
+    """Called by the insert paths after writing notices or statement rows for some symbols"""
+    symbols = set(symbols)
+    try:
+        refresh_symbol_stats(db, symbols)
+        bump_data_versions(db, symbols)
+        refresh_notice_snapshot(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"❌ Failed to update statistics for {symbols}: {e}")
+
+
+def read_snapshot(db: Session, name: str) -> dict:
+    """Read a precomputed snapshot, building it on first use"""
+    snapshot = db.query(StatsSnapshot).filter(StatsSnapshot.name == name).first()
+    if snapshot:
+        return _snapshot_payload(snapshot)
+
+    if name == NOTICES_SNAPSHOT:
+        if not db.query(SymbolStats.symbol).first():
+            refresh_symbol_stats(db)
+        payload = refresh_notice_snapshot(db)
+    else:
+        payload = refresh_financial_summary(db)
+    return {**payload, "refreshed_at": None}
+
+
+def _snapshot_payload(snapshot: StatsSnapshot) -> dict:
+    return {**snapshot.payload, "refreshed_at": snapshot.refreshed_at.isoformat() if snapshot.refreshed_at else None}
+
+
+async def read_snapshot_async(db: AsyncSession, name: str) -> dict:
+    """read_snapshot for async sessions"""
+    snapshot = await db.scalar(select(StatsSnapshot).where(StatsSnapshot.name == name))
+    if snapshot:
+        return _snapshot_payload(snapshot)
+
+    # The async session may point at a read replica: build the missing snapshot on the primary
+    def build():
+        with get_db_session() as primary:
+            return read_snapshot(primary, name)
+
+    return await asyncio.get_event_loop().run_in_executor(None, build)
+
+
+def refresh_all():
+    """Full rebuild: corrects any drift from writes that bypassed the insert paths"""
+    with get_db_session() as db:
+        symbols = refresh_symbol_stats(db)
+        refresh_notice_snapshot(db)
+        refresh_financial_summary(db)
+    logger.info(f"📊 Statistics refreshed for {symbols} symbols")
+
+
+class StatsRefresher:
+    """Periodically rebuilds the statistics tables in the background"""
+
+    def __init__(self, settings=None):
+        self.settings = settings or get_settings()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _loop(self):
+        interval = self.settings.stats_refresh_seconds
+        loop = asyncio.get_event_loop()
+
+        while True:
+            try:
+                await loop.run_in_executor(None, refresh_all)
+            except Exception as e:
+                logger.error(f"❌ Statistics refresh failed: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+stats_refresher = StatsRefresher()
@@ -0,0 +1,252 @@
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.metrics_cache import metrics_cache, SymbolFrame, COLUMN_INDEX
+from utils.metric_formulas import TRANSFORM_PATTERN
+from utils.text_utils import DIGIT_TRANSLATION, STATEMENT_DATE_PATTERN
+
+# Months covered by each cumulative statement type
+PERIOD_MONTHS = {"3 ماهه": 3, "6 ماهه": 6, "9 ماهه": 9, "سال مالی": 12}
+PERIOD_END_PATTERN = re.compile(r"^(\d{4})[/-](\d{1,2})")
+
+PERCENT_TRANSFORMS = ("yoy", "qoq", "cagr")
+
+
+def parse_transform(name: str) -> Optional[Tuple[str, str, int]]:
+    """(column, transform, years) for names like net_profit_yoy or operating_revenue_cagr5, else None"""
+    match = TRANSFORM_PATTERN.match(name)
+    if not match or match.group("column") not in COLUMN_INDEX:
+        return None
+    if match.group("years") is None:
+        return match.group("column"), match.group("transform"), 0
+    years = int(match.group("years"))
+    return (match.group("column"), "cagr", years) if years >= 1 else None
+
+
+def is_transform(name: str) -> bool:
+    return parse_transform(name) is not None
+
+
+def format_transform(name: str, value: Optional[float]) -> str:
+    if value is None:
+        return "N/A"
+    _, transform, _ = parse_transform(name)
+    return f"{value:.2f}%" if transform in PERCENT_TRANSFORMS else f"{value:,.0f}"
+
+
+def growth(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    """Percent change, NaN where the base is missing or zero"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = (current - previous) / np.abs(previous) * 100
+    result[~np.isfinite(result)] = np.nan
+    return result
+
+
+def _period_end(value: Optional[str]) -> int:
+    """Month index (year * 12 + month - 1) of a 'YYYY/MM/DD' period end, -1 when unparseable"""
+    match = PERIOD_END_PATTERN.match(value or "")
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        return -1
+    return int(match.group(1)) * 12 + int(match.group(2)) - 1
+
+
+def _column_end(period_name: Optional[str]) -> int:
+    """Month index of the date in a column header such as '... منتهی به ۱۴۰۱/۱۲/۲۹', -1 when it has none"""
+    match = STATEMENT_DATE_PATTERN.search((period_name or "").translate(DIGIT_TRANSLATION))
+    return _period_end(match.group(0)) if match else -1
+
+
+def _column_months(period_name: Optional[str]) -> int:
+    folded = (period_name or "").translate(DIGIT_TRANSLATION)
+    return next((months for label, months in PERIOD_MONTHS.items() if label in folded), 0)
+
+
+def _keys(symbols: np.ndarray, ends: np.ndarray, months: np.ndarray) -> np.ndarray:
+    symbols, ends, months = (np.asarray(array, dtype=np.int64) for array in (symbols, ends, months))
+    return (symbols << 24) | (ends << 4) | months
+
+
+def _frame_periods(frame: SymbolFrame, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Period end and months covered by each row's own column
+
+    period_date is the statement's date for every column of a notice, so only
+    the first column can be keyed by it; comparative columns use the date in
+    their header, or one year before the statement when the header has none.
+    """
+    order = frame.period_order[rows]
+    statement_ends = frame.title_date.mapped(_period_end, np.int64)[rows]
+    statement_months = frame.period_type.mapped(lambda value: PERIOD_MONTHS.get(value, 0), np.int64)[rows]
+    column_ends = frame.period_name.mapped(_column_end, np.int64)[rows]
+    column_months = frame.period_name.mapped(_column_months, np.int64)[rows]
+
+    prior_year = np.where((order == 1) & (statement_ends >= 0), statement_ends - 12, -1)
+    ends = np.where(order == 0, statement_ends, np.where(column_ends >= 0, column_ends, prior_year))
+    months = np.where((order != 0) & (column_months > 0), column_months, statement_months)
+    return ends, months
+
+
+class _SortedIndex:
+    """Sorted int64 keys with vectorised exact-match lookup"""
+
+    def __init__(self, keys: np.ndarray):
+        self.keys = keys
+
+    def positions(self, keys: np.ndarray) -> np.ndarray:
+        if not len(self.keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[positions] == keys, positions, -1)
+
+
+def _take(values: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    result = np.full(len(positions), np.nan)
+    found = positions >= 0
+    result[found] = values[positions[found]]
+    return result
+
+
+class PeriodSeries:
+    """Cumulative statements of many symbols keyed by (symbol, period end, months covered)
+
+    Every transform is computed for all rows at once by looking up the shifted
+    keys (same symbol, earlier period end) in the sorted key array. Comparative
+    columns fill the periods no statement of their own covers, so the oldest
+    filed year still has a base to grow from.
+    """
+
+    def __init__(self, frames: List[SymbolFrame]):
+        self.symbol_codes = {frame.symbol: code for code, frame in enumerate(frames)}
+
+        parts = []
+        for code, frame in enumerate(frames):
+            rows = np.flatnonzero(frame.is_current & (frame.period_order >= 0))
+            ends, months = _frame_periods(frame, rows)
+            valid = (ends >= 0) & (months > 0)
+            rows = rows[valid]
+            parts.append((
+                np.full(len(rows), code, dtype=np.int64), ends[valid], months[valid], frame.values[rows],
+                frame.period_order[rows] != 0, frame.is_amendment[rows], frame.notice_ids[rows]
+            ))
+
+        if parts:
+            symbols, ends, months, values, comparatives, amendments, notice_ids = (
+                np.concatenate(p) for p in zip(*parts)
+            )
+        else:
+            symbols = ends = months = notice_ids = np.empty(0, dtype=np.int64)
+            comparatives = amendments = np.empty(0, dtype=bool)
+            values = np.empty((0, len(COLUMN_INDEX)))
+
+        # Several rows for one period collapse to one key: the statement's own first column over
+        # a later statement's comparative, then the amendment, then the newest notice
+        keys = _keys(symbols, ends, months)
+        order = np.lexsort((-notice_ids, ~amendments, comparatives, keys))
+        keys = keys[order]
+        unique = np.ones(len(keys), dtype=bool)
+        unique[1:] = keys[1:] != keys[:-1]
+        order = order[unique]
+
+        self.symbols = symbols[order]
+        self.ends = ends[order]
+        self.months = months[order]
+        self.values = values[order]
+        self.index = _SortedIndex(keys[unique])
+        self._computed: Dict[str, np.ndarray] = {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def _shifted(self, column: int, months_back, months) -> np.ndarray:
+        """Column value of the statement ending months_back earlier and covering `months` months"""
+        keys = _keys(self.symbols, self.ends - months_back, months)
+        return _take(self.values[:, column], self.index.positions(keys))
+
+    def yoy(self, column: int) -> np.ndarray:
+        return growth(self.values[:, column], self._shifted(column, 12, self.months))
+
+    def ttm(self, column: int) -> np.ndarray:
+        """YTD + last fiscal year - prior YTD; the annual statement itself for 12-month rows"""
+        current = self.values[:, column]
+        last_year = self._shifted(column, self.months, 12)
+        prior_ytd = self._shifted(column, 12, self.months)
+        return np.where(self.months == 12, current, current + last_year - prior_ytd)
+
+    def quarter(self, column: int) -> np.ndarray:
+        """Discrete three-month value: difference of consecutive cumulative statements"""
+        current = self.values[:, column]
+        previous = self._shifted(column, 3, self.months - 3)
+        return np.where(self.months == 3, current, current - previous)
+
+    def qoq(self, column: int) -> np.ndarray:
+        quarters = self.quarter(column)
+        found = ~np.isnan(quarters)
+
+        # Any statement ending at a date yields that date's quarter: index them by (symbol, end)
+        keys = _keys(self.symbols[found], self.ends[found], np.zeros(found.sum(), dtype=np.int64))
+        order = np.argsort(keys, kind="stable")
+        index = _SortedIndex(keys[order])
+        values = quarters[found][order]
+
+        previous_keys = _keys(self.symbols, self.ends - 3, np.zeros(len(self), dtype=np.int64))
+        return growth(quarters, _take(values, index.positions(previous_keys)))
+
+    def cagr(self, column: int, years: int) -> np.ndarray:
+        current = self.values[:, column]
+        base = self._shifted(column, 12 * years, 12)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = (np.power(current / base, 1.0 / years) - 1) * 100
+        result[(self.months != 12) | ~(current > 0) | ~(base > 0)] = np.nan
+        return result
+
+    def metric(self, name: str) -> np.ndarray:
+        """Values of a column or transform for every row of the series"""
+        if name in COLUMN_INDEX:
+            return self.values[:, COLUMN_INDEX[name]]
+
+        if name not in self._computed:
+            column, transform, years = parse_transform(name)
+            column = COLUMN_INDEX[column]
+            if transform == "cagr":
+                self._computed[name] = self.cagr(column, years)
+            else:
+                self._computed[name] = getattr(self, transform)(column)
+        return self._computed[name]
+
+    def values_for(self, frame: SymbolFrame, rows: np.ndarray, name: str) -> np.ndarray:
+        """Metric values aligned with the given frame rows (NaN where the row's period is not in the series)"""
+        ends, months = _frame_periods(frame, rows)
+        return self.lookup([frame.symbol] * len(rows), ends, months, name)
+
+    def lookup(self, symbols: List[str], ends: np.ndarray, months: np.ndarray, name: str) -> np.ndarray:
+        """Metric values at arbitrary (symbol, period end, months) points"""
+        codes = np.array([self.symbol_codes.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+        valid = (codes >= 0) & (ends >= 0) & (months > 0)
+        positions = np.where(valid, self.index.positions(_keys(np.maximum(codes, 0), ends, months)), -1)
+        return _take(self.metric(name), positions)
+
+
+def statement_period(frame: SymbolFrame, row: int) -> Tuple[int, int]:
+    """(period end month index, months covered) of one frame row, (-1, 0) when unknown"""
+    ends, months = _frame_periods(frame, np.array([row]))
+    return int(ends[0]), int(months[0])
+
+
+_universe: Optional[Tuple[int, PeriodSeries]] = None
+_universe_lock = threading.Lock()
+
+
+def universe_series() -> PeriodSeries:
+    """PeriodSeries over every cached symbol, rebuilt when the metrics cache changes"""
+    global _universe
+    with _universe_lock:
+        if _universe and _universe[0] == metrics_cache.version:
+            return _universe[1]
+
+    version = metrics_cache.version
+    series = PeriodSeries(list(metrics_cache.frames.values()))
+    with _universe_lock:
+        _universe = (version, series)
+    return series
@@ -1,4 +1,5 @@
 from models import FinancialStatementData
+from utils.number_format import format_amount
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,7 +16,7 @@ def extract_metric_value(record: FinancialStatementData, metric: str) -> tuple:
         # Direct column access
         if hasattr(record, metric):
             numeric_value = getattr(record, metric)
-            formatted_value = getattr(record, f"{metric}_fmt", None)
+            formatted_value = format_amount(numeric_value) if numeric_value is not None else None
 
             return numeric_value, formatted_value
 
@@ -54,9 +55,8 @@ def calculate_metric(record: FinancialStatementData, metric: str) -> tuple:
                 margin = (float(record.operating_profit) / float(record.operating_revenue)) * 100
                 return margin, f"{margin:.2f}%"
 
-        elif metric == "calculated_revenue_growth":  # Would need previous period data
-            # This would require comparing with previous period
-            # Implementation depends on your specific needs
+        elif metric == "calculated_revenue_growth":  # Needs the previous period, not just this row
+            # Served by services.timeseries as operating_revenue_yoy / operating_revenue_qoq
             pass
 
         elif metric == "calculated_total_income":  # Combined income
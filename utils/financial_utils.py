@@ -1,11 +1,21 @@
+import hashlib
+import json
 import re
 from typing import Tuple
 from sqlalchemy.orm import Session
 import logging
-from sqlalchemy import func, and_, or_, distinct
+from sqlalchemy import func, and_, distinct, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import FinancialStatementData, StockNotice
-from typing import Dict, Optional, Tuple, List, Any
-from utils.text_utils import extract_period_type
+from typing import Dict, Optional, List, Any
+from utils.text_utils import extract_period_type, statement_period_key, period_year, normalize_persian
+from services.company_registry import company_condition, company_condition_async
+from services.stats_service import record_changes
+from services.metrics_cache import metrics_cache
+from services.response_cache import cache_key, response_cache
+from services.statement_versions import resolve_statement_versions
+from services.statement_items import store_statement_items
+from utils.number_format import format_amount
 
 import asyncio
 
@@ -176,6 +186,30 @@ ITEM_COLUMN_MAPPING = {
     "سرمايه": "capital"
 }
 
+# Outcomes of save_financial_data
+SAVE_UPDATED = "updated"
+SAVE_UNCHANGED = "unchanged"
+
+# Part of every content hash, so changing the mapping makes the next refresh rewrite the rows
+_MAPPING_FINGERPRINT = hashlib.sha256(
+    json.dumps(sorted(ITEM_COLUMN_MAPPING.items()), ensure_ascii=False).encode()
+).hexdigest()
+
+
+def statement_content_hash(financial_data: dict) -> str:
+    """SHA-256 of the normalised table: period headers, line names and amounts, in order"""
+    payload = {
+        "mapping": _MAPPING_FINGERPRINT,
+        "periods": [normalize_persian(str(period or '')) for period in financial_data.get('periods', [])],
+        "items": [
+            [normalize_persian(item.get('name') or ''), [value.get('amount') for value in item.get('values', [])]]
+            for item in financial_data.get('items', [])
+        ]
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
 def extract_period_info(title: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
     """Extract period type, audit status, and date from title"""
 
@@ -227,6 +261,10 @@ def extract_period_info(title: str) -> Tuple[Optional[str], Optional[str], Optio
 
 def get_stored_financial_data(notice_id: int, db: Session) -> Optional[dict]:
     """Get stored financial data from wide table and reconstruct JSON format"""
+    key = cache_key("stored-statement", notice_id=notice_id)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
 
     try:
         # Get all period records for this notice
@@ -243,7 +281,8 @@ def get_stored_financial_data(notice_id: int, db: Session) -> Optional[dict]:
         # Reconstruct the JSON format
         formatted_data = reconstruct_financial_json_from_wide_table(records)
 
-        return {
+        # Invalidated with the symbol when save_financial_data rewrites the notice
+        return response_cache.set(key, {
             "notice_id": first_record.notice_id,
             "symbol": first_record.company_symbol,
             "company_name": first_record.company_name,
@@ -256,7 +295,7 @@ def get_stored_financial_data(notice_id: int, db: Session) -> Optional[dict]:
             "extraction_date": first_record.extraction_date.isoformat() if first_record.extraction_date else None,
             "from_database": True,
             "sheet_name": first_record.sheet_name or "صورت سود و زیان"
-        }
+        }, [first_record.company_symbol])
 
     except Exception as e:
         logger.error(f"Error getting stored data for notice {notice_id}: {str(e)}")
@@ -287,7 +326,7 @@ def reconstruct_financial_json_from_wide_table(records: List[FinancialStatementD
                 if record.period_name and record.period_name not in ["حسابرسی شده", "حسابرسی نشده"]:
                     # Get amount and formatted value
                     amount = getattr(record, column_name, None)
-                    formatted_value = getattr(record, f"{column_name}_fmt", "۰")
+                    formatted_value = format_amount(amount)
 
                     values_list.append({
                         "amount": float(amount) if amount else None,
@@ -531,11 +570,21 @@ async def save_financial_data(
         notice: StockNotice,
         financial_data: dict,
         db: Session
-) -> bool:
-    """Save financial data to wide PostgreSQL table"""
+) -> Optional[str]:
+    """Save financial data to wide PostgreSQL table
+
+    Returns SAVE_UPDATED, SAVE_UNCHANGED when the stored rows already hold this
+    exact table (nothing is written), or None on failure.
+    """
 
     try:
+        content_hash = statement_content_hash(financial_data)
+        if notice.statement_hash == content_hash and check_data_exists(notice.id, db):
+            logger.info(f"Notice {notice.id} unchanged since its last extraction, keeping stored rows")
+            return SAVE_UNCHANGED
+
         period_type, audit_status, period_date = extract_period_info(notice.title)
+        period_key = statement_period_key(period_type, notice.title, period_date)
 
         # Delete existing records for this notice
         db.query(FinancialStatementData).filter(
@@ -590,6 +639,7 @@ async def save_financial_data(
             # Create base record for this period
             record_data = {
                 'notice_id': notice.id,
+                'company_id': notice.company_id,
                 'company_symbol': notice.symbol,
                 'company_name': notice.company_name,
                 'raw_title': notice.title,
@@ -597,8 +647,10 @@ async def save_financial_data(
                 'period_type': period_type,
                 'audit_status': audit_status,
                 'period_date': period_date,
+                'period_year': period_year(period_date),
                 'period_name': period_name,
-                'period_order': period_index
+                'period_order': period_index,
+                'period_key': period_key
             }
 
             # Add all item values as columns using EXACT MATCH
@@ -611,17 +663,15 @@ async def save_financial_data(
                     if period_index < len(values):
                         value_data = values[period_index]
                         amount = value_data.get('amount')
-                        formatted = value_data.get('formatted', '۰')
 
+                        # Display text is derived from the amount at read time (utils.number_format)
                         record_data[column_name] = amount
-                        record_data[f"{column_name}_fmt"] = formatted
 
                         # DEBUG: Log important fields
                         if column_name in ['other_income', 'non_operating_income']:
-                            logger.info(f"  📊 {exact_persian_name} -> {column_name} = {amount} ({formatted})")
+                            logger.info(f"  📊 {exact_persian_name} -> {column_name} = {amount}")
                     else:
                         record_data[column_name] = None
-                        record_data[f"{column_name}_fmt"] = '۰'
 
             # Create record
             record = FinancialStatementData(**record_data)
@@ -630,15 +680,27 @@ async def save_financial_data(
         # Batch insert all records
         if records_to_insert:
             db.add_all(records_to_insert)
-            db.commit()
+            db.flush()
             logger.info(f"✅ Saved {len(records_to_insert)} financial data records for notice {notice.id}")
 
-        return True
+        # Every line of the statement, mapped or not, goes to the narrow item table
+        store_statement_items(db, notice, financial_data)
+
+        # Decide which filing of this statement is current (also when this one was re-extracted or emptied)
+        resolve_statement_versions(db, notice.symbol, [period_key])
+        notice.statement_hash = content_hash
+        db.commit()
+
+        record_changes(db, [notice.symbol])
+        metrics_cache.refresh_symbol(db, notice.symbol)
+        response_cache.invalidate_symbols([notice.symbol])
+
+        return SAVE_UPDATED
 
     except Exception as e:
         logger.error(f"❌ Error saving financial data for notice {notice.id}: {str(e)}")
         db.rollback()
-        return False
+        return None
 
 
 # Financial notice patterns
@@ -743,6 +805,64 @@ def get_financial_summary_stats(db: Session) -> dict:
         }
 
 
+def _stored_statements_statement(symbol_condition, period_type: Optional[str], audit_status: Optional[str], limit: int):
+    """Select unique stored financial statements (by notice_id), newest extraction first"""
+    statement = select(
+        FinancialStatementData.notice_id,
+        FinancialStatementData.company_symbol,
+        FinancialStatementData.company_name,
+        FinancialStatementData.period_type,
+        FinancialStatementData.audit_status,
+        FinancialStatementData.period_date,
+        FinancialStatementData.raw_title,
+        func.max(FinancialStatementData.extraction_date).label('extraction_date'),
+        func.max(FinancialStatementData.updated_at).label('updated_at'),
+        func.count(FinancialStatementData.id).label('periods_count')
+    ).group_by(
+        FinancialStatementData.notice_id,
+        FinancialStatementData.company_symbol,
+        FinancialStatementData.company_name,
+        FinancialStatementData.period_type,
+        FinancialStatementData.audit_status,
+        FinancialStatementData.period_date,
+        FinancialStatementData.raw_title
+    )
+
+    # Build filter conditions
+    conditions = []
+
+    if symbol_condition is not None:
+        conditions.append(symbol_condition)
+
+    if period_type:
+        conditions.append(FinancialStatementData.period_type == period_type)
+
+    if audit_status:
+        conditions.append(FinancialStatementData.audit_status == audit_status)
+
+    # Apply conditions
+    if conditions:
+        statement = statement.where(and_(*conditions))
+
+    # Order and limit
+    return statement.order_by(func.max(FinancialStatementData.extraction_date).desc()).limit(limit)
+
+
+def _stored_statement_to_dict(data) -> dict:
+    return {
+        "notice_id": data.notice_id,
+        "company_symbol": data.company_symbol,
+        "company_name": data.company_name,
+        "period_type": data.period_type,
+        "audit_status": data.audit_status,
+        "period_date": data.period_date,
+        "periods_count": data.periods_count,
+        "extraction_date": data.extraction_date.isoformat() if data.extraction_date else None,
+        "updated_date": data.updated_at.isoformat() if data.updated_at else None,
+        "title": data.raw_title
+    }
+
+
 def search_stored_financial_statements(
         symbol: Optional[str] = None,
         period_type: Optional[str] = None,
@@ -753,68 +873,46 @@ def search_stored_financial_statements(
     """Search stored financial statements in wide table"""
 
     try:
-        # Get unique financial statements (by notice_id)
-        query = db.query(
-            FinancialStatementData.notice_id,
-            FinancialStatementData.company_symbol,
-            FinancialStatementData.company_name,
-            FinancialStatementData.period_type,
-            FinancialStatementData.audit_status,
-            FinancialStatementData.period_date,
-            FinancialStatementData.raw_title,
-            func.max(FinancialStatementData.extraction_date).label('extraction_date'),
-            func.max(FinancialStatementData.updated_at).label('updated_at'),
-            func.count(FinancialStatementData.id).label('periods_count')
-        ).group_by(
-            FinancialStatementData.notice_id,
-            FinancialStatementData.company_symbol,
-            FinancialStatementData.company_name,
-            FinancialStatementData.period_type,
-            FinancialStatementData.audit_status,
-            FinancialStatementData.period_date,
-            FinancialStatementData.raw_title
-        )
+        symbol_condition = None
+        if symbol:
+            symbol_condition = company_condition(
+                db,
+                symbol,
+                FinancialStatementData.company_id,
+                FinancialStatementData.company_symbol,
+                FinancialStatementData.company_name
+            )
 
-        # Build filter conditions
-        conditions = []
+        statement = _stored_statements_statement(symbol_condition, period_type, audit_status, limit)
+        return [_stored_statement_to_dict(data) for data in db.execute(statement).all()]
 
+    except Exception as e:
+        logger.error(f"Error searching stored financial statements: {str(e)}")
+        return []
+
+
+async def search_stored_financial_statements_async(
+        symbol: Optional[str] = None,
+        period_type: Optional[str] = None,
+        audit_status: Optional[str] = None,
+        limit: int = 50,
+        db: AsyncSession = None
+) -> List[dict]:
+    """search_stored_financial_statements for async sessions"""
+
+    try:
+        symbol_condition = None
         if symbol:
-            symbol_condition = or_(
-                FinancialStatementData.company_symbol.ilike(f'%{symbol}%'),
-                FinancialStatementData.company_name.ilike(f'%{symbol}%')
+            symbol_condition = await company_condition_async(
+                db,
+                symbol,
+                FinancialStatementData.company_id,
+                FinancialStatementData.company_symbol,
+                FinancialStatementData.company_name
             )
-            conditions.append(symbol_condition)
-
-        if period_type:
-            conditions.append(FinancialStatementData.period_type == period_type)
-
-        if audit_status:
-            conditions.append(FinancialStatementData.audit_status == audit_status)
-
-        # Apply conditions
-        if conditions:
-            query = query.filter(and_(*conditions))
-
-        # Order and limit
-        query = query.order_by(func.max(FinancialStatementData.extraction_date).desc())
-        results = query.limit(limit).all()
-
-        result = []
-        for data in results:
-            result.append({
-                "notice_id": data.notice_id,
-                "company_symbol": data.company_symbol,
-                "company_name": data.company_name,
-                "period_type": data.period_type,
-                "audit_status": data.audit_status,
-                "period_date": data.period_date,
-                "periods_count": data.periods_count,
-                "extraction_date": data.extraction_date.isoformat() if data.extraction_date else None,
-                "updated_date": data.updated_at.isoformat() if data.updated_at else None,
-                "title": data.raw_title
-            })
-
-        return result
+
+        statement = _stored_statements_statement(symbol_condition, period_type, audit_status, limit)
+        return [_stored_statement_to_dict(data) for data in (await db.execute(statement)).all()]
 
     except Exception as e:
         logger.error(f"Error searching stored financial statements: {str(e)}")
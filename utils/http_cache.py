@@ -0,0 +1,52 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+# Clients may keep the body but must revalidate before reusing it
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Weak validator over whatever identifies the body: data versions plus the query parameters"""
+    return 'W/"' + hashlib.sha1(repr(parts).encode()).hexdigest()[:24] + '"'
+
+
+def _utc(moment: datetime) -> datetime:
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment.astimezone(timezone.utc)
+
+
+def _opaque(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2); weak comparison"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or _opaque(etag) in {_opaque(tag) for tag in tags}
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if last_modified is None or not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return _utc(last_modified).replace(microsecond=0) <= _utc(since)
+
+
+def conditional_response(request: Request, response: Response, etag: str,
+                         last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """A 304 when the client's copy is current; otherwise put the validators on the outgoing response and return None"""
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_utc(last_modified), usegmt=True)
+
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
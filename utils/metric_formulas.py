@@ -0,0 +1,223 @@
+import ast
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import Numeric
+
+from models import FinancialStatementData
+
+NUMERIC_COLUMNS = [
+    column.name for column in FinancialStatementData.__table__.columns if isinstance(column.type, Numeric)
+]
+_NUMERIC_COLUMN_SET = frozenset(NUMERIC_COLUMNS)
+
+FORMULA_NAME_PATTERN = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+# Growth / time-series metric names: <column>_yoy, _qoq, _ttm, _cagrN (see services.timeseries)
+TRANSFORM_PATTERN = re.compile(r"^(?P<column>[a-z0-9_]+?)_(?P<transform>yoy|qoq|ttm|cagr(?P<years>\d{1,2}))$")
+
+# Single source for /available-metrics and evaluation
+CALCULATED_METRICS = {
+    "revenue_plus_cogs": {
+        "name": "درآمد + بهای تمام شده",
+        "formula": "operating_revenue + cost_of_goods_sold",
+        "description": "مجموع درآمد عملیاتی و بهای تمام شده کالای فروخته شده",
+        "format": "number"
+    },
+    "total_expenses": {
+        "name": "کل هزینه‌های عملیاتی",
+        "formula": "cost_of_goods_sold + selling_admin_expenses",
+        "description": "مجموع بهای تمام شده و هزینه‌های فروش و اداری",
+        "format": "number"
+    },
+    "total_other_income": {
+        "name": "کل سایر درآمدها",
+        "formula": "other_income + non_operating_income",
+        "description": "مجموع سایر درآمدها و درآمدهای غیرعملیاتی",
+        "format": "number"
+    },
+    "net_operating_result": {
+        "name": "نتیجه عملیاتی خالص",
+        "formula": "operating_profit - financial_expenses",
+        "description": "سود عملیاتی منهای هزینه‌های مالی",
+        "format": "number"
+    },
+    "revenue_to_capital_ratio": {
+        "name": "نسبت درآمد به سرمایه",
+        "formula": "operating_revenue / capital",
+        "description": "درآمد عملیاتی تقسیم بر سرمایه",
+        "format": "ratio"
+    },
+    "gross_profit_margin": {
+        "name": "حاشیه سود ناخالص (درصد)",
+        "formula": "(gross_profit / operating_revenue) * 100",
+        "description": "درصد حاشیه سود ناخالص نسبت به درآمد",
+        "format": "percent"
+    },
+    "operating_profit_margin": {
+        "name": "حاشیه سود عملیاتی (درصد)",
+        "formula": "(operating_profit / operating_revenue) * 100",
+        "description": "درصد سود عملیاتی نسبت به درآمد",
+        "format": "percent"
+    },
+    "net_profit_margin": {
+        "name": "حاشیه سود خالص (درصد)",
+        "formula": "(net_profit / operating_revenue) * 100",
+        "description": "درصد حاشیه سود خالص نسبت به درآمد",
+        "format": "percent"
+    }
+}
+
+VALUE_FORMATS = {
+    "number": "{:,.0f}",
+    "ratio": "{:,.2f}",
+    "percent": "{:.2f}%"
+}
+
+
+def _divide(numerator, denominator):
+    """Division that yields NaN (reported as None) instead of inf for a zero denominator"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = np.true_divide(numerator, denominator)
+    return np.where(np.asarray(denominator) == 0, np.nan, result)
+
+
+class _FormulaCompiler(ast.NodeTransformer):
+    """Accepts numbers, numeric columns, + - * /, unary signs and parentheses; rewrites / to _divide"""
+
+    def __init__(self):
+        self.columns = set()
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Div)):
+            raise ValueError("Only + - * / are allowed")
+        left, right = self.visit(node.left), self.visit(node.right)
+        if isinstance(node.op, ast.Div):
+            return ast.Call(func=ast.Name(id="_divide", ctx=ast.Load()), args=[left, right], keywords=[])
+        node.left, node.right = left, right
+        return node
+
+    def visit_UnaryOp(self, node):
+        if not isinstance(node.op, (ast.UAdd, ast.USub)):
+            raise ValueError("Only unary + and - are allowed")
+        node.operand = self.visit(node.operand)
+        return node
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ValueError(f"Unsupported constant: {node.value!r}")
+        return node
+
+    def visit_Name(self, node):
+        if node.id not in _NUMERIC_COLUMN_SET:
+            raise ValueError(f"Unknown column: {node.id}")
+        self.columns.add(node.id)
+        return node
+
+    def generic_visit(self, node):
+        raise ValueError(f"Unsupported syntax: {type(node).__name__}")
+
+
+class MetricFormula:
+    """A formula over numeric columns, compiled once and evaluated on whole NumPy columns"""
+
+    def __init__(self, source: str, key: Optional[str] = None, name: Optional[str] = None,
+                 description: Optional[str] = None, value_format: str = "number"):
+        try:
+            tree = ast.parse(source.strip(), mode="eval")
+        except SyntaxError:
+            raise ValueError(f"Invalid formula: {source}")
+
+        compiler = _FormulaCompiler()
+        tree = ast.fix_missing_locations(compiler.visit(tree))
+        if not compiler.columns:
+            raise ValueError("A formula must reference at least one column")
+
+        self.source = source.strip()
+        self.key = key
+        self.name = name
+        self.description = description
+        self.value_format = value_format
+        self.columns = frozenset(compiler.columns)
+        self._code = compile(tree, "<formula>", "eval")
+
+    def evaluate(self, column: Callable[[str], np.ndarray]) -> np.ndarray:
+        """Evaluate on arrays returned by column(name); missing inputs count as zero, like the old formulas"""
+        env = {name: np.nan_to_num(np.asarray(column(name), dtype=np.float64), nan=0.0) for name in self.columns}
+        return np.asarray(eval(self._code, {"__builtins__": {}, "_divide": _divide}, env), dtype=np.float64)
+
+    def evaluate_record(self, record) -> Optional[float]:
+        """Scalar evaluation for a single ORM row or result row"""
+        value = float(self.evaluate(lambda name: _record_value(record, name)))
+        return None if np.isnan(value) else value
+
+    def format(self, value: Optional[float]) -> str:
+        if value is None:
+            return "N/A"
+        return VALUE_FORMATS.get(self.value_format, VALUE_FORMATS["number"]).format(value)
+
+    def to_dict(self) -> dict:
+        return {
+            "key": self.key,
+            "name": self.name,
+            "formula": self.source,
+            "description": self.description,
+            "format": self.value_format
+        }
+
+
+def _record_value(record, name: str) -> float:
+    raw_value = getattr(record, name, None)
+    if raw_value is None:
+        return np.nan
+    try:
+        if isinstance(raw_value, str):
+            return float(raw_value.replace(',', '').replace('٬', ''))
+        return float(raw_value)
+    except (ValueError, TypeError):
+        return np.nan
+
+
+@lru_cache(maxsize=256)
+def compile_formula(source: str) -> MetricFormula:
+    """Compile an ad-hoc formula, reusing the compiled form for repeated requests"""
+    return MetricFormula(source, value_format="ratio")
+
+
+METRIC_REGISTRY: Dict[str, MetricFormula] = {
+    key: MetricFormula(spec["formula"], key, spec["name"], spec["description"], spec["format"])
+    for key, spec in CALCULATED_METRICS.items()
+}
+
+
+def is_transform_name(name: str) -> bool:
+    """True for names the growth metrics own, which would shadow a formula of the same name"""
+    match = TRANSFORM_PATTERN.match(name)
+    return bool(match and match.group("column") in _NUMERIC_COLUMN_SET and int(match.group("years") or 1) >= 1)
+
+
+def parse_formula_definitions(definitions: List[str]) -> Dict[str, MetricFormula]:
+    """Per-request formulas given as 'name=expression'; raises ValueError on bad input"""
+    formulas = {}
+    for definition in definitions:
+        name, separator, source = definition.partition("=")
+        name = name.strip()
+        if not separator or not FORMULA_NAME_PATTERN.match(name):
+            raise ValueError(f"Formulas must look like name=expression: {definition}")
+        if name in _NUMERIC_COLUMN_SET or name in METRIC_REGISTRY or is_transform_name(name):
+            raise ValueError(f"Formula name {name} is already a metric")
+        formulas[name] = compile_formula(source.strip())
+    return formulas
+
+
+def lookup_formula(metric: str, formulas: Optional[Dict[str, MetricFormula]] = None) -> Optional[MetricFormula]:
+    """Per-request formula or registered calculated metric for a key, else None"""
+    if formulas and metric in formulas:
+        return formulas[metric]
+    return METRIC_REGISTRY.get(metric)
@@ -0,0 +1,25 @@
+from typing import Iterable, Optional
+
+from utils.metric_formulas import NUMERIC_COLUMNS
+
+PERSIAN_DIGITS = str.maketrans("0123456789", "۰۱۲۳۴۵۶۷۸۹")
+FORMATTED_SUFFIX = "_fmt"
+
+
+def format_amount(value) -> str:
+    """Codal-style display text: Persian digits, thousands separators, negatives in parentheses"""
+    if value is None:
+        return "۰"
+    number = float(value)
+    magnitude = abs(number)
+    text = f"{magnitude:,.0f}" if magnitude == int(magnitude) else f"{magnitude:,.2f}"
+    text = text.translate(PERSIAN_DIGITS)
+    return f"({text})" if number < 0 else text
+
+
+def add_display_values(data: dict, columns: Optional[Iterable[str]] = None) -> dict:
+    """Add a <column>_fmt twin for each numeric value in a serialised row (format=display)"""
+    for column in (columns if columns is not None else NUMERIC_COLUMNS):
+        if column in data:
+            data[f"{column}{FORMATTED_SUFFIX}"] = format_amount(data[column]) if data[column] is not None else None
+    return data
@@ -0,0 +1,52 @@
+import base64
+import json
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query, Session
+
+
+def encode_cursor(*values) -> str:
+    """Opaque, URL-safe cursor holding the sort key of the last row on a page"""
+    payload = json.dumps(list(values), separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[list]:
+    """Decode a cursor produced by encode_cursor, raising 400 if it is malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _explain(statement, dialect) -> tuple:
+    compiled = statement.compile(dialect=dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup) if compiled.positional else compiled.params
+    return f"EXPLAIN (FORMAT JSON) {compiled}", params
+
+
+def _plan_rows(plan) -> int:
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def estimated_count(db: Session, query: Query) -> int:
+    """Row estimate from the Postgres planner for a query, without executing it"""
+    sql, params = _explain(query.statement, db.get_bind().dialect)
+    return _plan_rows(db.connection().exec_driver_sql(sql, params).scalar())
+
+
+async def estimated_count_async(db: AsyncSession, statement) -> int:
+    """estimated_count for a select() on an async session"""
+    connection = await db.connection()
+    sql, params = _explain(statement, connection.dialect)
+    return _plan_rows((await connection.exec_driver_sql(sql, params)).scalar())
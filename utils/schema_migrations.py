@@ -0,0 +1,103 @@
+import logging
+from sqlalchemy import text
+
+from utils.metric_formulas import NUMERIC_COLUMNS
+from utils.text_utils import persian_fold_sql_args
+
+logger = logging.getLogger(__name__)
+
+_FOLD_FROM, _FOLD_TO = persian_fold_sql_args()
+
+# Display strings formerly stored next to every amount; now formatted at read time (utils.number_format)
+_FMT_COLUMNS = [f"{column}_fmt" for column in NUMERIC_COLUMNS]
+ARCHIVE_FMT_COLUMNS = f"""
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'financial_statement_data' AND column_name = '{_FMT_COLUMNS[0]}'
+    ) THEN
+        CREATE TABLE IF NOT EXISTS financial_statement_data_fmt_archive AS
+            SELECT id, notice_id, period_order, {", ".join(_FMT_COLUMNS)} FROM financial_statement_data;
+        ALTER TABLE financial_statement_data {", ".join(f"DROP COLUMN IF EXISTS {c}" for c in _FMT_COLUMNS)};
+    END IF;
+END $$
+"""
+
+# Full-text vector over the title, folded like utils.text_utils.normalize_persian
+TITLE_TSV_EXPRESSION = (
+    f"to_tsvector('simple'::regconfig, translate(coalesce(title, ''), '{_FOLD_FROM}', '{_FOLD_TO}'))"
+)
+
+# Idempotent DDL for columns/indexes added after tables already exist in production.
+# Base.metadata.create_all() only creates missing tables, so new columns on existing
+# tables are added here. Statements must be safe to run on every startup.
+SCHEMA_MIGRATIONS = [
+    # Company registry foreign keys
+    "ALTER TABLE stock_notices ADD COLUMN IF NOT EXISTS company_id INTEGER REFERENCES companies(id)",
+    "CREATE INDEX IF NOT EXISTS ix_stock_notices_company_id ON stock_notices (company_id)",
+    "ALTER TABLE financial_statement_data ADD COLUMN IF NOT EXISTS company_id INTEGER REFERENCES companies(id)",
+    "CREATE INDEX IF NOT EXISTS ix_financial_statement_data_company_id ON financial_statement_data (company_id)",
+
+    # Precomputed notice classification
+    "ALTER TABLE stock_notices ADD COLUMN IF NOT EXISTS notice_category VARCHAR(50)",
+    "ALTER TABLE stock_notices ADD COLUMN IF NOT EXISTS is_financial BOOLEAN DEFAULT false",
+    "CREATE INDEX IF NOT EXISTS ix_stock_notices_notice_category ON stock_notices (notice_category)",
+    "CREATE INDEX IF NOT EXISTS ix_stock_notices_is_financial ON stock_notices (is_financial)",
+    "CREATE INDEX IF NOT EXISTS idx_stock_notices_financial_company "
+    "ON stock_notices (company_id, id) WHERE is_financial",
+
+    # Trigram indexes so ilike '%...%' searches stop scanning the whole table
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS idx_stock_notices_title_trgm ON stock_notices USING gin (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_stock_notices_symbol_trgm ON stock_notices USING gin (symbol gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_stock_notices_company_name_trgm "
+    "ON stock_notices USING gin (company_name gin_trgm_ops)",
+
+    # Full-text search over notice titles
+    f"ALTER TABLE stock_notices ADD COLUMN IF NOT EXISTS title_tsv tsvector "
+    f"GENERATED ALWAYS AS ({TITLE_TSV_EXPRESSION}) STORED",
+    "CREATE INDEX IF NOT EXISTS idx_stock_notices_title_tsv ON stock_notices USING gin (title_tsv)",
+
+    # Gregorian publish timestamp for keyset pagination
+    "ALTER TABLE stock_notices ADD COLUMN IF NOT EXISTS published_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS ix_stock_notices_published_at ON stock_notices (published_at)",
+    "CREATE INDEX IF NOT EXISTS idx_stock_notices_financial_published "
+    "ON stock_notices (company_id, published_at DESC, id DESC) WHERE is_financial",
+
+    # Write-time amendment resolution
+    "ALTER TABLE financial_statement_data ADD COLUMN IF NOT EXISTS period_key VARCHAR(150)",
+    "ALTER TABLE financial_statement_data ADD COLUMN IF NOT EXISTS is_current BOOLEAN DEFAULT true",
+    "ALTER TABLE financial_statement_data ADD COLUMN IF NOT EXISTS superseded_by INTEGER",
+    "CREATE INDEX IF NOT EXISTS idx_company_period_key ON financial_statement_data (company_symbol, period_key)",
+    "CREATE INDEX IF NOT EXISTS idx_financial_statement_current "
+    "ON financial_statement_data (company_symbol, period_type, period_date DESC) "
+    "INCLUDE (notice_id, period_order) WHERE is_current",
+
+    # Partition keys: notices by publish year, statements by period year (services.partitions)
+    "ALTER TABLE stock_notices ADD COLUMN IF NOT EXISTS publish_year INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE financial_statement_data ADD COLUMN IF NOT EXISTS period_year INTEGER NOT NULL DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS idx_stock_notices_company_year "
+    "ON stock_notices (company_id, publish_year, published_at)",
+
+    # Content hash of the last extraction, to skip rewriting unchanged statements
+    "ALTER TABLE stock_notices ADD COLUMN IF NOT EXISTS statement_hash VARCHAR(64)",
+
+    # Per-symbol data versions behind ETag / Last-Modified
+    "ALTER TABLE symbol_stats ADD COLUMN IF NOT EXISTS data_version INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE symbol_stats ADD COLUMN IF NOT EXISTS data_changed_at TIMESTAMP WITH TIME ZONE",
+
+    # Drop the *_fmt twins of the amount columns, keeping a copy in an archive table
+    ARCHIVE_FMT_COLUMNS,
+]
+
+
+def apply_schema_migrations(engine):
+    """Run every schema migration statement in order"""
+    with engine.begin() as connection:
+        for statement in SCHEMA_MIGRATIONS:
+            try:
+                with connection.begin_nested():
+                    connection.execute(text(statement))
+            except Exception as e:
+                logger.error(f"Schema migration failed: {statement[:80]}... - {e}")
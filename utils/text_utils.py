@@ -1,11 +1,42 @@
 from models import FinancialStatementData
+from utils.metric_formulas import MetricFormula, METRIC_REGISTRY, NUMERIC_COLUMNS, lookup_formula
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import Optional, Dict, Any
 
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
+# Persian (۰-۹) and Arabic-Indic (٠-٩) digits -> ASCII
+DIGIT_TRANSLATION = str.maketrans("۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩", "01234567890123456789")
+
+# Arabic letter forms Codal titles mix in with Persian ones
+PERSIAN_LETTER_TRANSLATION = str.maketrans({
+    "ي": "ی", "ى": "ی", "ك": "ک", "ة": "ه", "ۀ": "ه", "أ": "ا", "إ": "ا", "ٱ": "ا",
+    "\u200c": " ", "\u200f": " ", "\u200e": " ", "\u0640": ""
+})
+
+FINANCIAL_KEYWORDS = [
+    "اطلاعات و صورت‌های مالی",
+    "اطلاعات و صورتهای مالی",
+    "صورت های سال مالی",
+    "صورتهای سال مالی",
+    "اطلاعات مالی",
+    "گزارش مالی",
+    "صورت‌های مالی سال مالی",
+    "صورت‌های مالی تلفیقی سال مالی"
+]
+
+AMENDMENT_MARKERS = ("اصلاحیه", "تجدید ارائه")
+STATEMENT_DATE_PATTERN = re.compile(r"\d{4}[/-]\d{1,2}[/-]\d{1,2}")
+PERIOD_YEAR_PATTERN = re.compile(r"^\s*(?:(\d{4})[/.-]|\d{1,2}/\d{1,2}/(\d{4}))")
+
+# Columns accepted as direct metrics: amounts only, never keys or bookkeeping flags
+DIRECT_METRICS = frozenset(NUMERIC_COLUMNS)
+
+PUBLISH_TIME_PATTERN = re.compile(r'(\d{4})/(\d{1,2})/(\d{1,2})(?:\s+(\d{1,2}):(\d{1,2})(?::(\d{1,2}))?)?')
+
 
 def extract_period_type(title: str) -> str:
     """Extract period type from notice title"""
@@ -61,80 +92,85 @@ def extract_date_from_title(title: str) -> str:
 
 def is_financial_statement(title: str) -> bool:
     """Check if notice is a financial statement"""
-    financial_keywords = [
-        "اطلاعات و صورت‌های مالی",
-        "اطلاعات و صورتهای مالی",
-        "صورت های سال مالی",
-        "صورتهای سال مالی",
-        "اطلاعات مالی",
-        "گزارش مالی",
-        "صورت‌های مالی سال مالی",
-        "صورت‌های مالی تلفیقی سال مالی"
-    ]
+    return any(keyword in title for keyword in FINANCIAL_KEYWORDS)
 
-    return any(keyword in title for keyword in financial_keywords)
 
+def normalize_persian(text: str) -> str:
+    """Fold Arabic letter forms and digits, turn ZWNJ into spaces and collapse whitespace"""
+    if not text:
+        return ""
+    text = text.translate(PERSIAN_LETTER_TRANSLATION).translate(DIGIT_TRANSLATION)
+    return " ".join(text.split())
+
+
+def persian_fold_sql_args() -> tuple:
+    """(from, to) arguments for Postgres translate() that fold text the same way as normalize_persian"""
+    folds = {
+        k: chr(v) if isinstance(v, int) else v
+        for k, v in {**PERSIAN_LETTER_TRANSLATION, **DIGIT_TRANSLATION}.items()
+    }
+    kept = [(chr(k), v) for k, v in folds.items() if v]
+    dropped = [chr(k) for k, v in folds.items() if not v]
+    return "".join(k for k, _ in kept) + "".join(dropped), "".join(v for _, v in kept)
 
-def filter_amendments(records: List[FinancialStatementData]) -> List[FinancialStatementData]:
-    """
-    Filter out original records if amendments exist for the same period_type and extracted date
 
-    Logic:
-    - If a record contains 'اصلاحیه' in raw_title, it's an amendment
-    - Remove original records that have amendments for the same period_type + extracted_date
-    - Keep only the amendment (most recent correction)
-    """
-    if not records:
-        return records
+# Checked in order, first match wins
+NOTICE_CATEGORY_PATTERNS = [
+    ("financial_statement", FINANCIAL_KEYWORDS + ["اطلاعات و صورت های مالی"]),
+    ("financial_component", ["صورت سود و زیان", "ترازنامه", "صورت جریان وجوه نقد"]),
+    ("monthly_activity", ["گزارش فعالیت ماهانه"]),
+    ("capital_increase", ["افزایش سرمایه"]),
+    ("general_meeting", ["مجمع عمومی"]),
+]
+_NORMALIZED_CATEGORY_PATTERNS = [
+    (category, [normalize_persian(p) for p in patterns])
+    for category, patterns in NOTICE_CATEGORY_PATTERNS
+]
 
-    # Group records by period_type and extracted date
-    period_groups = {}
-    amendments = {}
+# Categories the financial statement extractor can process
+FINANCIAL_CATEGORIES = ["financial_statement", "financial_component"]
 
-    for record in records:
-        # Extract date from raw_title using your existing function
-        extracted_date = extract_date_from_title(record.raw_title or "")
 
-        # Create a key for grouping: period_type + extracted_date
-        period_key = f"{record.period_type}_{extracted_date}"
+def classify_notice(title: str) -> tuple:
+    """Classify a notice title, returning (notice_category, is_financial)"""
+    normalized = normalize_persian(title)
+    for category, patterns in _NORMALIZED_CATEGORY_PATTERNS:
+        if any(pattern in normalized for pattern in patterns):
+            return category, category == "financial_statement"
+    return "other", False
 
-        if period_key not in period_groups:
-            period_groups[period_key] = []
-        period_groups[period_key].append(record)
 
-        # Check if this record is an amendment (check raw_title)
-        if record.raw_title and 'اصلاحیه' in record.raw_title:
-            amendments[period_key] = record
-            logger.info(f"Found amendment for {period_key}: {record.raw_title}")
+def is_amendment_title(title: Optional[str]) -> bool:
+    """Amendments (اصلاحیه) and restatements (تجدید ارائه) replace an earlier version of the statement"""
+    return any(marker in (title or "") for marker in AMENDMENT_MARKERS)
 
-    # Filter logic
-    filtered_records = []
 
-    for period_key, group_records in period_groups.items():
-        if period_key in amendments:
-            # If there's an amendment for this period, only keep the amendment
-            filtered_records.append(amendments[period_key])
-            logger.info(f"Keeping amendment for {period_key}, removing {len(group_records) - 1} original(s)")
-        else:
-            # No amendment exists, keep all original records for this period
-            filtered_records.extend(group_records)
+def statement_period_key(period_type: Optional[str], raw_title: Optional[str], period_date: Optional[str]) -> str:
+    """Identifies a statement across its versions: period type plus the first date in the title (digits folded)"""
+    match = STATEMENT_DATE_PATTERN.search((raw_title or "").translate(DIGIT_TRANSLATION))
+    return f"{period_type or ''}|{match.group(0) if match else (period_date or '')}"
 
-    # Sort by period_date descending to maintain original order
-    filtered_records.sort(key=lambda x: x.period_date if x.period_date else datetime.min.date(), reverse=True)
 
-    return filtered_records
+def period_year(period_date: Optional[str]) -> int:
+    """Jalali year of a statement date (YYYY/MM/DD or DD/MM/YYYY, any digits); 0 when unknown"""
+    match = PERIOD_YEAR_PATTERN.search((period_date or "").translate(DIGIT_TRANSLATION))
+    if not match:
+        return 0
+    return int(match.group(1) or match.group(2))
 
 
-def extract_metric_value(record: FinancialStatementData, metric: str):
+def extract_metric_value(record: FinancialStatementData, metric: str,
+                         formulas: Optional[Dict[str, MetricFormula]] = None):
     """Extract metric value from financial record, supporting both direct and calculated metrics"""
 
-    # Check if it's a calculated metric FIRST
-    calculated_metrics = get_calculated_metrics()
-    if metric in calculated_metrics:
-        return calculate_metric_value(record, metric)
+    # Check if it's a calculated metric (or a per-request formula) FIRST
+    formula = lookup_formula(metric, formulas)
+    if formula is not None:
+        value = formula.evaluate_record(record)
+        return value, formula.format(value)
 
     # Handle direct metrics (your existing logic)
-    if hasattr(record, metric):
+    if metric in DIRECT_METRICS and hasattr(record, metric):
         raw_value = getattr(record, metric)
 
         if raw_value is None:
@@ -161,88 +197,84 @@ def extract_metric_value(record: FinancialStatementData, metric: str):
 
 
 
-def get_calculated_metrics():
-    """Get dictionary of calculated metrics definitions"""
-    return {
-        "revenue_plus_cogs": {
-            "formula": lambda r: get_field_value(r, "operating_revenue") + get_field_value(r, "cost_of_goods_sold"),
-            "name": "درآمد عملیاتی + بهای تمام شده"
-        },
-        "total_expenses": {
-            "formula": lambda r: get_field_value(r, "cost_of_goods_sold") + get_field_value(r,
-                                                                                            "selling_admin_expenses"),
-            "name": "کل هزینه‌ها"
-        },
-        "total_other_income": {
-            "formula": lambda r: get_field_value(r, "other_income") + get_field_value(r, "non_operating_income"),
-            "name": "کل سایر درآمدها"
-        },
-        "net_operating_result": {
-            "formula": lambda r: get_field_value(r, "operating_profit") - get_field_value(r, "financial_expenses"),
-            "name": "نتیجه عملیاتی خالص"
-        },
-        "revenue_to_capital_ratio": {
-            "formula": lambda r: get_field_value(r, "operating_revenue") / get_field_value(r,
-                                                                                           "capital") if get_field_value(
-                r, "capital") != 0 else 0,
-            "name": "نسبت درآمد به سرمایه"
-        }
-    }
+def get_calculated_metrics() -> Dict[str, MetricFormula]:
+    """Registered calculated metrics, compiled once at import"""
+    return METRIC_REGISTRY
 
 
-def calculate_metric_value(record: FinancialStatementData, metric_key: str):
-    """Calculate value for calculated metrics"""
-    calculated_metrics = get_calculated_metrics()
+def metric_dependencies(metric: str, formulas: Optional[Dict[str, MetricFormula]] = None) -> set:
+    """Columns of FinancialStatementData needed to compute a direct or calculated metric"""
+    formula = lookup_formula(metric, formulas)
+    if formula is not None:
+        return set(formula.columns)
+    return {metric} if metric in DIRECT_METRICS else set()
 
-    if metric_key not in calculated_metrics:
-        return 0, "0"
 
-    try:
-        # Execute the formula
-        numeric_value = calculated_metrics[metric_key]["formula"](record)
-
-        # Format with commas for display
-        formatted_value = f"{numeric_value:,.2f}" if metric_key == "revenue_to_capital_ratio" else f"{numeric_value:,.0f}"
-
-        return numeric_value, formatted_value
-
-    except (ValueError, TypeError, ZeroDivisionError) as e:
-        logger.warning(f"Error calculating {metric_key}: {str(e)}")
-        return 0, "0"
-
-
-def get_field_value(record: FinancialStatementData, field_name: str) -> float:
-    """Safely get numeric value from a field"""
-    if not hasattr(record, field_name):
-        return 0.0
-
-    raw_value = getattr(record, field_name)
-
-    if raw_value is None:
-        return 0.0
+def calculate_metric_value(record: FinancialStatementData, metric_key: str):
+    """Calculate value for calculated metrics"""
+    formula = METRIC_REGISTRY.get(metric_key)
+    if formula is None:
+        return None, "N/A"
 
-    try:
-        if isinstance(raw_value, str):
-            cleaned_value = raw_value.replace(',', '')
-            return float(cleaned_value)
-        else:
-            return float(raw_value)
-    except (ValueError, TypeError):
-        return 0.0
+    value = formula.evaluate_record(record)
+    return value, formula.format(value)
 
 
 # Get all available columns from your model
 def get_all_direct_metrics():
-    """Get all available columns from FinancialStatementData model"""
-    from sqlalchemy import inspect
+    """Amount columns of FinancialStatementData; bookkeeping columns (keys, versions, partition years) are not metrics"""
+    return list(NUMERIC_COLUMNS)
 
-    inspector = inspect(FinancialStatementData)
-    columns = [column.name for column in inspector.columns]
 
-    # Filter out system columns
-    excluded_columns = ['id', 'notice_id', 'company_symbol', 'company_name',
-                        'period_date', 'period_name', 'period_type', 'audit_status',
-                        'period_order', 'created_at', 'updated_at']
+def jalali_to_gregorian(jy: int, jm: int, jd: int) -> tuple:
+    """Convert a Jalali (Solar Hijri) date to a Gregorian (year, month, day) tuple"""
+    jy += 1595
+    days = -355668 + (365 * jy) + ((jy // 33) * 8) + (((jy % 33) + 3) // 4) + jd
+    if jm < 7:
+        days += (jm - 1) * 31
+    else:
+        days += ((jm - 7) * 30) + 186
+
+    gy = 400 * (days // 146097)
+    days %= 146097
+    if days > 36524:
+        days -= 1
+        gy += 100 * (days // 36524)
+        days %= 36524
+        if days >= 365:
+            days += 1
+
+    gy += 4 * (days // 1461)
+    days %= 1461
+    if days > 365:
+        gy += (days - 1) // 365
+        days = (days - 1) % 365
+
+    gd = days + 1
+    is_leap = (gy % 4 == 0 and gy % 100 != 0) or gy % 400 == 0
+    month_days = [0, 31, 29 if is_leap else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+    gm = 0
+    while gm < 13 and gd > month_days[gm]:
+        gd -= month_days[gm]
+        gm += 1
+
+    return gy, gm, gd
+
+
+def parse_publish_time(publish_time: str) -> Optional[datetime]:
+    """Parse a Codal publish time such as '۱۴۰۳/۰۸/۲۹ ۱۸:۴۵:۵۴' into a Gregorian datetime"""
+    if not publish_time:
+        return None
+
+    match = PUBLISH_TIME_PATTERN.search(str(publish_time).translate(DIGIT_TRANSLATION))
+    if not match:
+        return None
+
+    jy, jm, jd = int(match.group(1)), int(match.group(2)), int(match.group(3))
+    hour, minute, second = (int(match.group(i) or 0) for i in (4, 5, 6))
 
-    financial_columns = [col for col in columns if col not in excluded_columns]
-    return financial_columns
+    try:
+        gy, gm, gd = jalali_to_gregorian(jy, jm, jd)
+        return datetime(gy, gm, gd, hour, minute, second)
+    except ValueError:
+        return None